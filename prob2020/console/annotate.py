@@ -8,6 +8,7 @@ sys.path.append(os.path.join(file_dir, '../../'))
 
 # package import
 import prob2020.python.utils as utils
+import prob2020.python.genome as genome
 from prob2020.python.gene_sequence import GeneSequence
 import prob2020.cython.cutils as cutils
 import prob2020.python.mutation_context as mc
@@ -15,12 +16,15 @@ import prob2020.python.permutation as pm
 import prob2020.python.indel as indel
 import prob2020.python.annotate as anot
 import prob2020.python.mymath as math
+import prob2020.python.maf_store as maf_store
+import prob2020.python.context_cache as context_cache
 
 # external imports
 import numpy as np
 import pandas as pd
-import pysam
 import csv
+import gzip
+import shutil
 from multiprocessing import Pool
 import argparse
 import logging
@@ -34,41 +38,18 @@ def multiprocess_permutation(bed_dict, mut_df, opts, indel_df=None):
     by chromosome.
     """
     chroms = sorted(bed_dict.keys(), key=lambda x: len(bed_dict[x]), reverse=True)
-    multiprocess_flag = opts['processes']>0
-    if multiprocess_flag:
-        num_processes = opts['processes']
-    else:
-        num_processes = 1
-    file_handle = open(opts['output'], 'w')
-    mywriter = csv.writer(file_handle, delimiter='\t', lineterminator='\n')
-    if opts['maf'] and opts['num_iterations']:
-        header = ['Gene', 'strand', 'Chromosome', 'Start_Position',
-                  'End_Position', 'Reference_Allele', 'Tumor_Allele',
-                  'Context', 'DNA_Change', 'Protein_Change', 'Variant_Classification']
-    elif opts['maf']:
-        header = ['Gene', 'strand', 'Chromosome', 'Start_Position',
-                  'End_Position', 'Reference_Allele', 'Tumor_Allele',
-                  'DNA_Change', 'Protein_Change', 'Variant_Classification',
-                  'Tumor_Sample', 'Tumor_Type']
-    else:
-        header = ['Gene', 'ID', 'gene length', 'non-silent snv', 'silent snv', 'nonsense', 'lost stop',
-                  'splice site', 'lost start', 'missense', 'recurrent missense',
-                  'normalized missense position entropy',]
-        # add column header for scores, is user provided one
-        if opts['score_dir']:
-            header += ['Total Missense MGAEntropy', 'Total Missense VEST Score']
-        # add indel columns
-        header += ['frameshift indel', 'inframe indel', 'normalized mutation entropy']
-    mywriter.writerow(header)
+    header = output_header(opts)
     num_iterations = opts['num_iterations']
 
     # simulate indel counts
+    indel_cts = None
     if opts['summary'] and num_iterations:
         fs_cts, inframe_cts, gene_names = indel.simulate_indel_counts(indel_df,
                                                                       bed_dict,
                                                                       num_iterations,
                                                                       opts['seed'])
         name2ix = {gene_names[z]: z for z in range(len(gene_names))}
+        indel_cts = (fs_cts, inframe_cts, name2ix)
     # just count observed indels
     elif opts['summary']:
         # get gene names
@@ -90,69 +71,377 @@ def multiprocess_permutation(bed_dict, mut_df, opts, indel_df=None):
                 ix = name2ix[mygene]
                 fs_cts[0, ix] = 0 if mygene not in fs_cts_dict else fs_cts_dict[mygene]
                 inframe_cts[0, ix] = indel_cts_dict[mygene] - fs_cts[0, ix]
+        indel_cts = (fs_cts, inframe_cts, name2ix)
+
+    # workers write their own output shards
+    if uses_shards(opts):
+        try:
+            manifest = write_shards(bed_dict, mut_df, opts, header, indel_cts)
+            if opts['maf']:
+                manifest.append(write_indel_shard(indel_df, bed_dict, opts, header,
+                                                  len(manifest)))
+            if opts.get('keep_shards', False):
+                with open(opts['output'], 'w') as handle:
+                    mywriter = csv.writer(handle, delimiter='\t', lineterminator='\n')
+                    mywriter.writerow(['Shard', 'Chromosome', 'Rows'])
+                    mywriter.writerows(manifest)
+            else:
+                merge_shards(manifest, header, opts['output'])
+        finally:
+            # also remove shards written before a worker failed
+            if not opts.get('keep_shards', False):
+                remove_shards(opts)
+        return
+
+    file_handle = open(opts['output'], 'w')
+    mywriter = csv.writer(file_handle, delimiter='\t', lineterminator='\n')
+    mywriter.writerow(header)
+
+    # stream simulated MAF lines straight to the output file
+    if opts['maf'] and num_iterations:
+        write_maf_blocks(bed_dict, mut_df, opts, file_handle.write)
+        file_handle.close()
+        return
 
     # simulate snvs
-    obs_result = []
-    for i in range(0, len(chroms), num_processes):
-        if multiprocess_flag:
-            pool = Pool(processes=num_processes)
-            tmp_num_proc = len(chroms) - i if i + num_processes > len(chroms) else num_processes
-            info_repeat = ((bed_dict[chroms[tmp_ix]], mut_df, opts)
-                            for tmp_ix in range(i, i+tmp_num_proc))
-            process_results = pool.imap(singleprocess_permutation, info_repeat)
-            process_results.next = utils.keyboard_exit_wrapper(process_results.next)
-            try:
-                # iterate through each chromosome result
-                for chrom_result in process_results:
-                    # add columns for indels
-                    if opts['summary']:
-                        tmp_chrom_result = []
-                        for gname, grp in it.groupby(chrom_result, lambda x: x[0]):
-                            for l, row in enumerate(grp):
-                                gene_ix = name2ix[gname]
-                                fs_count = fs_cts[l, gene_ix]
-                                inframe_count = inframe_cts[l, gene_ix]
-                                missense_pos_ct = list(row.pop(-1).values())  # missense codon counts
-                                silent_pos_ct = [1 for l in range(row[4])]
-                                inactivating_ct = sum(row[5:9]) + fs_count
-                                tmp_count_list = missense_pos_ct + silent_pos_ct + [inactivating_ct, inframe_count]
-                                norm_ent = math.normalized_mutation_entropy(tmp_count_list)
-                                tmp_chrom_result.append(row+[fs_count, inframe_count, norm_ent])
-                        chrom_result = tmp_chrom_result
-
-                    # write output to file
-                    mywriter.writerows(chrom_result)
-            except KeyboardInterrupt:
-                pool.close()
-                pool.join()
-                logger.info('Exited by user. ctrl-c')
-                sys.exit(0)
+    for chrom in chroms:
+        # perform simulation
+        info = (bed_dict[chrom], mut_df, opts)
+        chrom_results = singleprocess_permutation(info)
+
+        # add indel columns
+        if opts['summary']:
+            chrom_results = add_indel_columns(chrom_results, *indel_cts)
+
+        # write to file
+        mywriter.writerows(chrom_results)
+    file_handle.close()
+
+
+def output_header(opts):
+    """Column names of the output file."""
+    if opts['maf'] and opts['num_iterations']:
+        header = ['Gene', 'strand', 'Chromosome', 'Start_Position',
+                  'End_Position', 'Reference_Allele', 'Tumor_Allele',
+                  'Context', 'DNA_Change', 'Protein_Change', 'Variant_Classification']
+    elif opts['maf']:
+        header = ['Gene', 'strand', 'Chromosome', 'Start_Position',
+                  'End_Position', 'Reference_Allele', 'Tumor_Allele',
+                  'DNA_Change', 'Protein_Change', 'Variant_Classification',
+                  'Tumor_Sample', 'Tumor_Type']
+    else:
+        header = ['Gene', 'ID', 'gene length', 'non-silent snv', 'silent snv', 'nonsense', 'lost stop',
+                  'splice site', 'lost start', 'missense', 'recurrent missense',
+                  'normalized missense position entropy',]
+        # add column header for scores, is user provided one
+        if opts['score_dir']:
+            header += ['Total Missense MGAEntropy', 'Total Missense VEST Score']
+        # add indel columns
+        header += ['frameshift indel', 'inframe indel', 'normalized mutation entropy']
+    return header
+
+
+def uses_shards(opts):
+    """Whether each chromosome is written to its own output shard."""
+    return opts['processes'] > 0 or opts.get('keep_shards', False)
+
+
+def shard_path(opts, shard_ix, name):
+    """Path of an output shard, in a directory next to the output file.
+    Shards of a columnar store are store directories themselves."""
+    shard_dir = opts['output'] + '.shards'
+    if not os.path.exists(shard_dir):
+        os.makedirs(shard_dir)
+    if opts.get('columnar', False):
+        ext = ''
+    elif opts.get('keep_shards', False):
+        ext = '.txt.gz'
+    else:
+        ext = '.txt'
+    return os.path.join(shard_dir, '{0:04d}_{1}{2}'.format(shard_ix, name, ext))
+
+
+def open_shard(path, opts, header):
+    """Opens an output shard for writing. Kept shards are gzip compressed
+    and start with the header, so each can be read on its own."""
+    if opts.get('keep_shards', False):
+        handle = gzip.open(path, 'wt')
+        handle.write('\t'.join(header) + '\n')
+    else:
+        handle = open(path, 'w')
+    return handle
+
+
+def write_shards(bed_dict, mut_df, opts, header, indel_cts=None):
+    """Writes the results for each chromosome to its own shard.
+
+    Workers write their shard directly, so only the small shard manifests
+    are passed back to the parent process.
+
+    Parameters
+    ----------
+    bed_dict : dict
+        BedLine objects for each chromosome
+    mut_df : pd.DataFrame
+        mutations
+    opts : dict
+        command line options
+    header : list
+        column names of the output
+    indel_cts : tuple or None
+        frameshift counts, inframe counts and gene name to column index, for
+        the summary output
+
+    Returns
+    -------
+    manifest : list of list
+        shard path, chromosome and number of rows of each shard, in
+        output order
+    """
+    chroms = sorted(bed_dict.keys(), key=lambda x: len(bed_dict[x]), reverse=True)
+    infos = ((bed_dict[c], mut_df, opts, header, shard_path(opts, i, c),
+              chrom_indel_counts(bed_dict[c], indel_cts))
+             for i, c in enumerate(chroms))
+    if opts['processes'] > 0:
+        pool = Pool(processes=opts['processes'])
+        process_results = pool.imap(shard_worker, infos)
+        process_results.next = utils.keyboard_exit_wrapper(process_results.next)
+        try:
+            manifest = list(process_results)
+        except KeyboardInterrupt:
             pool.close()
             pool.join()
+            logger.info('Exited by user. ctrl-c')
+            sys.exit(0)
+        pool.close()
+        pool.join()
+    else:
+        manifest = [shard_worker(info) for info in infos]
+    return manifest
+
+
+def chrom_indel_counts(bed_list, indel_cts):
+    """Selects the indel count columns for the genes on a chromosome, so
+    workers are not sent the counts of every gene."""
+    if indel_cts is None:
+        return None
+    fs_cts, inframe_cts, name2ix = indel_cts
+    gene_names = [b.gene_name for b in bed_list if b.gene_name in name2ix]
+    ixs = [name2ix[g] for g in gene_names]
+    return (fs_cts[:, ixs], inframe_cts[:, ixs],
+            {g: i for i, g in enumerate(gene_names)})
+
+
+@utils.log_error_decorator
+def shard_worker(info):
+    """Simulates or annotates the genes on a chromosome and writes the
+    results to a shard.
+
+    Returns
+    -------
+    manifest : list
+        shard path, chromosome and number of rows written
+    """
+    bed_list, mut_df, opts, header, path, indel_cts = info
+    if opts.get('columnar', False):
+        writer = maf_store.MafStoreWriter(path, opts['num_iterations'])
+        for columns, iterations in maf_blocks(bed_list, mut_df, opts):
+            writer.add(columns, iterations)
+        writer.close()
+        return [path, bed_list[0].chrom, writer.num_rows]
+
+    num_rows = 0
+    with open_shard(path, opts, header) as handle:
+        if opts['maf'] and opts['num_iterations']:
+            for maf_text in maf_blocks(bed_list, mut_df, opts):
+                handle.write(maf_text)
+                num_rows += maf_text.count('\n')
         else:
-            # perform simulation
-            info = (bed_dict[chroms[i]], mut_df, opts)
-            chrom_results = singleprocess_permutation(info)
-
-            # add indel columns
-            if opts['summary']:
-                tmp_chrom_result = []
-                for gname, grp in it.groupby(chrom_results, lambda x: x[0]):
-                    for l, row in enumerate(grp):
-                        gene_ix = name2ix[gname]
-                        fs_count = fs_cts[l, gene_ix]
-                        inframe_count = inframe_cts[l, gene_ix]
-                        missense_pos_ct = list(row.pop(-1).values())  # missense codon counts
-                        silent_pos_ct = [1 for l in range(row[4])]
-                        inactivating_ct = sum(row[5:9]) + fs_count
-                        tmp_count_list = missense_pos_ct + silent_pos_ct + [inactivating_ct, inframe_count]
-                        norm_ent = math.normalized_mutation_entropy(tmp_count_list)
-                        tmp_chrom_result.append(row+[fs_count, inframe_count, norm_ent])
-                chrom_results = tmp_chrom_result
-
-            # write to file
+            chrom_results = singleprocess_permutation((bed_list, mut_df, opts))
+            if indel_cts is not None:
+                chrom_results = add_indel_columns(chrom_results, *indel_cts)
+            mywriter = csv.writer(handle, delimiter='\t', lineterminator='\n')
             mywriter.writerows(chrom_results)
-    file_handle.close()
+            num_rows = len(chrom_results)
+    return [path, bed_list[0].chrom, num_rows]
+
+
+def write_indel_shard(indel_df, bed_dict, opts, header, shard_ix):
+    """Writes the simulated indels in MAF format to a shard."""
+    path = shard_path(opts, shard_ix, 'indels')
+    num_rows = 0
+    with open_shard(path, opts, header) as handle:
+        mywriter = csv.writer(handle, delimiter='\t', lineterminator='\n')
+        for maf_lines in indel.simulate_indel_maf(indel_df, bed_dict,
+                                                  opts['num_iterations'],
+                                                  opts['seed']):
+            mywriter.writerows(maf_lines)
+            num_rows += len(maf_lines)
+    return [path, 'indels', num_rows]
+
+
+def merge_shards(manifest, header, output):
+    """Concatenates shards in manifest order into the output file, removing
+    each shard once it is copied."""
+    with open(output, 'w') as handle:
+        handle.write('\t'.join(header) + '\n')
+        for path, chrom, num_rows in manifest:
+            with open(path) as shard:
+                shutil.copyfileobj(shard, handle)
+            os.remove(path)
+
+
+def remove_shards(opts):
+    """Removes the shard directory of the output, with any shards left in
+    it."""
+    shard_dir = opts['output'] + '.shards'
+    if os.path.isdir(shard_dir):
+        shutil.rmtree(shard_dir)
+
+
+def write_maf_store(bed_dict, mut_df, indel_df, opts):
+    """Writes simulated mutations, both SNVs and indels, to a columnar
+    store directory instead of a MAF text file.
+
+    With processes, each chromosome worker writes its own store as a shard,
+    and the shards are added to the output in chromosome order.
+    """
+    num_iterations = opts['num_iterations']
+    writer = maf_store.MafStoreWriter(opts['output'], num_iterations)
+    if opts['processes'] > 0:
+        try:
+            manifest = write_shards(bed_dict, mut_df, opts, None)
+            for path, chrom, num_rows in manifest:
+                writer.add_store(maf_store.MafStore(path))
+                shutil.rmtree(path)
+        finally:
+            remove_shards(opts)
+    else:
+        write_maf_blocks(bed_dict, mut_df, opts, lambda block: writer.add(*block))
+
+    # indels come a gene at a time, so encode them in blocks of lines
+    block_lines, block_iterations = [], []
+    for i, maf_lines in indel.simulate_indel_maf(indel_df, bed_dict,
+                                                 num_iterations,
+                                                 opts['seed'],
+                                                 with_iteration=True):
+        block_lines.extend(maf_lines)
+        block_iterations.extend([i] * len(maf_lines))
+        if len(block_lines) >= pm.MAF_BLOCK_LINES:
+            writer.add_lines(block_lines, block_iterations)
+            block_lines, block_iterations = [], []
+    writer.add_lines(block_lines, block_iterations)
+    writer.close()
+
+
+def write_maf_blocks(bed_dict, mut_df, opts, write):
+    """Writes simulated mutations for every chromosome in a single process
+    while they are generated.
+
+    Parameters
+    ----------
+    bed_dict : dict
+        BedLine objects for each chromosome
+    mut_df : pd.DataFrame
+        mutations
+    opts : dict
+        command line options
+    write : function
+        called with each block yielded by maf_blocks
+    """
+    chroms = sorted(bed_dict.keys(), key=lambda x: len(bed_dict[x]), reverse=True)
+    for chrom in chroms:
+        for maf_block in maf_blocks(bed_dict[chrom], mut_df, opts):
+            write(maf_block)
+
+
+def maf_blocks(bed_list, mut_df, opts):
+    """Simulates mutations for the genes on a chromosome, yielding blocks
+    of tab delimited MAF lines, or (columns, iterations) blocks if the
+    columnar option is set."""
+    current_chrom = bed_list[0].chrom
+    logger.info('Working on chromosome: {0} . . .'.format(current_chrom))
+    gene_fa = genome.open_fasta(opts['input'])
+    gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    contexts = context_cache.open_chromosome(opts, current_chrom)
+    if opts.get('columnar', False):
+        block_func = pm.maf_permutation_column_blocks
+    else:
+        block_func = pm.maf_permutation_blocks
+    for bed in bed_list:
+        # compute context counts and somatic bases for each context
+        gene_tuple = mc.compute_mutation_context(bed, gs, mut_df, opts, contexts)
+        context_cts, context_to_mutations, mutations_df, gs, sc = gene_tuple
+        if context_to_mutations:
+            for maf_block in block_func(context_cts,
+                                        context_to_mutations,
+                                        sc, gs,
+                                        opts['num_iterations']):
+                yield maf_block
+    if contexts is not None:
+        contexts.save()
+    gene_fa.close()
+    genome.close_genomes()
+    logger.info('Finished working on chromosome: {0}.'.format(current_chrom))
+
+
+def add_indel_columns(result, fs_cts, inframe_cts, name2ix):
+    """Adds the frameshift and inframe indel counts to the summary of each
+    simulation, and computes the normalized mutation entropy.
+
+    Parameters
+    ----------
+    result : list of list
+        summary rows, grouped by gene in simulation order. The last element
+        of each row is a dictionary of missense codon counts.
+    fs_cts : np.array
+        frameshift counts (simulations by genes)
+    inframe_cts : np.array
+        inframe indel counts (simulations by genes)
+    name2ix : dict
+        maps gene names to columns of the count arrays
+
+    Returns
+    -------
+    result : list of list
+        summary rows with the frameshift, inframe and entropy columns
+        replacing the missense codon counts
+    """
+    num_rows = len(result)
+    if not num_rows:
+        return result
+
+    # find the simulation number of each row within its gene
+    gene_names = [row[0] for row in result]
+    row_ixs = np.arange(num_rows)
+    is_new_gene = np.array([True] + [gene_names[i] != gene_names[i-1]
+                                     for i in range(1, num_rows)])
+    sim_ixs = row_ixs - np.maximum.accumulate(np.where(is_new_gene, row_ixs, 0))
+    gene_ixs = np.array([name2ix[g] for g in gene_names])
+    fs_count = fs_cts[sim_ixs, gene_ixs]
+    inframe_count = inframe_cts[sim_ixs, gene_ixs]
+
+    # counts of missense codons, single silent mutations, inactivating
+    # and inframe mutations for the entropy of each row
+    missense_pos_ct = [row.pop(-1) for row in result]
+    num_missense_pos = np.array([len(ct) for ct in missense_pos_ct], dtype=int)
+    num_silent = np.array([row[4] for row in result], dtype=int)
+    inactivating_ct = np.array([sum(row[5:9]) for row in result]) + fs_count
+    counts = np.concatenate([
+        np.fromiter(it.chain.from_iterable(ct.values() for ct in missense_pos_ct),
+                    dtype=float, count=num_missense_pos.sum()),
+        np.ones(num_silent.sum()),
+        inactivating_ct,
+        inframe_count])
+    rows = np.concatenate([np.repeat(row_ixs, num_missense_pos),
+                           np.repeat(row_ixs, num_silent),
+                           row_ixs, row_ixs])
+    norm_ent = math.normalized_mutation_entropies(counts, rows, num_rows)
+
+    return [row + [fs, inframe, ent]
+            for row, fs, inframe, ent in zip(result, fs_count.tolist(),
+                                             inframe_count.tolist(),
+                                             norm_ent.tolist())]
 
 
 @utils.log_error_decorator
@@ -161,14 +450,15 @@ def singleprocess_permutation(info):
     current_chrom = bed_list[0].chrom
     logger.info('Working on chromosome: {0} . . .'.format(current_chrom))
     num_iterations = opts['num_iterations']
-    gene_fa = pysam.Fastafile(opts['input'])
+    gene_fa = genome.open_fasta(opts['input'])
     gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    contexts = context_cache.open_chromosome(opts, current_chrom)
 
     # go through each gene to perform simulation
     result = []
     for bed in bed_list:
         # compute context counts and somatic bases for each context
-        gene_tuple = mc.compute_mutation_context(bed, gs, mut_df, opts)
+        gene_tuple = mc.compute_mutation_context(bed, gs, mut_df, opts, contexts)
         context_cts, context_to_mutations, mutations_df, gs, sc = gene_tuple
 
         if context_to_mutations:
@@ -218,7 +508,10 @@ def singleprocess_permutation(info):
                                                     min_recur=opts['recurrent'])
             result += tmp_result
 
+    if contexts is not None:
+        contexts.save()
     gene_fa.close()
+    genome.close_genomes()
     logger.info('Finished working on chromosome: {0}.'.format(current_chrom))
     return result
 
@@ -246,7 +539,7 @@ def parse_arguments():
                         help='Flag for more verbose log output')
 
     # program arguments
-    help_str = 'gene FASTA file from extract_gene_seq script'
+    help_str = 'gene FASTA or 2bit file from extract_gene_seq script'
     parser.add_argument('-i', '--input',
                         type=str, required=True,
                         help=help_str)
@@ -259,7 +552,8 @@ def parse_arguments():
                         type=str, required=True,
                         help=help_str)
     help_str = ('Directory containing pre-compute score information in '
-                'for VEST and evolutionary conservation in pickle format (Default: None).')
+                'for VEST and evolutionary conservation in pickle format, or a '
+                'score file created by convert_scores (Default: None).')
     parser.add_argument('-s', '--score-dir',
                         type=str, default=None,
                         help=help_str)
@@ -301,8 +595,8 @@ def parse_arguments():
                         action='store_true',
                         default=False,
                         help=help_str)
-    help_str = ('Path to the genome fasta file. Required if --use-unmapped flag '
-                'is used. (Default: None)')
+    help_str = ('Path to the genome fasta file, or a UCSC 2bit file. Required if '
+                '--use-unmapped flag is used. (Default: None)')
     parser.add_argument('-g', '--genome',
                         type=str, default='',
                         help=help_str)
@@ -330,6 +624,32 @@ def parse_arguments():
     parser.add_argument('-seed', '--seed',
                         type=int, default=101,
                         help=help_str)
+    help_str = ('Write simulated mutations from --maf as a directory of '
+                'binary columnar files instead of a text file. Text columns '
+                'are dictionary encoded and rows are indexed by simulation, '
+                'so a single simulation can be read with '
+                'prob2020.python.maf_store.MafStore (Default: False).')
+    parser.add_argument('--columnar',
+                        action='store_true',
+                        default=False,
+                        help=help_str)
+    help_str = ('Keep the output of each chromosome as a separate gzip '
+                'compressed shard in a directory named after the output file '
+                'with a .shards suffix. The output file then lists the shards '
+                'and their number of rows instead of containing the results. '
+                'Shards are always used with multiple processes, but are '
+                'otherwise concatenated into the output file (Default: False).')
+    parser.add_argument('--keep-shards',
+                        action='store_true',
+                        default=False,
+                        help=help_str)
+    help_str = ('Directory to cache the mutations of each gene after they are '
+                'mapped to the reference transcript and assigned a sequence '
+                'context, so later runs on the same input files skip this '
+                'step (Default: None).')
+    parser.add_argument('--context-cache',
+                        type=str, default='',
+                        help=help_str)
     help_str = 'Output text file of results'
     parser.add_argument('-o', '--output',
                         type=str, required=True,
@@ -354,6 +674,13 @@ def parse_arguments():
         print('You must specify a genome fasta with -g if you set the '
               '--use-unmapped flag to true.')
         sys.exit(1)
+    if opts['columnar'] and not (opts['maf'] and opts['num_iterations']):
+        print('The --columnar flag requires the --maf flag and a number of '
+              'iterations (-n) greater than zero.')
+        sys.exit(1)
+    if opts['columnar'] and opts['keep_shards']:
+        print('The --columnar and --keep-shards flags can not be used together.')
+        sys.exit(1)
 
     # log user entered command
     logger.info('Command: {0}'.format(' '.join(sys.argv)))
@@ -362,21 +689,13 @@ def parse_arguments():
 
 def main(opts):
     # hack to index the FASTA file
-    gene_fa = pysam.Fastafile(opts['input'])
+    gene_fa = genome.open_fasta(opts['input'])
     gene_fa.close()
 
     # Get Mutations
-    mut_df = pd.read_csv(opts['mutations'], sep='\t')
+    mut_df = utils.read_mutations(opts['mutations'])
     orig_num_mut = len(mut_df)
 
-    # rename columns to fit my internal column names
-    rename_dict = {
-        'Hugo_Symbol': 'Gene',
-        'Tumor_Sample_Barcode': 'Tumor_Sample',
-        'Tumor_Seq_Allele2' : 'Tumor_Allele'
-    }
-    mut_df.rename(columns=rename_dict, inplace=True)
-
     # process indels
     indel_df = indel.keep_indels(mut_df)  # return indels only
     indel_df.loc[:, 'Start_Position'] = indel_df['Start_Position'] - 1  # convert to 0-based
@@ -392,11 +711,19 @@ def main(opts):
     # read in bed info
     bed_dict = utils.read_bed(opts['bed'], [])
 
+    # orient tumor alleles to the strand of their gene
+    mut_df = utils.add_strand_tumor_allele(mut_df, bed_dict)
+
+    # write simulated mutations to a columnar store
+    if opts.get('columnar', False):
+        write_maf_store(bed_dict, mut_df, indel_df, opts)
+        return
+
     # perform permutation
     multiprocess_permutation(bed_dict, mut_df, opts, indel_df)
 
-    # save indels
-    if opts['maf']:
+    # save indels, unless written to a shard
+    if opts['maf'] and not uses_shards(opts):
         with open(opts['output'], 'a') as handle:
             mywriter = csv.writer(handle, delimiter='\t', lineterminator='\n')
             for maf_lines in indel.simulate_indel_maf(indel_df, bed_dict,
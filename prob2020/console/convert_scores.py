@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+""" This script converts a directory of VEST and MGA entropy pickle files
+into a single memory-mapped score file, which can be passed to the
+-s/--score-dir option of the other scripts. A directory of neighbor graph
+pickle files can likewise be converted for the -ng/--neighbor-graph-dir
+option.
+"""
+# fix problems with pythons terrible import system
+import sys
+import os
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '../'))
+sys.path.append(os.path.join(file_dir, '../../'))
+
+import prob2020.python.utils as utils
+import prob2020.python.scores as scores
+
+# actually important imports
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)  # module logger
+
+
+def parse_arguments():
+    info = ('Converts VEST and MGA entropy pickle files, or neighbor graph '
+            'pickle files, into a single file')
+    parser = argparse.ArgumentParser(description=info)
+
+    # logging arguments
+    parser.add_argument('-ll', '--log-level',
+                        type=str,
+                        action='store',
+                        default='',
+                        help='Write a log file (--log-level=DEBUG for debug mode, '
+                        '--log-level=INFO for info mode)')
+    parser.add_argument('-l', '--log',
+                        type=str,
+                        action='store',
+                        default='',
+                        help='Path to log file. (accepts stdout)')
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        default=False,
+                        help='Flag for more verbose log output')
+
+    # program arguments
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    help_str = 'Directory containing score information in pickle files'
+    input_group.add_argument('-s', '--score-dir',
+                             type=str, default=None,
+                             help=help_str)
+    help_str = 'Directory containing neighbor graph information in pickle files'
+    input_group.add_argument('-ng', '--neighbor-graph-dir',
+                             type=str, default=None,
+                             help=help_str)
+    help_str = 'Output score or neighbor graph file'
+    parser.add_argument('-o', '--output',
+                        type=str, required=True,
+                        help=help_str)
+    args = parser.parse_args()
+
+    # handle logging
+    if args.log_level or args.log:
+        if args.log:
+            log_file = args.log
+        else:
+            log_file = ''  # auto-name the log file
+    else:
+        log_file = os.devnull
+    log_level = args.log_level
+    utils.start_logging(log_file=log_file,
+                        log_level=log_level,
+                        verbose=args.verbose)  # start logging
+
+    # log user entered command
+    logger.info('Command: {0}'.format(' '.join(sys.argv)))
+
+    return vars(args)
+
+
+def main(opts):
+    if opts.get('neighbor_graph_dir'):
+        num_genes = scores.write_neighbor_graph_store(opts['neighbor_graph_dir'],
+                                                      opts['output'])
+        logger.info('Wrote neighbor graphs for {0} genes to {1}'.format(num_genes, opts['output']))
+    else:
+        num_genes = scores.write_score_store(opts['score_dir'], opts['output'])
+        logger.info('Wrote scores for {0} genes to {1}'.format(num_genes, opts['output']))
+    return num_genes
+
+
+def cli_main():
+    opts = parse_arguments()
+    main(opts)
+
+if __name__ == "__main__":
+    cli_main()
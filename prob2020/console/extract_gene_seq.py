@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 """ This script fetches sequence from an indexed FASTA for genes specified
 in the provided BED file.
+
+Genes are extracted in parallel by chromosome, and the output keeps the
+order of the BED file. The FASTA index (.fai) of the output is written
+along with the sequences.
 """
 # fix problems with pythons terrible import system
 import sys
@@ -11,9 +15,11 @@ sys.path.append(os.path.join(file_dir, '../../'))
 
 import prob2020.python.utils as utils
 import prob2020.python.gene_sequence as gs
+import prob2020.python.genome as genome
 
 # actually important imports
-import pysam
+import itertools as it
+from multiprocessing import Pool
 import argparse
 import logging
 import datetime
@@ -43,7 +49,7 @@ def parse_arguments():
                         help='Flag for more verbose log output')
 
     # program arguments
-    help_str = 'Human genome FASTA file'
+    help_str = 'Human genome FASTA file, or a UCSC 2bit file'
     parser.add_argument('-i', '--input',
                         type=str, required=True,
                         help=help_str)
@@ -55,6 +61,17 @@ def parse_arguments():
     parser.add_argument('-o', '--output',
                         type=str, required=True,
                         help=help_str)
+    help_str = ('Also write the gene sequences as a UCSC 2bit file, which can '
+                'be used in place of the gene FASTA file (Default: None)')
+    parser.add_argument('-t', '--twobit',
+                        type=str, default=None,
+                        help=help_str)
+    help_str = ('Number of processes to use. 0 indicates using a single '
+                'process without using a multiprocessing pool '
+                '(more means Faster, default: 0).')
+    parser.add_argument('-p', '--processes',
+                        type=int, default=0,
+                        help=help_str)
     args = parser.parse_args()
 
     # handle logging
@@ -76,14 +93,76 @@ def parse_arguments():
     return vars(args)
 
 
+def chromosome_shards(bed_path):
+    """Splits the genes in a BED file into runs of consecutive genes on
+    the same chromosome.
+
+    Parameters
+    ----------
+    bed_path : str
+        path to BED file
+
+    Yields
+    ------
+    bed_list : list of BedLine
+        consecutive genes on one chromosome
+    """
+    for chrom, bed_rows in it.groupby(utils.bed_generator(bed_path),
+                                      key=lambda x: x.chrom):
+        yield list(bed_rows)
+
+
+def extract_shard(info):
+    """Fetches the sequences of a shard of genes.
+
+    Parameters
+    ----------
+    info : tuple
+        path to genome file and list of BedLine objects
+
+    Returns
+    -------
+    records : list of (str, str)
+        sequence id and sequence for each exon and splice site
+    """
+    genome_path, bed_list = info
+    genome_fa = genome.open_genome(genome_path)
+    return [record
+            for bed_row in bed_list
+            for record in gs.fetch_gene_records(bed_row, genome_fa)]
+
+
 def main(opts):
+    # make sure the genome index exists before starting worker processes
+    genome.open_genome(opts['input'])
+
     # read bed file, extract gene sequence from genome, write to fasta
-    genome_fa = pysam.Fastafile(opts['input'])
-    with open(opts['output'], 'w') as handle:
-        for bed_row in utils.bed_generator(opts['bed']):
-            fasta_seq = gs.fetch_gene_fasta(bed_row, genome_fa)
-            handle.write(fasta_seq)
-    genome_fa.close()
+    shard_info = ((opts['input'], bed_list)
+                  for bed_list in chromosome_shards(opts['bed']))
+    num_processes = opts.get('processes', 0)
+    if num_processes > 0:
+        pool = Pool(processes=num_processes)
+        shard_results = pool.imap(extract_shard, shard_info)
+    else:
+        shard_results = (extract_shard(info) for info in shard_info)
+
+    # shards come back in BED order, so write them as they finish
+    twobit_records = []
+    with open(opts['output'], 'w') as handle, \
+            open(opts['output'] + '.fai', 'w') as index_handle:
+        for records in shard_results:
+            genome.write_fasta(records, handle, index_handle)
+            if opts.get('twobit'):
+                twobit_records += records
+    if num_processes > 0:
+        pool.close()
+        pool.join()
+
+    genome.close_genomes()
+
+    if opts.get('twobit'):
+        genome.write_twobit(twobit_records, opts['twobit'])
+    logger.info('Finished extracting gene sequences.')
 
 
 def cli_main():
@@ -11,9 +11,12 @@ import prob2020
 import prob2020.python.utils as utils
 import prob2020.python.p_value as mypval
 import prob2020.python.indel as indel
+import prob2020.python.planner as planner
+import prob2020.python.prefetch as prefetch
 import prob2020.console.randomization_test as rt
 
 import argparse
+import time
 import pandas as pd
 import numpy as np
 import logging
@@ -61,6 +64,12 @@ def parse_arguments():
                                            'clustering of missense mutations.')
     #parser_protein = subparsers.add_parser('protein', help='Find statistically significant '
                                            #'3D clustering in genes based on protein structure.')
+    help_info = 'Estimate the run time and memory of a run before performing it.'
+    parser_plan = subparsers.add_parser('plan',
+                                        help=help_info,
+                                        description=help_info + ' Counts mutations and CDS '
+                                        'length for each gene, and calibrates the cost of '
+                                        'simulations by timing a small sample of genes.')
 
     # program arguments
     for i, parser in enumerate([parser_og, parser_tsg, parser_hotmaps]):
@@ -69,7 +78,7 @@ def parse_arguments():
         advance_parser = parser.add_argument_group(title='Advanced options')
 
         # set the CLI params
-        help_str = 'gene FASTA file from extract_gene_seq.py script'
+        help_str = 'gene FASTA or 2bit file from extract_gene_seq.py script'
         major_parser.add_argument('-i', '--input',
                                   type=str, required=True,
                                   help=help_str)
@@ -111,7 +120,8 @@ def parse_arguments():
                                   type=float, default=1.5,
                                   help=help_str)
         if i == 0:
-            help_str = 'Directory containing VEST score information in pickle files (Default: None).'
+            help_str = ('Directory containing VEST score information in pickle files, '
+                        'or a score file created by convert_scores (Default: None).')
             major_parser.add_argument('-s', '--score-dir',
                                       type=str, default=None,
                                       help=help_str)
@@ -126,6 +136,12 @@ def parse_arguments():
             advance_parser.add_argument('-f', '--fraction',
                                         type=float, default=.02,
                                         help=help_str)
+            help_str = ('Compute exact p-values instead of simulations when a gene '
+                        'has at most this number of mutations. 0 always uses '
+                        'simulations, at most 8 (Default: 5).')
+            advance_parser.add_argument('-e', '--exact-max-mutations',
+                                        type=utils.exact_max_mutations_type, default=5,
+                                        help=help_str)
         elif i == 1:
             help_str = ('Perform tsg randomization-based test if gene has '
                         'at least a user specified number of deleterious mutations (default: 1)')
@@ -154,6 +170,80 @@ def parse_arguments():
             advance_parser.add_argument('-f', '--fraction',
                                         type=float, default=.02,
                                         help=help_str)
+        help_str = ('Memory budget in MB shared by all processes for holding '
+                    'simulated mutations. The number of simulations done at once '
+                    'for each gene is reduced to fit the budget. 0 indicates no '
+                    'budget (Default: 0).')
+        advance_parser.add_argument('--memory-budget',
+                                    type=float, default=0,
+                                    help=help_str)
+        if i in [0, 1]:
+            help_str = ('Screen genes with a small number of iterations and only '
+                        'perform the full test for genes that could reach the '
+                        'screening p-value threshold. Screened out genes are '
+                        'reported with an upper bound p-value.')
+            advance_parser.add_argument('--screen',
+                                        action='store_true',
+                                        default=False,
+                                        help=help_str)
+            help_str = 'Number of iterations for screening genes (Default: 1000).'
+            advance_parser.add_argument('--screen-iterations',
+                                        type=int, default=1000,
+                                        help=help_str)
+            help_str = ('Genes are only tested with the full number of iterations '
+                        'if their p-value could be below this threshold (Default: 0.05).')
+            advance_parser.add_argument('--screen-threshold',
+                                        type=float, default=0.05,
+                                        help=help_str)
+        help_str = ('Directory for caching the results of each gene. Genes with '
+                    'the same sequence, mutations and options are loaded from '
+                    'the cache on later runs instead of being tested again '
+                    '(Default: None).')
+        advance_parser.add_argument('--cache-dir',
+                                    type=str, default='',
+                                    help=help_str)
+        help_str = ('Size limit of the cache in MB. The least recently used '
+                    'results are removed when the cache is larger (Default: 500).')
+        advance_parser.add_argument('--cache-size',
+                                    type=float, default=500,
+                                    help=help_str)
+        help_str = ('Directory to cache the mutations of each gene after '
+                    'they are mapped to the reference transcript and assigned '
+                    'a sequence context, so later runs on the same input files '
+                    'skip this step (Default: None).')
+        advance_parser.add_argument('--context-cache',
+                                    type=str, default='',
+                                    help=help_str)
+        help_str = ('Number of genes whose sequence, mutations and scores are '
+                    'prepared in a background thread while the current gene '
+                    'is tested. Use 0 to prepare each gene only when it is '
+                    'reached (Default: {0}).'.format(prefetch.default_depth))
+        advance_parser.add_argument('--prefetch',
+                                    type=int, default=prefetch.default_depth,
+                                    help=help_str)
+        help_str = ('State file for incremental runs. Genes whose mutations '
+                    'are unchanged since the run that saved the state reuse its '
+                    'results, and the state is updated at the end of the run '
+                    '(Default: None).')
+        advance_parser.add_argument('--incremental',
+                                    type=str, default='',
+                                    help=help_str)
+        help_str = ('Journal file where the results of each gene are saved as '
+                    'they finish, so a stopped run can be resumed. Genes are '
+                    'only journaled if this or --resume is given (Default: '
+                    'None, or the output file with a .journal suffix with '
+                    '--resume).')
+        advance_parser.add_argument('--journal',
+                                    type=str, default='',
+                                    help=help_str)
+        help_str = ('Resume a stopped run by skipping genes already saved in '
+                    'the journal with the same options. Finished genes are '
+                    'added to the journal, so a run started with --resume can '
+                    'itself be resumed.')
+        advance_parser.add_argument('--resume',
+                                    action='store_true',
+                                    default=False,
+                                    help=help_str)
         help_str = ('Only keep unique mutations for each tumor sample. '
                     'Mutations reported from heterogeneous sources may contain'
                     ' duplicates, e.g. a tumor sample was sequenced twice.')
@@ -168,8 +258,8 @@ def parse_arguments():
                                     action='store_true',
                                     default=False,
                                     help=help_str)
-        help_str = ('Path to the genome fasta file. Required if --use-unmapped flag '
-                    'is used. (Default: None)')
+        help_str = ('Path to the genome fasta file, or a UCSC 2bit file. Required if '
+                    '--use-unmapped flag is used. (Default: None)')
         advance_parser.add_argument('-g', '--genome',
                                     type=str, default='',
                                     help=help_str)
@@ -183,6 +273,72 @@ def parse_arguments():
         major_parser.add_argument('-o', '--output',
                                   type=str, required=True,
                                   help=help_str)
+    # options for planning a run
+    major_parser = parser_plan.add_argument_group(title='Major options')
+    advance_parser = parser_plan.add_argument_group(title='Advanced options')
+    help_str = 'Kind of test to plan (Default: oncogene).'
+    major_parser.add_argument('-k', '--test-kind',
+                              type=str, default='oncogene',
+                              choices=['oncogene', 'tsg', 'hotmaps1d'],
+                              help=help_str)
+    help_str = 'gene FASTA or 2bit file from extract_gene_seq.py script'
+    major_parser.add_argument('-i', '--input',
+                              type=str, required=True,
+                              help=help_str)
+    help_str = 'DNA mutations file (MAF file).'
+    major_parser.add_argument('-m', '--mutations',
+                              type=str, required=True,
+                              help=help_str)
+    help_str = 'BED file annotation of genes'
+    major_parser.add_argument('-b', '--bed',
+                              type=str, required=True,
+                              help=help_str)
+    help_str = 'Number of processes planned for the run (Default: 0).'
+    major_parser.add_argument('-p', '--processes',
+                              type=int, default=0,
+                              help=help_str)
+    help_str = 'Number of iterations planned for the run (Default: 100,000).'
+    major_parser.add_argument('-n', '--num-iterations',
+                              type=int, default=100000,
+                              help=help_str)
+    help_str = 'Stop criteria planned for the run (Default: 1000).'
+    advance_parser.add_argument('-sc', '--stop-criteria',
+                                type=int, default=1000,
+                                help=help_str)
+    help_str = 'Number of DNA bases to use as context (Default: 1.5).'
+    major_parser.add_argument('-c', '--context',
+                              type=float, default=1.5,
+                              help=help_str)
+    help_str = ('Directory containing VEST score information in pickle files, '
+                'or a score file created by convert_scores (Default: None).')
+    major_parser.add_argument('-s', '--score-dir',
+                              type=str, default=None,
+                              help=help_str)
+    help_str = 'Memory budget in MB planned for the run (Default: 0).'
+    advance_parser.add_argument('--memory-budget',
+                                type=float, default=0,
+                                help=help_str)
+    help_str = 'Number of genes timed to calibrate the estimates (Default: 5).'
+    advance_parser.add_argument('--sample-genes',
+                                type=int, default=5,
+                                help=help_str)
+    help_str = 'Number of iterations used to time each sample gene (Default: 200).'
+    advance_parser.add_argument('--sample-iterations',
+                                type=int, default=200,
+                                help=help_str)
+    help_str = 'Only keep unique mutations for each tumor sample.'
+    advance_parser.add_argument('--unique',
+                                action='store_true',
+                                default=False,
+                                help=help_str)
+    help_str = 'Output text file with the estimates for each gene (optional).'
+    major_parser.add_argument('-o', '--output',
+                              type=str, default='',
+                              help=help_str)
+    parser_plan.set_defaults(recurrent=3, fraction=.02, deleterious=1, window=3,
+                             exact_max_mutations=5, use_unmapped=False, genome='',
+                             seed=101)
+
     args = parent_parser.parse_args()
 
     # handle logging
@@ -210,12 +366,58 @@ def parse_arguments():
     return opts
 
 
+def plan(opts):
+    """Estimates the cost of a run without performing it."""
+    # read mutations the same way as the randomization-based test
+    mut_df = utils.read_mutations(opts['mutations'])
+    mut_df = rt.format_mutation_df(mut_df)
+    mut_df = utils._fix_mutation_df(mut_df, opts['unique'])
+    bed_dict = utils.read_bed(opts['bed'], [])
+    workload_df = planner.gene_workload(bed_dict, mut_df)
+
+    # time a short run for a few sample genes
+    run_opts = opts.copy()
+    run_opts['kind'] = opts['test_kind']
+    run_opts['output'] = ''
+    gene2bed = {b.gene_name: b for chrom in bed_dict for b in bed_dict[chrom]}
+    def time_gene(gene, num_iterations):
+        run_opts['num_iterations'] = num_iterations
+        run_opts['stop_criteria'] = num_iterations
+        gene_mut_df = mut_df[mut_df['Gene']==gene]
+        start = time.time()
+        rt.singleprocess_permutation(([gene2bed[gene]], gene_mut_df, run_opts, None, None))
+        return time.time() - start
+    setup_time, sim_time = planner.calibrate(workload_df, time_gene,
+                                             opts['sample_genes'],
+                                             opts['sample_iterations'],
+                                             planner.exact_max_mutations(run_opts))
+
+    # estimate the cost of the full run
+    run_opts['num_iterations'] = opts['num_iterations']
+    run_opts['stop_criteria'] = opts['stop_criteria']
+    mut_df_bytes = mut_df.memory_usage(deep=True).sum()
+    workload_df, summary = planner.plan(workload_df, run_opts,
+                                        setup_time, sim_time,
+                                        mut_df_bytes)
+    for k in summary:
+        print('{0}: {1}'.format(k, summary[k]))
+    if opts['output']:
+        workload_df.to_csv(opts['output'], sep='\t', index=False)
+    return summary
+
+
 def main(opts,
          mutation_df=None,
          frameshift_df=None):
+    # only estimate the cost of a run
+    if opts['kind'] == 'plan':
+        return plan(opts)
+
     # get output file
     myoutput_path = opts['output']
     opts['output'] = ''
+    if opts.get('resume', False) and myoutput_path and not opts.get('journal'):
+        opts['journal'] = myoutput_path + '.journal'
 
     # perform randomization-based test
     result_df = rt.main(opts, mutation_df)
@@ -8,16 +8,22 @@ sys.path.append(os.path.join(file_dir, '../../'))
 
 # package imports
 import prob2020.python.utils as utils
+import prob2020.python.genome as genome
 from prob2020.python.gene_sequence import GeneSequence
 from prob2020.python.sequence_context import SequenceContext
 import prob2020.python.mutation_context as mc
 import prob2020.python.count_frameshifts as cf
 import prob2020.python.process_result as pr
 import prob2020.python.p_value as mypval
+import prob2020.python.journal as journal
+import prob2020.python.result_cache as result_cache
+import prob2020.python.incremental as incremental
+import prob2020.python.context_cache as context_cache
+import prob2020.python.prefetch as prefetch
+import prob2020.python.scores as scores
 
 # external imports
 import argparse
-import pysam
 import pandas as pd
 import numpy as np
 from multiprocessing import Pool
@@ -26,60 +32,87 @@ import logging
 logger = logging.getLogger(__name__)  # module logger
 
 
+def prepare_gene(bed, gene_fa, mut_df, opts, contexts=None):
+    """Prepares the inputs of the permutation test for a gene.
+
+    With prefetching, this runs on the prefetch thread. gene_fa is then
+    only read from that thread, and contexts.add is called from it, so the
+    consumer of the prepared genes must not use either until the
+    prefetcher is finished.
+
+    Parameters
+    ----------
+    bed : BedLine
+        gene of interest
+    gene_fa : pysam.Fastafile
+        gene sequences of the worker
+    mut_df : pd.DataFrame
+        mutations of all genes
+    opts : dict
+        command line options
+    contexts : ChromosomeContexts or None
+        cached normalized mutations of the gene's chromosome
+
+    Returns
+    -------
+    gene_input : tuple
+        gene sequence, sequence context, mapped mutations, unmapped
+        mutations, total number of mutations and the scores of the gene
+        (VEST scores or neighbor graph, None if not used)
+    """
+    gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    gs.set_gene(bed)
+    sc = SequenceContext(gs, seed=opts['seed'])
+    mut_info, unmapped_mut_info, total_mut = mc.normalize_mutations(bed, sc, mut_df,
+                                                                    opts, contexts)
+
+    # read scores ahead of the test, which only uses them if a mutation maps
+    gene_scores = None
+    if len(mut_info) > 0:
+        if opts['kind'] == 'oncogene' and opts.get('score_dir'):
+            gene_scores = scores.read_vest(bed.gene_name, opts['score_dir'])
+        elif opts['kind'] == 'protein' and opts.get('neighbor_graph_dir'):
+            gene_scores = scores.read_neighbor_graph(bed.gene_name,
+                                                     opts['neighbor_graph_dir'])
+    return gs, sc, mut_info, unmapped_mut_info, total_mut, gene_scores
+
+
 @utils.log_error_decorator
 def singleprocess_permutation(info):
     # initialize input
     bed_list, mut_df, opts, fs_cts_df, p_inactivating = info
     current_chrom = bed_list[0].chrom
     logger.info('Working on chromosome: {0} . . .'.format(current_chrom))
-    gene_fa = pysam.Fastafile(opts['input'])
-    gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    gene_fa = genome.open_fasta(opts['input'])
 
-    # list of columns that are needed
-    cols = ['Chromosome', 'Start_Position', 'Reference_Allele',
-            'Tumor_Allele', 'Variant_Classification',]
-    # conditionally add protein_change column if exists
-    if 'Protein_Change' in mut_df.columns:
-        cols += ['Protein_Change']
+    # normalized mutations saved by earlier runs
+    contexts = context_cache.open_chromosome(opts, current_chrom)
 
-    # figure out which genes actually have a mutation
+    # figure out which genes actually have a mutation, skip genes with no
+    # mutations
     genes_with_mut = set(mut_df['Gene'].unique())
+    bed_list = [bed for bed in bed_list if bed.gene_name in genes_with_mut]
 
-    # iterate through each gene
-    result = []
-    for bed in bed_list:
-        if bed.gene_name not in genes_with_mut:
-            # skip genes with no mutations
-            continue
+    # record finished genes in the journal
+    jrnl = None
+    if opts.get('journal'):
+        jrnl = journal.Journal(opts['journal'], opts['journal_key'])
+
+    # results are only reproducible with a fixed seed
+    cache = None
+    if opts.get('cache_dir') and opts['seed'] is not None:
+        cache = result_cache.ResultCache(opts['cache_dir'],
+                                         opts.get('cache_size', result_cache.default_cache_size))
+
+    # prepare the next genes in the background while a gene is tested,
+    # gene_fa and contexts belong to the prefetch thread until the loop ends
+    prepare = lambda bed: prepare_gene(bed, gene_fa, mut_df, opts, contexts)
+    gene_inputs = prefetch.iter_prepared(bed_list, prepare, opts.get('prefetch', prefetch.default_depth))
 
-        # prepare info for running permutation test
-        mut_info = mut_df.loc[mut_df['Gene']==bed.gene_name, cols]
-        gs.set_gene(bed)
-        sc = SequenceContext(gs, seed=opts['seed'])
-
-        # count total mutations in gene
-        total_mut = len(mut_info)
-
-        # fix nucleotide letter if gene is on - strand
-        if bed.strand == '-':
-            rc = mut_info['Tumor_Allele'].map(lambda x: utils.rev_comp(x))
-            mut_info.loc[:, 'Tumor_Allele'] = rc
-
-        # get coding positions, mutations unmapped to the reference tx will have
-        # NA for a coding position
-        pos_list = []
-        for ix, row in mut_info.iterrows():
-            coding_pos = bed.query_position(bed.strand, row['Chromosome'], row['Start_Position'])
-            pos_list.append(coding_pos)
-        mut_info.loc[:, 'Coding Position'] = pos_list
-
-        # recover mutations that could not be mapped to the reference transcript
-        # for a gene before being dropped (next step)
-        unmapped_mut_info = mc.recover_unmapped_mut_info(mut_info, bed, sc, opts)
-
-        # drop mutations wich do not map to reference tx
-        mut_info = mut_info.dropna(subset=['Coding Position'])  # mutations need to map to tx
-        mut_info['Coding Position'] = mut_info['Coding Position'].astype(int)
+    # iterate through each gene
+    result, exact_genes = [], set()
+    for bed, gene_input in gene_inputs:
+        gs, sc, mut_info, unmapped_mut_info, total_mut, gene_scores = gene_input
         num_mapped_muts = len(mut_info)
         unmapped_muts = total_mut - num_mapped_muts
 
@@ -87,17 +120,36 @@ def singleprocess_permutation(info):
         #gs.add_germline_variants(mut_info['Reference_Allele'].tolist(),
         #                         mut_info['Coding Position'].tolist())
 
+        # limit the number of simulations held in memory at once
+        max_batch = utils.max_batch_size(total_mut,
+                                         opts.get('memory_budget'),
+                                         opts['processes'])
+
+        # look up the result of an earlier run
+        cached, cache_key = None, None
+        if cache is not None:
+            cache_key = result_cache.gene_key(gs, mut_info, unmapped_mut_info, opts)
+            cached = cache.get(cache_key)
+
         # calculate results of permutation test
-        if opts['kind'] == 'oncogene':
+        is_exact = False
+        if cached is not None:
+            logger.debug('Using cached result for {0}.'.format(bed.gene_name))
+            gene_result, is_exact = cached
+            cache_key = None
+        elif opts['kind'] == 'oncogene':
             # calculate position based permutation results
-            tmp_result = mypval.calc_position_p_value(mut_info, unmapped_mut_info, sc,
+            tmp_result, is_exact = mypval.calc_position_p_value(mut_info, unmapped_mut_info, sc,
                                                       gs, bed, opts['score_dir'],
                                                       opts['num_iterations'],
                                                       opts['stop_criteria'],
                                                       0,  # no recurrent mutation pseudo count
                                                       opts['recurrent'],
-                                                      opts['fraction'])
-            result.append(tmp_result + [total_mut, unmapped_muts])
+                                                      opts['fraction'],
+                                                      opts.get('exact_max_mutations', 0),
+                                                      max_batch,
+                                                      gene_vest=gene_scores)
+            gene_result = [tmp_result + [total_mut, unmapped_muts]]
         elif opts['kind'] == 'tsg':
             # calculate results for deleterious mutation permutation test
             #fs_ct = fs_cts_df['total'][bed.gene_name]
@@ -110,8 +162,9 @@ def singleprocess_permutation(info):
                                                          opts['stop_criteria'],
                                                          opts['deleterious'],
                                                          0,  # no deleterious mutation pseudo count
-                                                         opts['seed'])
-            result.append(tmp_result + [num_mapped_muts, unmapped_muts])
+                                                         opts['seed'],
+                                                         max_batch)
+            gene_result = [tmp_result + [num_mapped_muts, unmapped_muts]]
                                         #fs_ct, fs_unmapped])
         elif opts['kind'] == 'hotmaps1d':
             # calculate position based permutation results
@@ -119,8 +172,9 @@ def singleprocess_permutation(info):
                                                      gs, bed,
                                                      opts['window'],
                                                      opts['num_iterations'],
-                                                     opts['stop_criteria'])
-            result.extend(tmp_result)
+                                                     opts['stop_criteria'],
+                                                     max_batch)
+            gene_result = tmp_result
         elif opts['kind'] == 'protein':
             tmp_result = mypval.calc_protein_p_value(mut_info, unmapped_mut_info,
                                                      sc, gs, bed,
@@ -128,8 +182,9 @@ def singleprocess_permutation(info):
                                                      opts['num_iterations'],
                                                      opts['stop_criteria'],
                                                      opts['recurrent'],
-                                                     opts['fraction'])
-            result.append(tmp_result + [total_mut, unmapped_muts])
+                                                     opts['fraction'],
+                                                     gene_graph=gene_scores)
+            gene_result = [tmp_result + [total_mut, unmapped_muts]]
         else:
             # calc results for entropy-on-effect permutation test
             tmp_result = mypval.calc_effect_p_value(mut_info, unmapped_mut_info,
@@ -138,17 +193,35 @@ def singleprocess_permutation(info):
                                                     0, #  no recurrent mutation pseudo count
                                                     opts['recurrent'],
                                                     opts['fraction'])
-            result.append(tmp_result + [total_mut, unmapped_muts])
-
+            gene_result = [tmp_result + [total_mut, unmapped_muts]]
+
+        if cache_key is not None:
+            cache.put(cache_key, (gene_result, is_exact))
+        result.extend(gene_result)
+        if is_exact:
+            exact_genes.add(bed.gene_name)
+        if jrnl is not None:
+            jrnl.append(bed.gene_name, gene_result)
+
+    if contexts is not None:
+        contexts.save()
     gene_fa.close()
+    genome.close_genomes()
     logger.info('Finished working on chromosome: {0}.'.format(current_chrom))
-    return result
+    return result, exact_genes
 
 
 def multiprocess_permutation(bed_dict, mut_df, opts,
                              fs_cts_df=None, p_inactivating=None):
     """Handles parallelization of permutations by splitting work
     by chromosome.
+
+    Returns
+    -------
+    result_list : list
+        results for every gene
+    exact_genes : set
+        names of genes whose p-values were computed exactly
     """
     chroms = sorted(bed_dict.keys(), key=lambda x: len(bed_dict[x]), reverse=True)
     multiprocess_flag = opts['processes']>0
@@ -156,7 +229,7 @@ def multiprocess_permutation(bed_dict, mut_df, opts,
         num_processes = opts['processes']
     else:
         num_processes = 1
-    result_list = []
+    result_list, exact_genes = [], set()
     for i in range(0, len(chroms), num_processes):
         if multiprocess_flag:
             pool = Pool(processes=num_processes)
@@ -166,8 +239,9 @@ def multiprocess_permutation(bed_dict, mut_df, opts,
             process_results = pool.imap(singleprocess_permutation, info_repeat)
             process_results.next = utils.keyboard_exit_wrapper(process_results.next)
             try:
-                for chrom_result in process_results:
+                for chrom_result, chrom_exact in process_results:
                     result_list += chrom_result
+                    exact_genes |= chrom_exact
             except KeyboardInterrupt:
                 pool.close()
                 pool.join()
@@ -177,9 +251,97 @@ def multiprocess_permutation(bed_dict, mut_df, opts,
             pool.join()
         else:
             info = (bed_dict[chroms[i]], mut_df, opts, fs_cts_df, p_inactivating)
-            result_list += singleprocess_permutation(info)
+            chrom_result, chrom_exact = singleprocess_permutation(info)
+            result_list += chrom_result
+            exact_genes |= chrom_exact
+
+    return result_list, exact_genes
+
+
+def screen_permutation(bed_dict, mut_df, opts,
+                       fs_cts_df=None, p_inactivating=None):
+    """Screens genes with a small number of iterations before performing
+    the full permutation test.
 
-    return result_list
+    Genes whose p-value can not plausibly fall below the screening threshold
+    are reported with the upper bound of their p-value, while the remaining
+    candidate genes are tested with the full number of iterations.
+
+    Returns
+    -------
+    result_list : list
+        results for every gene, same format as multiprocess_permutation
+    screened_out : set
+        names of genes reported with an upper bound p-value
+    """
+    # perform the fast first pass
+    num_screen = opts['screen_iterations']
+    screen_opts = opts.copy()
+    screen_opts['num_iterations'] = num_screen
+    screen_opts['stop_criteria'] = num_screen
+    screen_opts['journal'] = ''  # only final results go in the journal
+    screen_result, exact_genes = multiprocess_permutation(bed_dict, mut_df, screen_opts,
+                                                          fs_cts_df, p_inactivating)
+
+    # position of p-values in the result
+    if opts['kind'] == 'oncogene':
+        pval_ixs = [4, 5]
+    else:
+        pval_ixs = [2]
+
+    # figure out which genes are candidates
+    result_list, screened_out, candidates = [], set(), set()
+    for row in screen_result:
+        pvals = [row[ix] for ix in pval_ixs]
+        if any(p is None for p in pvals):
+            # gene was not tested
+            result_list.append(row)
+            continue
+        elif row[0] in exact_genes:
+            # p-values were already computed exactly
+            result_list.append(row)
+            continue
+
+        bounds = [mypval.clopper_pearson_interval(int(round(p*num_screen)), num_screen)
+                  for p in pvals]
+        lower = [b[0] for b in bounds]
+        is_candidate = min(lower) <= opts['screen_threshold']
+        if len(lower) > 1 and min(lower) > 0:
+            # the reported combined p-value uses Fisher's method, which
+            # decreases with each p-value, so combining the lower bounds
+            # gives a screening score that is never above the combined
+            # p-value of the true p-values. It is not a p-value itself and
+            # is only used to keep candidates.
+            screen_score = mypval.fishers_method(lower)
+            is_candidate |= screen_score <= opts['screen_threshold']
+
+        if is_candidate:
+            candidates.add(row[0])
+        else:
+            for ix, b in zip(pval_ixs, bounds):
+                row[ix] = b[1]
+            result_list.append(row)
+            screened_out.add(row[0])
+    if opts.get('journal'):
+        jrnl = journal.Journal(opts['journal'], opts['journal_key'])
+        for row in result_list:
+            jrnl.append(row[0], [row], screened=row[0] in screened_out)
+    logger.info('Screening kept {0} candidate genes ({1} genes screened out).'.format(len(candidates),
+                                                                                      len(screened_out)))
+
+    # perform full permutation test for candidate genes
+    if candidates:
+        candidate_bed_dict = {}
+        for chrom in bed_dict:
+            tmp_bed = [b for b in bed_dict[chrom] if b.gene_name in candidates]
+            if tmp_bed:
+                candidate_bed_dict[chrom] = tmp_bed
+        candidate_mut_df = mut_df[mut_df['Gene'].isin(candidates)]
+        candidate_result, _ = multiprocess_permutation(candidate_bed_dict, candidate_mut_df,
+                                                       opts, fs_cts_df, p_inactivating)
+        result_list += candidate_result
+
+    return result_list, screened_out
 
 
 def parse_arguments():
@@ -205,7 +367,7 @@ def parse_arguments():
                         help='Flag for more verbose log output')
 
     # program arguments
-    help_str = 'gene FASTA file from extract_gene_seq.py script'
+    help_str = 'gene FASTA or 2bit file from extract_gene_seq.py script'
     parser.add_argument('-i', '--input',
                         type=str, required=True,
                         help=help_str)
@@ -217,11 +379,13 @@ def parse_arguments():
     parser.add_argument('-b', '--bed',
                         type=str, required=True,
                         help=help_str)
-    help_str = 'Directory containing score information in pickle files (Default: None).'
+    help_str = ('Directory containing score information in pickle files, '
+                'or a score file created by convert_scores (Default: None).')
     parser.add_argument('-s', '--score-dir',
                         type=str, default=None,
                         help=help_str)
-    help_str = 'Directory containing neighbor graph information in pickle files (Default: None).'
+    help_str = ('Directory containing neighbor graph information in pickle files, '
+                'or a neighbor graph file created by convert_scores (Default: None).')
     parser.add_argument('-ng', '--neighbor-graph-dir',
                         type=str, default=None,
                         help=help_str)
@@ -267,8 +431,8 @@ def parse_arguments():
                         action='store_true',
                         default=False,
                         help=help_str)
-    help_str = ('Path to the genome fasta file. Required if --use-unmapped flag '
-                'is used. (Default: None)')
+    help_str = ('Path to the genome fasta file, or a UCSC 2bit file. Required if '
+                '--use-unmapped flag is used. (Default: None)')
     parser.add_argument('-g', '--genome',
                         type=str, default='',
                         help=help_str)
@@ -290,6 +454,35 @@ def parse_arguments():
     parser.add_argument('-f', '--fraction',
                         type=float, default=.02,
                         help=help_str)
+    help_str = ('Compute exact p-values for the oncogene test instead of '
+                'simulations when a gene has at most this number of mutations. '
+                '0 always uses simulations, at most 8 (Default: 5).')
+    parser.add_argument('-e', '--exact-max-mutations',
+                        type=utils.exact_max_mutations_type, default=5,
+                        help=help_str)
+    help_str = ('Memory budget in MB shared by all processes for holding '
+                'simulated mutations. The number of simulations done at once '
+                'for each gene is reduced to fit the budget. 0 indicates no '
+                'budget (Default: 0).')
+    parser.add_argument('--memory-budget',
+                        type=float, default=0,
+                        help=help_str)
+    help_str = ('Screen genes with a small number of iterations and only perform '
+                'the full test for genes that could reach the screening p-value '
+                'threshold. Applies to "oncogene" and "tsg".')
+    parser.add_argument('--screen',
+                        action='store_true',
+                        default=False,
+                        help=help_str)
+    help_str = 'Number of iterations for screening genes (Default: 1000).'
+    parser.add_argument('--screen-iterations',
+                        type=int, default=1000,
+                        help=help_str)
+    help_str = ('Genes are only tested with the full number of iterations if '
+                'their p-value could be below this threshold (Default: 0.05).')
+    parser.add_argument('--screen-threshold',
+                        type=float, default=0.05,
+                        help=help_str)
     help_str = ('Perform tsg permutation test if gene has '
                 'at least a user specified number of deleterious mutations (default: 1)')
     parser.add_argument('-d', '--deleterious',
@@ -317,6 +510,53 @@ def parse_arguments():
     parser.add_argument('-seed', '--seed',
                         type=int, default=None,
                         help=help_str)
+    help_str = ('Directory for caching the results of each gene. Genes with the '
+                'same sequence, mutations and options are loaded from the cache '
+                'on later runs instead of being tested again. Requires a fixed '
+                'seed (Default: None).')
+    parser.add_argument('--cache-dir',
+                        type=str, default='',
+                        help=help_str)
+    help_str = ('Size limit of the cache in MB. The least recently used results '
+                'are removed when the cache is larger (Default: 500).')
+    parser.add_argument('--cache-size',
+                        type=float, default=result_cache.default_cache_size,
+                        help=help_str)
+    help_str = ('Directory to cache the mutations of each gene after they are '
+                'mapped to the reference transcript and assigned a sequence '
+                'context, so later runs on the same input files skip this '
+                'step (Default: None).')
+    parser.add_argument('--context-cache',
+                        type=str, default='',
+                        help=help_str)
+    help_str = ('Number of genes whose sequence, mutations and scores are '
+                'prepared in a background thread while the current gene is '
+                'tested. Use 0 to prepare each gene only when it is reached '
+                '(Default: 2).')
+    parser.add_argument('--prefetch',
+                        type=int, default=prefetch.default_depth,
+                        help=help_str)
+    help_str = ('State file for incremental runs. Genes whose mutations are '
+                'unchanged since the run that saved the state reuse its results, '
+                'and the state is updated at the end of the run (Default: None).')
+    parser.add_argument('--incremental',
+                        type=str, default='',
+                        help=help_str)
+    help_str = ('Journal file where the results of each gene are saved as '
+                'they finish, so a stopped run can be resumed. Genes are only '
+                'journaled if this or --resume is given (Default: None, or the '
+                'output file with a .journal suffix with --resume).')
+    parser.add_argument('--journal',
+                        type=str, default='',
+                        help=help_str)
+    help_str = ('Resume a stopped run by skipping genes already saved in the '
+                'journal with the same options. Finished genes are added to '
+                'the journal, so a run started with --resume can itself be '
+                'resumed.')
+    parser.add_argument('--resume',
+                        action='store_true',
+                        default=False,
+                        help=help_str)
     help_str = 'Output of probabilistic 20/20 results'
     parser.add_argument('-o', '--output',
                         type=str, required=True,
@@ -347,36 +587,134 @@ def parse_arguments():
     return opts
 
 
-def main(opts, mut_df=None, frameshift_df=None):
-    # hack to index the FASTA file
-    gene_fa = pysam.Fastafile(opts['input'])
-    gene_fa.close()
-
-    # Get Mutations
-    if mut_df is None:
-        mut_df = pd.read_csv(opts['mutations'], sep='\t')
+def start_incremental(bed_dict, mut_df, opts):
+    """Reuses results saved by a previous run for the genes whose mutations
+    are unchanged.
+
+    Returns
+    -------
+    bed_dict : dict
+        genes with new or changed mutations, that need to be tested
+    reused_result : list
+        result rows of unchanged genes
+    reused_screened : set
+        unchanged genes that were screened out
+    state : tuple or None
+        configuration key and the mutation fingerprints of all genes, used
+        to save the state at the end of the run
+    """
+    if not opts.get('incremental'):
+        return bed_dict, [], set(), None
+    state_key = journal.config_key(opts, incremental.incremental_ignored_opts)
+    cols = ['Chromosome', 'Start_Position', 'Reference_Allele', 'Tumor_Allele',
+            'Variant_Classification', 'Protein_Change', 'Tumor_Sample', 'Tumor_Type']
+    all_fingerprints = incremental.gene_fingerprints(mut_df, cols)
+    fingerprints = {b.gene_name: all_fingerprints[b.gene_name]
+                    for chrom in bed_dict for b in bed_dict[chrom]
+                    if b.gene_name in all_fingerprints}
+    previous = incremental.read_state(opts['incremental'], state_key)
+    unchanged = set(g for g in fingerprints
+                    if g in previous and previous[g]['fingerprint'] == fingerprints[g])
+
+    reused_result, reused_screened = [], set()
+    for gene in unchanged:
+        reused_result.extend(previous[gene]['rows'])
+        if previous[gene]['screened']:
+            reused_screened.add(gene)
+    remaining_bed_dict = {}
+    for chrom in bed_dict:
+        tmp_bed = [b for b in bed_dict[chrom] if b.gene_name not in unchanged]
+        if tmp_bed:
+            remaining_bed_dict[chrom] = tmp_bed
+    logger.info('Reusing results of {0} genes with unchanged mutations, '
+                'testing {1} genes.'.format(len(unchanged), len(fingerprints) - len(unchanged)))
+    return remaining_bed_dict, reused_result, reused_screened, (state_key, fingerprints)
+
+
+def start_journal(bed_dict, opts):
+    """Sets up the journal of finished genes.
+
+    Genes are only journaled if the journal or resume option is given. The
+    resume option defaults the journal to the output file with a .journal
+    suffix. Without the resume option a new journal is started. With the
+    resume option, genes already in the journal for the same configuration
+    are removed from bed_dict and their results are returned.
+
+    Returns
+    -------
+    bed_dict : dict
+        genes that still need to be tested
+    done_result : list
+        result rows of finished genes
+    done_screened : set
+        finished genes that were screened out
+    """
+    if opts.get('resume', False) and not opts.get('journal') and opts.get('output'):
+        opts['journal'] = opts['output'] + '.journal'
+    if not opts.get('journal'):
+        return bed_dict, [], set()
+    opts['journal_key'] = journal.config_key(opts)
+    jrnl = journal.Journal(opts['journal'], opts['journal_key'])
+    if not opts.get('resume', False):
+        if os.path.exists(opts['journal']):
+            logger.warning('Starting a new journal in place of {0}, use --resume '
+                           'to keep its finished genes.'.format(opts['journal']))
+        jrnl.clear()
+        return bed_dict, [], set()
+
+    jrnl.repair()
+    records = jrnl.read()
+    done_result, done_screened = [], set()
+    for gene, record in records.items():
+        done_result.extend(record['rows'])
+        if record['screened']:
+            done_screened.add(gene)
+    remaining_bed_dict = {}
+    for chrom in bed_dict:
+        tmp_bed = [b for b in bed_dict[chrom] if b.gene_name not in records]
+        if tmp_bed:
+            remaining_bed_dict[chrom] = tmp_bed
+    logger.info('Resuming from journal with {0} finished genes.'.format(len(records)))
+    return remaining_bed_dict, done_result, done_screened
+
+
+def format_mutation_df(mut_df):
+    """Renames columns to the internal column names and drops mutations
+    with missing information.
+    """
     orig_num_mut = len(mut_df)
 
     # rename columns to fit my internal column names
-    rename_dict = {
-        'Hugo_Symbol': 'Gene',
-        'Tumor_Sample_Barcode': 'Tumor_Sample',
-        'Tumor_Seq_Allele2' : 'Tumor_Allele'
-    }
-    mut_df.rename(columns=rename_dict, inplace=True)
+    mut_df = mut_df.rename(columns=utils.maf_rename)
 
     # drop rows with missing info
     na_cols = ['Gene', 'Tumor_Allele', 'Start_Position', 'Chromosome']
     mut_df = mut_df.dropna(subset=na_cols)
     logger.info('Kept {0} mutations after droping mutations with missing '
                 'information (Droped: {1})'.format(len(mut_df), orig_num_mut - len(mut_df)))
+    return mut_df
+
+
+def main(opts, mut_df=None, frameshift_df=None):
+    # hack to index the FASTA file
+    gene_fa = genome.open_fasta(opts['input'])
+    gene_fa.close()
+
+    # Get Mutations
+    if mut_df is None:
+        mut_df = utils.read_mutations(opts['mutations'])
+    elif opts.get('context_cache'):
+        # the cache is keyed by the mutation file, which need not hold mut_df
+        logger.info('Not using the context cache for mutations that were not read from a file.')
+        opts = dict(opts, context_cache=None)
+    mut_df = format_mutation_df(mut_df)
 
     # count frameshifts
     if opts['kind'] != 'oncogene':
         if frameshift_df is None:
             # read in mutations
             if mut_df is None:
-                mut_df = pd.read_csv(opts['mutations'], sep='\t')
+                mut_df = utils.read_mutations(opts['mutations'])
 
             # count number of frameshifts
             frameshift_df = cf.count_frameshift_total(mut_df, opts['bed'],
@@ -401,27 +739,65 @@ def main(opts, mut_df=None, frameshift_df=None):
     non_tested_genes = []
     bed_dict = utils.read_bed(opts['bed'], non_tested_genes)
 
+    # orient tumor alleles to the strand of their gene
+    mut_df = utils.add_strand_tumor_allele(mut_df, bed_dict)
+
+    # only screen the oncogene and tsg tests
+    use_screen = opts.get('screen', False) and opts['kind'] in ['oncogene', 'tsg']
+
+    # reuse results of genes whose mutations did not change since the
+    # previous run
+    bed_dict, reused_result, reused_screened, state = start_incremental(bed_dict, mut_df, opts)
+
+    # skip genes that were finished before the run stopped
+    bed_dict, done_result, done_screened = start_journal(bed_dict, opts)
+    done_result = reused_result + done_result
+    done_screened |= reused_screened
+
     # Perform BH p-value adjustment and tidy up data for output
     if opts['kind'] == 'oncogene':
-        permutation_result = multiprocess_permutation(bed_dict, mut_df, opts)
+        if use_screen:
+            permutation_result, screened_out = screen_permutation(bed_dict, mut_df, opts)
+        else:
+            permutation_result, _ = multiprocess_permutation(bed_dict, mut_df, opts)
+        permutation_result = done_result + permutation_result
         permutation_df = pr.handle_oncogene_results(permutation_result,
                                                     non_tested_genes,
                                                     opts['num_iterations'])
     elif opts['kind'] == 'tsg':
-        permutation_result = multiprocess_permutation(bed_dict, mut_df, opts,
-                                                      frameshift_df, p_inactivating)
+        if use_screen:
+            permutation_result, screened_out = screen_permutation(bed_dict, mut_df, opts,
+                                                                  frameshift_df, p_inactivating)
+        else:
+            permutation_result, _ = multiprocess_permutation(bed_dict, mut_df, opts,
+                                                             frameshift_df, p_inactivating)
+        permutation_result = done_result + permutation_result
         permutation_df = pr.handle_tsg_results(permutation_result)
     elif opts['kind'] == 'hotmaps1d':
-        permutation_result = multiprocess_permutation(bed_dict, mut_df, opts,
-                                                      frameshift_df, p_inactivating)
+        permutation_result, _ = multiprocess_permutation(bed_dict, mut_df, opts,
+                                                         frameshift_df, p_inactivating)
+        permutation_result = done_result + permutation_result
         permutation_df = pr.handle_hotmaps_results(permutation_result)
     elif opts['kind'] == 'protein':
-        permutation_result = multiprocess_permutation(bed_dict, mut_df, opts)
+        permutation_result, _ = multiprocess_permutation(bed_dict, mut_df, opts)
+        permutation_result = done_result + permutation_result
         permutation_df = pr.handle_protein_results(permutation_result)
     elif opts['kind'] == 'effect':
-        permutation_result = multiprocess_permutation(bed_dict, mut_df, opts)
+        permutation_result, _ = multiprocess_permutation(bed_dict, mut_df, opts)
+        permutation_result = done_result + permutation_result
         permutation_df = pr.handle_effect_results(permutation_result)
 
+    # flag genes that only have an upper bound p-value
+    if use_screen:
+        screened_out |= done_screened
+        permutation_df['screened out'] = permutation_df['gene'].isin(screened_out)
+
+    # save the state for the next incremental run
+    if state is not None:
+        state_key, fingerprints = state
+        incremental.write_state(opts['incremental'], state_key, fingerprints,
+                                permutation_result, screened_out if use_screen else ())
+
     # save output
     if opts['output']:
         permutation_df.to_csv(opts['output'], sep='\t', index=False)
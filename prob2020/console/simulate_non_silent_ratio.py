@@ -9,14 +9,15 @@ sys.path.append(os.path.join(file_dir, '../../'))
 # package import
 import prob2020.python.permutation as pm
 import prob2020.python.utils as utils
+import prob2020.python.genome as genome
 from prob2020.python.gene_sequence import GeneSequence
 import prob2020.cython.cutils as cutils
 import prob2020.python.mutation_context as mc
+import prob2020.python.context_cache as context_cache
 
 # external imports
 import numpy as np
 import pandas as pd
-import pysam
 from multiprocessing import Pool
 import argparse
 import logging
@@ -115,8 +116,9 @@ def singleprocess_permutation(info):
     current_chrom = bed_list[0].chrom
     logger.info('Working on chromosome: {0} . . .'.format(current_chrom))
     num_permutations = opts['num_permutations']
-    gene_fa = pysam.Fastafile(opts['input'])
+    gene_fa = genome.open_fasta(opts['input'])
     gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    contexts = context_cache.open_chromosome(opts, current_chrom)
 
     # variables for recording the actual observed number of non-silent
     # vs. silent mutations
@@ -135,6 +137,9 @@ def singleprocess_permutation(info):
         obs_df = pd.DataFrame(np.zeros((len(uniq_samp), len(cols))),
                               index=uniq_samp, columns=cols)
 
+    # the multinomial engine only simulates mutation type counts
+    use_multinomial = opts.get('engine', 'permutation') == 'multinomial' and not opts['score_dir']
+
     # go through each gene to permform simulation
     if opts['score_dir']:
         result = [[0, 0, 0, 0, 0, 0, 0, 0, 0] for k in range(num_permutations)]
@@ -142,7 +147,7 @@ def singleprocess_permutation(info):
         result = [[0, 0, 0, 0, 0, 0, 0] for k in range(num_permutations)]
     for bed in bed_list:
         # compute context counts and somatic bases for each context
-        gene_tuple = mc.compute_mutation_context(bed, gs, mut_df, opts)
+        gene_tuple = mc.compute_mutation_context(bed, gs, mut_df, opts, contexts)
         context_cts, context_to_mutations, mutations_df, gs, sc = gene_tuple
 
         if context_to_mutations:
@@ -210,20 +215,29 @@ def singleprocess_permutation(info):
                                                          #sc,  # sequence context obj
                                                          #gs,  # gene sequence obj
                                                          #num_permutations)
-            tmp_result = pm.summary_permutation(context_cts,
-                                                context_to_mutations,
-                                                sc,  # sequence context obj
-                                                gs,  # gene sequence obj
-                                                opts['score_dir'],
-                                                num_permutations)
+            if use_multinomial:
+                tmp_result = pm.non_silent_ratio_multinomial(context_cts,
+                                                             context_to_mutations,
+                                                             sc,  # sequence context obj
+                                                             gs,  # gene sequence obj
+                                                             num_permutations)
+                offset = 0
+            else:
+                tmp_result = pm.summary_permutation(context_cts,
+                                                    context_to_mutations,
+                                                    sc,  # sequence context obj
+                                                    gs,  # gene sequence obj
+                                                    opts['score_dir'],
+                                                    num_permutations)
+                offset = 3
         else:
             if opts['score_dir']:
                 tmp_result = [[0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0] for k in range(num_permutations)]
             else:
                 tmp_result = [[0, 0, 0, 0, 0, 0, 0, 0, 0, 0] for k in range(num_permutations)]
+            offset = 3
 
         # increment the non-silent/silent counts for each permutation
-        offset = 3
         for j in range(num_permutations):
             result[j][0] += tmp_result[j][0+offset]
             result[j][1] += tmp_result[j][1+offset]
@@ -236,7 +250,10 @@ def singleprocess_permutation(info):
                 result[j][7] += tmp_result[j][9+offset]
                 result[j][8] += tmp_result[j][10+offset]
 
+    if contexts is not None:
+        contexts.save()
     gene_fa.close()
+    genome.close_genomes()
     if not opts['by_sample']:
         obs_result = [obs_non_silent, obs_silent, obs_nonsense,
                       obs_loststop, obs_splice_site, obs_loststart, obs_missense]
@@ -267,7 +284,7 @@ def parse_arguments():
                         help='Path to log file. (accepts "stdout")')
 
     # program arguments
-    help_str = 'gene FASTA file from extract_gene_seq.py script'
+    help_str = 'gene FASTA or 2bit file from extract_gene_seq.py script'
     parser.add_argument('-i', '--input',
                         type=str, required=True,
                         help=help_str)
@@ -300,7 +317,18 @@ def parse_arguments():
     parser.add_argument('-c', '--context',
                         type=float, default=1.5,
                         help=help_str)
-    help_str = 'Directory containing score information in pickle files (Default: None).'
+    help_str = ('Method used to simulate the null distribution. "permutation" '
+                'simulates the position of every mutation, while "multinomial" '
+                'directly draws the number of mutations of each type and is '
+                'much faster. The multinomial engine does not support scores '
+                'and falls back to permutation if --score-dir is given '
+                '(Default: permutation).')
+    parser.add_argument('-e', '--engine',
+                        type=str, default='permutation',
+                        choices=['permutation', 'multinomial'],
+                        help=help_str)
+    help_str = ('Directory containing score information in pickle files, '
+                'or a score file created by convert_scores (Default: None).')
     parser.add_argument('-s', '--score-dir',
                         type=str, default=None,
                         help=help_str)
@@ -315,11 +343,18 @@ def parse_arguments():
                         action='store_true',
                         default=False,
                         help=help_str)
-    help_str = ('Path to the genome fasta file. Required if --use-unmapped flag '
-                'is used. (Default: None)')
+    help_str = ('Path to the genome fasta file, or a UCSC 2bit file. Required if '
+                '--use-unmapped flag is used. (Default: None)')
     parser.add_argument('-g', '--genome',
                         type=str, default='',
                         help=help_str)
+    help_str = ('Directory to cache the mutations of each gene after they are '
+                'mapped to the reference transcript and assigned a sequence '
+                'context, so later runs on the same input files skip this '
+                'step (Default: None).')
+    parser.add_argument('--context-cache',
+                        type=str, default='',
+                        help=help_str)
     help_str = 'Output text file of observed results (optional).'
     parser.add_argument('-oo', '--observed-output',
                         type=str, default=None,
@@ -358,12 +393,16 @@ def main(opts):
     if opts['score_dir']:
         cols.extend(['Total MGAEntropy', 'Total Missense VEST'])
 
+    if opts.get('engine') == 'multinomial' and opts['score_dir']:
+        logger.warning('The multinomial engine does not simulate scores. '
+                       'Falling back to the permutation engine.')
+
     # hack to index the FASTA file
-    gene_fa = pysam.Fastafile(opts['input'])
+    gene_fa = genome.open_fasta(opts['input'])
     gene_fa.close()
 
     # Get Mutations
-    mut_df = pd.read_csv(opts['mutations'], sep='\t')
+    mut_df = utils.read_mutations(opts['mutations'])
     orig_num_mut = len(mut_df)
     mut_df = mut_df.dropna(subset=['Tumor_Allele', 'Start_Position', 'Chromosome'])
     logger.info('Kept {0} mutations after droping mutations with missing '
@@ -375,6 +414,9 @@ def main(opts):
     # read in bed info
     bed_dict = utils.read_bed(opts['bed'], [])
 
+    # orient tumor alleles to the strand of their gene
+    mut_df = utils.add_strand_tumor_allele(mut_df, bed_dict)
+
     # perform permutation test
     #permutation_result = multiprocess_permutation(bed_dict, mut_df, opts)
     sim_result, obs_result = multiprocess_permutation(bed_dict, mut_df, opts)
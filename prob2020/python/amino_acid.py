@@ -1,5 +1,26 @@
 import re
 import logging
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+# precompiled patterns for HGVS protein syntax
+MISSENSE_PATTERN = re.compile(r'^([A-Z?])(\d+)([A-Z?])$')
+FRAME_SHIFT_PATTERN = re.compile(r'[A-Z]\d+[A-Z]+\*')
+LOST_STOP_PATTERN = re.compile(r'^\*\d+[A-Z?]+\*?$')
+PREMATURE_STOP_PATTERN = re.compile(r'.+\*(\d+)?$')
+LOST_STOP_MUTATED_PATTERN = re.compile(r'([A-Z?*]+)$')
+LOST_STOP_POS_PATTERN = re.compile(r'^\*(\d+)')
+AA_BEFORE_POS_PATTERN = re.compile(r'([A-Z])\d+')
+POS_AFTER_AA_PATTERN = re.compile(r'[A-Z](\d+)')
+INSERTED_PATTERN = re.compile(r'(?<=INS)[A-Z0-9?*]+')
+DELETED_PATTERN = re.compile(r'(?<=DEL)[A-Z]*')
+FRAME_SHIFT_POS_PATTERN = re.compile(r'[A-Z*](\d+)')
+FRAME_SHIFT_STOP_PATTERN = re.compile(r'\*>?(\d+)$')
+
+# bounded cache of parsed HGVS strings
+hgvs_cache_size = 10000
+_hgvs_cache = OrderedDict()
 
 
 class AminoAcid(object):
@@ -127,7 +148,7 @@ class AminoAcid(object):
     def __set_missense_status(self, hgvs_string):
         """Sets the self.is_missense flag."""
         # set missense status
-        if re.search('^[A-Z?]\d+[A-Z?]$', hgvs_string):
+        if MISSENSE_PATTERN.search(hgvs_string):
             self.is_missense = True
             self.is_non_silent = True
         else:
@@ -136,7 +157,7 @@ class AminoAcid(object):
     def __set_lost_start_status(self, hgvs_string):
         """Sets the self.is_lost_start flag."""
         # set is lost start status
-        mymatch = re.search('^([A-Z?])(\d+)([A-Z?])$', hgvs_string)
+        mymatch = MISSENSE_PATTERN.search(hgvs_string)
         if mymatch:
             grps = mymatch.groups()
             if int(grps[1]) == 1 and grps[0] != grps[2]:
@@ -152,7 +173,7 @@ class AminoAcid(object):
         if 'fs' in self.hgvs_original:
             self.is_frame_shift = True
             self.is_non_silent = True
-        elif re.search('[A-Z]\d+[A-Z]+\*', self.hgvs_original):
+        elif FRAME_SHIFT_PATTERN.search(self.hgvs_original):
             # it looks like some mutations dont follow the convention
             # of using 'fs' to indicate frame shift
             self.is_frame_shift = True
@@ -163,8 +184,7 @@ class AminoAcid(object):
     def __set_lost_stop_status(self, hgvs_string):
         """Check if the stop codon was mutated to something other than
         a stop codon."""
-        lost_stop_pattern = '^\*\d+[A-Z?]+\*?$'
-        if re.search(lost_stop_pattern, hgvs_string):
+        if LOST_STOP_PATTERN.search(hgvs_string):
             self.is_lost_stop = True
             self.is_non_silent = True
         else:
@@ -172,7 +192,7 @@ class AminoAcid(object):
 
     def __set_premature_stop_codon_status(self, hgvs_string):
         """Set whether there is a premature stop codon."""
-        if re.search('.+\*(\d+)?$', hgvs_string):
+        if PREMATURE_STOP_PATTERN.search(hgvs_string):
             self.is_premature_stop_codon = True
             self.is_non_silent = True
 
@@ -264,8 +284,8 @@ class AminoAcid(object):
             pass
         elif self.is_lost_stop:
             self.initial = aa_hgvs[0]
-            self.mutated = re.findall('([A-Z?*]+)$', aa_hgvs)[0]
-            self.pos = int(re.findall('^\*(\d+)', aa_hgvs)[0])
+            self.mutated = LOST_STOP_MUTATED_PATTERN.findall(aa_hgvs)[0]
+            self.pos = int(LOST_STOP_POS_PATTERN.findall(aa_hgvs)[0])
             self.stop_pos = None
         elif self.is_lost_start:
             self.initial = aa_hgvs[0]
@@ -284,9 +304,9 @@ class AminoAcid(object):
         elif self.is_indel:
             if self.is_insertion:
                 if not self.is_missing_info:
-                    self.initial = re.findall('([A-Z])\d+', aa_hgvs)[:2]  # first two
-                    self.pos = tuple(map(int, re.findall('[A-Z](\d+)', aa_hgvs)[:2]))  # first two
-                    self.mutated = re.findall('(?<=INS)[A-Z0-9?*]+', aa_hgvs)[0]
+                    self.initial = AA_BEFORE_POS_PATTERN.findall(aa_hgvs)[:2]  # first two
+                    self.pos = tuple(map(int, POS_AFTER_AA_PATTERN.findall(aa_hgvs)[:2]))  # first two
+                    self.mutated = INSERTED_PATTERN.findall(aa_hgvs)[0]
                     self.mutated = self.mutated.strip('?')  # remove the missing info '?'
                 else:
                     self.initial = ''
@@ -294,9 +314,9 @@ class AminoAcid(object):
                     self.mutated = ''
             elif self.is_deletion:
                 if not self.is_missing_info:
-                    self.initial = re.findall('([A-Z])\d+', aa_hgvs)
-                    self.pos = tuple(map(int, re.findall('[A-Z](\d+)', aa_hgvs)))
-                    self.mutated = re.findall('(?<=DEL)[A-Z]*', aa_hgvs)[0]
+                    self.initial = AA_BEFORE_POS_PATTERN.findall(aa_hgvs)
+                    self.pos = tuple(map(int, POS_AFTER_AA_PATTERN.findall(aa_hgvs)))
+                    self.mutated = DELETED_PATTERN.findall(aa_hgvs)[0]
                 else:
                     self.initial = ''
                     self.pos = tuple()
@@ -305,9 +325,9 @@ class AminoAcid(object):
             self.initial = aa_hgvs[0]
             self.mutated = ''
             try:
-                self.pos = int(re.findall('[A-Z*](\d+)', aa_hgvs)[0])
+                self.pos = int(FRAME_SHIFT_POS_PATTERN.findall(aa_hgvs)[0])
                 if self.is_premature_stop_codon:
-                    self.stop_pos = int(re.findall('\*>?(\d+)$', aa_hgvs)[0])
+                    self.stop_pos = int(FRAME_SHIFT_STOP_PATTERN.findall(aa_hgvs)[0])
                 else:
                     self.stop_pos = None
             except IndexError:
@@ -339,3 +359,71 @@ class AminoAcid(object):
             self.is_valid = False  # did not match any of the possible cases
             self.logger.debug('(Parsing-Problem) Invalid HGVS Amino Acid '
                               'syntax: ' + aa_hgvs)
+
+
+def parse_protein_change(hgvs):
+    """Parse an HGVS protein change, reusing the result for strings that
+    were recently parsed.
+
+    The returned AminoAcid may be shared between calls, so it should not
+    be modified.
+
+    Parameters
+    ----------
+    hgvs : str
+        HGVS protein change, e.g. "p.V600E"
+
+    Returns
+    -------
+    aa : AminoAcid
+        parsed protein change
+    """
+    if hgvs in _hgvs_cache:
+        aa = _hgvs_cache.pop(hgvs)
+    else:
+        aa = AminoAcid(hgvs)
+        if len(_hgvs_cache) >= hgvs_cache_size:
+            _hgvs_cache.popitem(last=False)
+    _hgvs_cache[hgvs] = aa
+    return aa
+
+
+def parse_protein_changes(hgvs_series):
+    """Parse a series of HGVS protein changes into columns. Each distinct
+    string is only parsed once.
+
+    Parameters
+    ----------
+    hgvs_series : pd.Series
+        HGVS protein changes
+
+    Returns
+    -------
+    aa_df : pd.DataFrame
+        columns for the codon position (NaN if not a single position),
+        initial and mutated amino acids, whether the syntax is valid,
+        whether information is missing and the mutation type. Has the
+        same index as hgvs_series.
+    """
+    codes, uniques = pd.factorize(hgvs_series)
+
+    # parse distinct strings, with a last row for missing values
+    parsed = [parse_protein_change(h) if isinstance(h, str) else AminoAcid(None)
+              for h in uniques] + [AminoAcid(None)]
+    pos = [(aa.pos if type(getattr(aa, 'pos', None)) is int else np.nan)
+           for aa in parsed]
+    uniq_df = pd.DataFrame({'pos': pos,
+                            'initial': [getattr(aa, 'initial', None) for aa in parsed],
+                            'mutated': [getattr(aa, 'mutated', None) for aa in parsed],
+                            'is_valid': [aa.is_valid for aa in parsed],
+                            'is_missing_info': [getattr(aa, 'is_missing_info', False)
+                                                for aa in parsed],
+                            'mutation_type': [aa.mutation_type for aa in parsed]},
+                           columns=['pos', 'initial', 'mutated', 'is_valid',
+                                    'is_missing_info', 'mutation_type'])
+
+    # expand back to the original rows
+    codes[codes < 0] = len(uniques)
+    aa_df = uniq_df.iloc[codes]
+    aa_df.index = hgvs_series.index
+    return aa_df
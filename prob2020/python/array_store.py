@@ -0,0 +1,110 @@
+"""This module reads and writes many named numpy arrays in a single file.
+
+The file starts with a JSON index recording the data type, shape and offset
+of each array, followed by the raw array data. Arrays are read through a
+memory map, so the operating system shares the pages between worker
+processes instead of each worker holding its own copy.
+"""
+import numpy as np
+import json
+import struct
+
+# identifies the file format
+MAGIC = b'P2020ARR'
+
+# array data is aligned to this many bytes
+ALIGNMENT = 64
+
+
+def _pad_len(nbytes):
+    return (-nbytes) % ALIGNMENT
+
+
+def write_array_store(path, arrays, metadata=None):
+    """Writes named arrays into a single file.
+
+    Parameters
+    ----------
+    path : str
+        path of output file
+    arrays : dict
+        dictionary mapping array names to numpy arrays
+    metadata : dict or None
+        additional JSON serializable information to save in the index
+    """
+    # figure out where each array will go
+    index, offset = {}, 0
+    names = list(arrays.keys())
+    for name in names:
+        arr = np.ascontiguousarray(arrays[name])
+        index[name] = [arr.dtype.str, list(arr.shape), offset]
+        offset += arr.nbytes + _pad_len(arr.nbytes)
+    header = json.dumps({'arrays': index, 'metadata': metadata or {}}).encode('utf-8')
+
+    with open(path, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack('<Q', len(header)))
+        handle.write(header)
+        handle.write(b'\0' * _pad_len(len(MAGIC) + 8 + len(header)))
+        for name in names:
+            arr = np.ascontiguousarray(arrays[name])
+            handle.write(arr.tobytes())
+            handle.write(b'\0' * _pad_len(arr.nbytes))
+
+
+def is_array_store(path):
+    """Checks whether a path is a file written by write_array_store."""
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+class ArrayStore(object):
+    """Read-only access to the arrays in a file written by write_array_store.
+
+    Arrays are returned as views into a memory map of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as handle:
+            if handle.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{0} is not an array store file'.format(path))
+            header_len = struct.unpack('<Q', handle.read(8))[0]
+            header = json.loads(handle.read(header_len).decode('utf-8'))
+        self.index = header['arrays']
+        self.metadata = header['metadata']
+        data_start = len(MAGIC) + 8 + header_len
+        data_start += _pad_len(data_start)
+        nbytes = max(self._nbytes(name) + self.index[name][2] for name in self.index) \
+            if self.index else 0
+        if nbytes:
+            self._data = np.memmap(path, dtype=np.uint8, mode='r',
+                                   offset=data_start, shape=(nbytes,))
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def _nbytes(self, name):
+        dtype, shape, offset = self.index[name]
+        return int(np.dtype(dtype).itemsize * np.prod(shape, dtype=np.int64))
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def get(self, name, default=None):
+        """Returns the named array or default if it is not in the file."""
+        if name not in self.index:
+            return default
+        dtype, shape, offset = self.index[name]
+        nbytes = self._nbytes(name)
+        return self._data[offset:offset+nbytes].view(np.dtype(dtype)).reshape(shape)
+
+    def __getitem__(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+        return self.get(name)
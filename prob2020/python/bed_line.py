@@ -1,5 +1,6 @@
 """Parses an individual line in a BED file."""
 from collections import namedtuple
+import numpy as np
 import logging
 
 # Initialize a global named tuple to make handling BED lines less awkward
@@ -18,6 +19,10 @@ class BedLine(object):
     Genomic positions can also be queried against the BedLine object to retreive
     a relative position along the CDS.
 
+    Exons are stored as arrays of start positions, end positions and CDS
+    offsets, and positions are converted between the genome and the CDS
+    arithmetically, so a BedLine stays small even for long genes.
+
     Example
     -------
 
@@ -29,8 +34,14 @@ class BedLine(object):
         '+'
         >>> bed.query_position('+', 'chr3', 41265559)
         0
+        >>> int(bed.seq_to_genome(0))
+        41265559
 
     """
+    __slots__ = ('gene_name', 'chrom', 'chrom_start', 'strand',
+                 'exon_starts', 'exon_ends', 'exon_offsets',
+                 'num_exons', 'cds_len', 'five_ss_len', 'three_ss_len',
+                 'pos2ss')
 
     def __init__(self, line):
         # make input a list of strings
@@ -41,20 +52,21 @@ class BedLine(object):
         else:
             raise ValueError('Expected either a string or a list of strings')
 
-        # bed tuple maintains the orginal data from the bed line
+        # bed tuple names the fields of the bed line, only the needed
+        # fields are kept
         tmp = dict(zip(BedTuple._fields, line))
-        self.bed_tuple = BedTuple(**tmp)
+        bed_tuple = BedTuple(**tmp)
 
         # convenience attributes
-        self.gene_name = self.bed_tuple.name
-        self.chrom = self.bed_tuple.chrom
-        self.chrom_start = int(self.bed_tuple.chromStart)
-        self.strand = self.bed_tuple.strand
+        self.gene_name = bed_tuple.name
+        self.chrom = bed_tuple.chrom
+        self.chrom_start = int(bed_tuple.chromStart)
+        self.strand = bed_tuple.strand
 
         # set exons
-        self._init_exons()
+        self._init_exons(bed_tuple)
 
-    def _filter_utr(self, ex):
+    def _filter_utr(self, ex, coding_start, coding_end):
         """Filter out UTR regions from the exon list (ie retain only coding regions).
 
         Coding regions are defined by the thickStart and thickEnd attributes.
@@ -63,6 +75,10 @@ class BedLine(object):
         ----------
         ex : list of tuples
             list of exon positions, [(ex1_start, ex1_end), ...]
+        coding_start : int
+            start of the coding region (thickStart)
+        coding_end : int
+            end of the coding region (thickEnd)
 
         Returns
         -------
@@ -70,8 +86,6 @@ class BedLine(object):
             exons with UTR regions "chopped" out
         """
         # define coding region
-        coding_start = int(self.bed_tuple.thickStart)
-        coding_end = int(self.bed_tuple.thickEnd)
         if (coding_end - coding_start) < 3:
             # coding regions should have at least one codon, otherwise the
             # region is invalid and does not indicate an actually coding region
@@ -106,45 +120,50 @@ class BedLine(object):
                 pass
         return filtered_exons
 
-    def _init_exons(self):
-        """Sets a list of position intervals for each exon.
+    def _init_exons(self, bed_tuple):
+        """Sets arrays of the start, end and CDS offset of each exon.
 
         Only coding regions as defined by thickStart and thickEnd are kept.
-        Exons are stored in the self.exons attribute.
         """
         exon_starts = [self.chrom_start + int(s)
-                       for s in self.bed_tuple.blockStarts.strip(',').split(',')]
-        exon_sizes = list(map(int, self.bed_tuple.blockSizes.strip(',').split(',')))
+                       for s in bed_tuple.blockStarts.strip(',').split(',')]
+        exon_sizes = list(map(int, bed_tuple.blockSizes.strip(',').split(',')))
 
         # get chromosome intervals
         exons = [(exon_starts[i], exon_starts[i] + exon_sizes[i])
                  for i in range(len(exon_starts))]
-        no_utr_exons = self._filter_utr(exons)
-        self.exons = no_utr_exons
-        self.exon_lens = [e[1] - e[0] for e in self.exons]
-        self.num_exons = len(self.exons)
-        self.cds_len = sum(self.exon_lens)
+        no_utr_exons = self._filter_utr(exons,
+                                        int(bed_tuple.thickStart),
+                                        int(bed_tuple.thickEnd))
+        self.exon_starts = np.array([e[0] for e in no_utr_exons], dtype=np.int64)
+        self.exon_ends = np.array([e[1] for e in no_utr_exons], dtype=np.int64)
+        exon_lens = self.exon_ends - self.exon_starts
+        self.exon_offsets = np.cumsum(exon_lens) - exon_lens
+        self.num_exons = len(no_utr_exons)
+        self.cds_len = int(exon_lens.sum())
         self.five_ss_len = 2*(self.num_exons-1)
         self.three_ss_len = 2*(self.num_exons-1)
-        self._init_splice_site_pos()
-
-    def _init_splice_site_pos(self):
-        # dictionary mapping internal position format to position
-        # in list of 5'/3' splice sites
-        self.pos2ss = {}
-        tmp_pos = self.cds_len
-
-        # init 5' splice site positions
-        for i in range(self.num_exons-1):
-            self.pos2ss[tmp_pos] = ("5'", i, 1)
-            self.pos2ss[tmp_pos+1] = ("5'", i, 2)
-            tmp_pos+=2
-
-        # init 3' splice site positions
-        for i in range(self.num_exons-1):
-            self.pos2ss[tmp_pos] = ("3'", i, 1)
-            self.pos2ss[tmp_pos+1] = ("3'", i, 2)
-            tmp_pos+=2
+
+        # maps splice site positions in the sequence to the splice site
+        # type, the index of the splice site, and the position (1 or 2)
+        # within the splice site, built once since it is used for every
+        # simulated mutation
+        self.pos2ss = SpliceSitePositions(self.cds_len, self.five_ss_len, self.three_ss_len)
+
+    @property
+    def exons(self):
+        """List of (start, end) positions of exons, UTRs excluded."""
+        return list(zip(self.exon_starts.tolist(), self.exon_ends.tolist()))
+
+    @property
+    def exon_lens(self):
+        """List of exon lengths, UTRs excluded."""
+        return (self.exon_ends - self.exon_starts).tolist()
+
+    @property
+    def seqpos2genome(self):
+        """Maps positions in the sequence to genome coordinates."""
+        return SeqPositionMap(self)
 
     def get_exons(self):
         """Returns the list of exons that have UTR regions filtered out."""
@@ -155,46 +174,121 @@ class BedLine(object):
         return self.num_exons
 
     def init_genome_coordinates(self) :
-        """Creates the self.seqpos2genome dictionary that converts positions
-        relative to the sequence to genome coordinates."""
-        self.seqpos2genome = {}
-
-        # record genome positions for each sequence position
-        seq_pos = 0
-        for estart, eend in self.exons:
-            for genome_pos in range(estart, eend):
-                if self.strand == '+':
-                    self.seqpos2genome[seq_pos] = genome_pos
-                elif self.strand == '-':
-                    tmp = self.cds_len - seq_pos - 1
-                    self.seqpos2genome[tmp] = genome_pos
-                seq_pos += 1
-
-        # recode 5' splice site locations
-        for i in range(0, self.five_ss_len):
-            seq_pos = self.cds_len + i
-            ss_ix = i // 2  # the ss_ix'th 5'ss starting from upstream tx
-            pos_in_ss = i % 2  # whether first/second nuc in splice site
-
-            # determine genome coordinates for 5' splice site
-            if self.strand == '+':
-                self.seqpos2genome[seq_pos] = self.exons[ss_ix][1] + pos_in_ss
-            else:
-                exon_pos = -1 - ss_ix
-                self.seqpos2genome[seq_pos] = self.exons[exon_pos][0] - pos_in_ss - 1
-
-        # recode 3' splice site locations
-        for i in range(0, self.three_ss_len):
-            seq_pos = self.cds_len + self.five_ss_len + i
-            ss_ix = i // 2  # the ss_ix'th 3'ss starting from upstream tx
-            pos_in_ss = i % 2  # whether first/second nuc in splice site
-
-            # determine genome coordinates for 3' splice site
-            if self.strand == '+':
-                self.seqpos2genome[seq_pos] = self.exons[ss_ix+1][0] - 2 + pos_in_ss
-            else:
-                exon_pos = -1 - ss_ix
-                self.seqpos2genome[seq_pos] = self.exons[exon_pos-1][1] + 1 - pos_in_ss
+        """Kept for backwards compatibility. Sequence positions are converted
+        to genome coordinates on demand by seq_to_genome."""
+        pass
+
+    def seq_to_genome(self, seq_pos):
+        """Converts positions relative to the sequence to genome coordinates.
+
+        Sequence positions follow the gene sequence: the CDS, then the 5'
+        splice sites, then the 3' splice sites.
+
+        Parameters
+        ----------
+        seq_pos : int or np.array
+            0-based positions relative to the sequence
+
+        Returns
+        -------
+        genome_pos : int or np.array
+            0-based genome coordinates
+        """
+        pos = np.asarray(seq_pos, dtype=np.int64)
+        if np.any((pos < 0) | (pos >= self.cds_len + self.five_ss_len + self.three_ss_len)):
+            raise KeyError('Sequence position out of range for {0}'.format(self.gene_name))
+        genome_pos = np.zeros(pos.shape, dtype=np.int64)
+        is_plus = self.strand == '+'
+
+        # coding region
+        is_cds = pos < self.cds_len
+        cds_pos = pos[is_cds] if is_plus else self.cds_len - pos[is_cds] - 1
+        exon_ix = np.searchsorted(self.exon_offsets, cds_pos, side='right') - 1
+        genome_pos[is_cds] = self.exon_starts[exon_ix] + cds_pos - self.exon_offsets[exon_ix]
+
+        # 5' splice sites
+        ss_offset = pos - self.cds_len
+        is_5ss = (ss_offset >= 0) & (ss_offset < self.five_ss_len)
+        ss_ix, pos_in_ss = np.divmod(ss_offset[is_5ss], 2)
+        if is_plus:
+            genome_pos[is_5ss] = self.exon_ends[ss_ix] + pos_in_ss
+        else:
+            genome_pos[is_5ss] = self.exon_starts[-1-ss_ix] - pos_in_ss - 1
+
+        # 3' splice sites
+        ss_offset = ss_offset - self.five_ss_len
+        is_3ss = ss_offset >= 0
+        ss_ix, pos_in_ss = np.divmod(ss_offset[is_3ss], 2)
+        if is_plus:
+            genome_pos[is_3ss] = self.exon_starts[ss_ix+1] - 2 + pos_in_ss
+        else:
+            genome_pos[is_3ss] = self.exon_ends[-2-ss_ix] + 1 - pos_in_ss
+
+        if genome_pos.ndim == 0:
+            return int(genome_pos)
+        return genome_pos
+
+    def genome_to_seq(self, genome_coord, strand=None):
+        """Converts genome coordinates to positions relative to the sequence.
+
+        Parameters
+        ----------
+        genome_coord : int or np.array
+            0-based genome coordinates
+        strand : str or None
+            strand of the gene, defaults to the strand of the BED line
+
+        Returns
+        -------
+        pos : int or np.array
+            positions in the sequence, -1 if the coordinate is not in the
+            coding region or a splice site
+        """
+        if strand is None:
+            strand = self.strand
+        coord = np.asarray(genome_coord, dtype=np.int64)
+        pos = np.full(coord.shape, -1, dtype=np.int64)
+        if not self.num_exons:
+            return int(pos) if pos.ndim == 0 else pos
+
+        # last exon starting at or before the coordinate, or the first exon
+        n = self.num_exons
+        exon_ix = np.maximum(np.searchsorted(self.exon_starts, coord, side='right') - 1, 0)
+        estart = self.exon_starts[exon_ix]
+        eend = self.exon_ends[exon_ix]
+        next_ix = np.minimum(exon_ix + 1, n - 1)
+        next_start = self.exon_starts[next_ix]
+
+        # in coding region
+        in_exon = (estart <= coord) & (coord < eend)
+        cds_pos = self.exon_offsets[exon_ix] + coord - estart
+        if strand == '-':
+            cds_pos = self.cds_len - cds_pos - 1  # flip coords because neg strand
+        pos = np.where(in_exon, cds_pos, pos)
+
+        # in splice site after the exon
+        in_after = ~in_exon & (eend <= coord) & (coord < eend + 2) & (exon_ix != n-1)
+        if strand == '+':
+            after_pos = self.cds_len + 2*exon_ix + (coord - eend)
+        else:
+            after_pos = self.cds_len + self.five_ss_len + 2*(n-(exon_ix+2)) + (coord - eend)
+        pos = np.where(in_after, after_pos, pos)
+
+        # in splice site before the next exon, or before the first exon
+        # for coordinates upstream of the gene
+        before_ix = np.where(coord < estart, exon_ix, next_ix)
+        before_start = np.where(coord < estart, estart, next_start)
+        in_before = ~in_exon & ~in_after & (before_start - 2 <= coord) & \
+            (coord < before_start) & (before_ix != 0)
+        if strand == '-':
+            before_pos = self.cds_len + 2*(n-(before_ix+2)) + (coord - (before_start - 2))
+        else:
+            before_pos = self.cds_len + self.five_ss_len + 2*(before_ix-1) + (coord - (before_start - 2))
+        pos = np.where(in_before, before_pos, pos)
+
+        if pos.ndim == 0:
+            return int(pos)
+        return pos
 
     def query_position(self, strand, chr, genome_coord):
         """Provides the relative position on the coding sequence for a given
@@ -231,30 +325,50 @@ class BedLine(object):
                 return None
 
         # return position if contained within coding region or splice site
-        for i, (estart, eend) in enumerate(self.exons):
-            # in coding region
-            if estart <= genome_coord < eend:
-                if strand == '+':
-                    prev_lens = sum(self.exon_lens[:i])  # previous exon lengths
-                    pos = prev_lens + (genome_coord - estart)
-                elif strand == '-':
-                    prev_lens = sum(self.exon_lens[:i])  # previous exon lengths
-                    pos = prev_lens + (genome_coord - estart)
-                    pos = self.cds_len - pos - 1  # flip coords because neg strand
-                return pos
-            # in splice site
-            elif (eend <= genome_coord < eend + 2) and i != self.num_exons-1:
-                if strand == '+':
-                    pos = self.cds_len + 2*i + (genome_coord - eend)
-                elif strand == '-':
-                    pos = self.cds_len + self.five_ss_len + 2*(self.num_exons-(i+2)) + (genome_coord - eend)
-                return pos
-            # in splice site
-            elif (estart - 2 <= genome_coord < estart) and i != 0:
-                if strand == '-':
-                    pos = self.cds_len + 2*(self.num_exons-(i+2)) + (genome_coord - (estart - 2))
-                elif strand == '+':
-                    pos = self.cds_len + self.five_ss_len + 2*(i-1) + (genome_coord - (estart - 2))
-                return pos
-
+        pos = self.genome_to_seq(genome_coord, strand)
+        if pos < 0:
+            return None
         return pos
+
+
+class SpliceSitePositions(object):
+    """Read-only mapping from splice site positions in the gene sequence to
+    (splice site type, splice site index, position in splice site)."""
+    __slots__ = ('cds_len', 'five_ss_len', 'three_ss_len')
+
+    def __init__(self, cds_len, five_ss_len, three_ss_len):
+        self.cds_len = cds_len
+        self.five_ss_len = five_ss_len
+        self.three_ss_len = three_ss_len
+
+    def __getitem__(self, pos):
+        ss_offset = pos - self.cds_len
+        if 0 <= ss_offset < self.five_ss_len:
+            return ("5'", ss_offset // 2, ss_offset % 2 + 1)
+        ss_offset -= self.five_ss_len
+        if 0 <= ss_offset < self.three_ss_len:
+            return ("3'", ss_offset // 2, ss_offset % 2 + 1)
+        raise KeyError(pos)
+
+    def __contains__(self, pos):
+        return 0 <= pos - self.cds_len < self.five_ss_len + self.three_ss_len
+
+    def __len__(self):
+        return self.five_ss_len + self.three_ss_len
+
+
+class SeqPositionMap(object):
+    """Read-only mapping from sequence positions to genome coordinates."""
+    __slots__ = ('bed',)
+
+    def __init__(self, bed):
+        self.bed = bed
+
+    def __getitem__(self, pos):
+        return self.bed.seq_to_genome(pos)
+
+    def __contains__(self, pos):
+        return 0 <= pos < len(self)
+
+    def __len__(self):
+        return self.bed.cds_len + self.bed.five_ss_len + self.bed.three_ss_len
@@ -0,0 +1,178 @@
+"""This module caches the normalized mutations of each gene on disk.
+
+Before a gene is tested or simulated, its mutations are mapped onto the
+reference transcript, unmapped mutations are recovered and each mutation is
+assigned a nucleotide context. The normalized mutations only depend on the
+mutation, BED and gene sequence files and a few options, so they are saved
+once per cohort and loaded by later runs of any of the tools.
+
+The cache is a directory named by a hash of the inputs, holding one
+array_store file for each chromosome.
+"""
+import prob2020.python.array_store as array_store
+import prob2020.python.utils as utils
+import pandas as pd
+import numpy as np
+import hashlib
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)  # module logger
+
+# change when the normalized format changes, so old files are not used
+CACHE_VERSION = 1
+
+# options that change the normalized mutations
+context_opts = ['context', 'use_unmapped', 'genome', 'unique']
+
+# input files, identified by path, size and modification time
+file_opts = ['mutations', 'bed', 'input']
+
+# columns of normalized mutations mapped to the reference transcript
+MAPPED_COLUMNS = ['Coding Position', 'Context', 'Tumor_Allele',
+                  'Tumor_Sample', 'Tumor_Type']
+
+# keys of normalized mutations not mapped to the reference transcript
+UNMAPPED_KEYS = ['Context', 'Reference AA', 'Codon Pos', 'Somatic AA',
+                 'Tumor_Allele', 'Tumor_Sample', 'Tumor_Type']
+
+
+def cache_key(opts):
+    """Makes the key identifying the normalized mutations of a cohort.
+
+    Parameters
+    ----------
+    opts : dict
+        command line options
+
+    Returns
+    -------
+    key : str
+        hex digest of the input files and options
+    """
+    config = {k: opts.get(k) for k in context_opts}
+    config['version'] = CACHE_VERSION
+    for k in file_opts:
+        path = opts.get(k)
+        if isinstance(path, str) and os.path.isfile(path):
+            stat = os.stat(path)
+            config[k] = [os.path.abspath(path), stat.st_size, utils.file_mtime_ns(stat)]
+    config_str = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(config_str.encode()).hexdigest()
+
+
+def open_chromosome(opts, chrom):
+    """Opens the cached normalized mutations for a chromosome.
+
+    Returns
+    -------
+    contexts : ChromosomeContexts or None
+        None if the context_cache option is not set
+    """
+    if not opts.get('context_cache'):
+        return None
+    cache_dir = os.path.join(opts['context_cache'], cache_key(opts))
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            pass  # created by another process
+    return ChromosomeContexts(os.path.join(cache_dir, chrom + '.arr'))
+
+
+def _codon_pos(value):
+    """Codon positions of unmapped mutations are integers, or 'Splice_Site'
+    for splice site mutations."""
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def _str_arrays(values):
+    """Converts a list of strings to a numpy array of strings and a mask of
+    missing values, which are saved as empty strings."""
+    missing = np.array([pd.isnull(v) for v in values], dtype=bool)
+    values = ['' if m else str(v) for v, m in zip(values, missing)]
+    strings = np.array(values, dtype=str) if values else np.zeros(0, dtype='<U1')
+    return strings, missing
+
+
+def _str_list(strings, missing):
+    """Converts saved strings back to a list, restoring missing values as
+    NaN."""
+    return [np.nan if m else v for v, m in zip(strings.tolist(), missing.tolist())]
+
+
+class ChromosomeContexts(object):
+    """Normalized mutations of the genes on a chromosome.
+
+    Genes are loaded from the cache file if present. Genes that are added
+    are written back by save, so a file grows to hold every gene that has
+    been normalized on the chromosome.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._genes = {}
+        self._num_added = 0
+        if array_store.is_array_store(path):
+            self._load()
+
+    def _load(self):
+        store = array_store.ArrayStore(self.path)
+        mapped_offsets = store['mapped_offsets']
+        unmapped_offsets = store['unmapped_offsets']
+        coding_pos = store['mapped Coding Position']
+        mapped_cols = {c: (store['mapped ' + c], store['mapped ' + c + ' missing'])
+                       for c in MAPPED_COLUMNS[1:]}
+        unmapped_cols = {k: (store['unmapped ' + k], store['unmapped ' + k + ' missing'])
+                         for k in UNMAPPED_KEYS}
+        for i, gene in enumerate(store.metadata['genes']):
+            start, end = mapped_offsets[i], mapped_offsets[i+1]
+            mapped = {c: _str_list(strings[start:end], missing[start:end])
+                      for c, (strings, missing) in mapped_cols.items()}
+            mapped['Coding Position'] = coding_pos[start:end].astype(int)
+            mut_info = pd.DataFrame(mapped, columns=MAPPED_COLUMNS)
+            start, end = unmapped_offsets[i], unmapped_offsets[i+1]
+            unmapped_mut_info = {k: _str_list(strings[start:end], missing[start:end])
+                                 for k, (strings, missing) in unmapped_cols.items()}
+            unmapped_mut_info['Codon Pos'] = [_codon_pos(p) for p in unmapped_mut_info['Codon Pos']]
+            self._genes[gene] = (mut_info, unmapped_mut_info,
+                                 store.metadata['total'][i])
+
+    def get(self, gene):
+        """Normalized mutations of a gene, or None if it is not cached."""
+        return self._genes.get(gene)
+
+    def add(self, gene, normalized):
+        """Adds the normalized mutations of a gene, a tuple of the mapped
+        mutations, the unmapped mutations and the total number of
+        mutations."""
+        self._genes[gene] = normalized
+        self._num_added += 1
+
+    def save(self):
+        """Writes the cache file if genes were added."""
+        if not self._num_added:
+            return
+        genes = list(self._genes.keys())
+        mapped = [self._genes[g][0] for g in genes]
+        unmapped = [self._genes[g][1] for g in genes]
+        arrays = {
+            'mapped_offsets': np.concatenate([[0], np.cumsum([len(m) for m in mapped])]),
+            'unmapped_offsets': np.concatenate([[0], np.cumsum([len(u['Context']) for u in unmapped])]),
+            'mapped Coding Position': np.array([p for m in mapped for p in m['Coding Position']],
+                                               dtype=np.int64),
+        }
+        for c in MAPPED_COLUMNS[1:]:
+            strings, missing = _str_arrays([v for m in mapped for v in m[c]])
+            arrays['mapped ' + c], arrays['mapped ' + c + ' missing'] = strings, missing
+        for k in UNMAPPED_KEYS:
+            strings, missing = _str_arrays([v for u in unmapped for v in u[k]])
+            arrays['unmapped ' + k], arrays['unmapped ' + k + ' missing'] = strings, missing
+        metadata = {'genes': genes,
+                    'total': [int(self._genes[g][2]) for g in genes]}
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        array_store.write_array_store(tmp_path, arrays, metadata)
+        utils.replace_file(tmp_path, self.path)
+        self._num_added = 0
+        logger.debug('Saved normalized mutations of {0} genes to {1}.'.format(len(genes), self.path))
@@ -1,6 +1,114 @@
 import prob2020.python.utils as utils
 import prob2020.python.indel as indel
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+
+# positions are combined with a gene index into a single sort key
+GENE_KEY_SHIFT = 2**32
+
+
+def _read_genes(bed_path):
+    """Reads genes from a BED file, keeping the last line of each gene.
+
+    Parameters
+    ----------
+    bed_path : str
+        path to BED file
+
+    Returns
+    -------
+    bed_list : list of BedLine
+        one BedLine per gene, in order of first appearance
+    """
+    genes = OrderedDict()
+    for bed in utils.bed_generator(bed_path):
+        genes[bed.gene_name] = bed
+    return list(genes.values())
+
+
+def _gene_regions(bed_list):
+    """Sort keys for the regions of each gene that frameshifts can map onto.
+
+    A region is an exon along with its 2 bp splice sites. Splice sites are
+    only included between exons, matching BedLine.query_position.
+
+    Parameters
+    ----------
+    bed_list : list of BedLine
+        genes, the position in the list is used as the gene index
+
+    Returns
+    -------
+    start_keys : np.array
+        sorted keys of region starts
+    end_keys : np.array
+        running maximum of the keys of region ends, so that overlapping
+        regions are handled when searching by start
+    """
+    gene_ixs, starts, ends = [], [], []
+    for i, bed in enumerate(bed_list):
+        if not bed.num_exons:
+            continue
+        tmp_starts = bed.exon_starts.copy()
+        tmp_ends = bed.exon_ends.copy()
+        tmp_starts[1:] = np.maximum(tmp_starts[1:] - 2, 0)
+        tmp_ends[:-1] += 2
+        gene_ixs.append(np.full(bed.num_exons, i, dtype=np.int64))
+        starts.append(tmp_starts)
+        ends.append(tmp_ends)
+    if not gene_ixs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    gene_ixs = np.concatenate(gene_ixs)
+    start_keys = gene_ixs*GENE_KEY_SHIFT + np.concatenate(starts)
+    end_keys = gene_ixs*GENE_KEY_SHIFT + np.concatenate(ends)
+
+    # sort regions by gene, then start position
+    order = np.argsort(start_keys, kind='mergesort')
+    return start_keys[order], np.maximum.accumulate(end_keys[order])
+
+
+def map_frameshifts(fs_df, bed_list):
+    """Finds which frameshifts map onto the reference transcript of their
+    gene.
+
+    A frameshift maps onto the transcript if either its start or end
+    position is in a coding region or splice site. All frameshifts are
+    joined against the sorted gene regions in a single pass.
+
+    Parameters
+    ----------
+    fs_df : pd.DataFrame
+        frameshift mutations with 0-based start positions
+    bed_list : list of BedLine
+        genes, the position in the list is used as the gene index
+
+    Returns
+    -------
+    gene_ixs : np.array
+        index of the gene in bed_list for each frameshift, -1 if the gene is
+        not in bed_list
+    is_mapped : np.array
+        whether each frameshift maps onto its gene
+    """
+    name2ix = {bed.gene_name: i for i, bed in enumerate(bed_list)}
+    gene_ixs = fs_df['Gene'].map(name2ix).fillna(-1).astype(np.int64).values
+    start_keys, end_keys = _gene_regions(bed_list)
+
+    is_mapped = np.zeros(len(fs_df), dtype=bool)
+    if not len(start_keys):
+        return gene_ixs, is_mapped
+    has_gene = gene_ixs >= 0
+    for col in ['Start_Position', 'End_Position']:
+        pos = fs_df[col].astype(float).values
+        valid = has_gene & ~np.isnan(pos)
+        query_keys = gene_ixs[valid]*GENE_KEY_SHIFT + pos[valid].astype(np.int64)
+
+        # find the last region starting at or before each position
+        region_ixs = np.searchsorted(start_keys, query_keys, side='right') - 1
+        in_region = (region_ixs >= 0) & (query_keys < end_keys[np.maximum(region_ixs, 0)])
+        is_mapped[np.flatnonzero(valid)[in_region]] = True
+    return gene_ixs, is_mapped
 
 
 def count_frameshift_total(mut_df,
@@ -30,36 +138,24 @@ def count_frameshift_total(mut_df,
     if to_zero_based:
         mut_df['Start_Position'] = mut_df['Start_Position'] - 1
 
-    fs_cts = {}  # frameshift count information for each gene
     fs_df = indel.keep_frameshifts(mut_df)
+    bed_list = _read_genes(bed_path)
+    gene_ixs, is_mapped = map_frameshifts(fs_df, bed_list)
 
-    for bed in utils.bed_generator(bed_path):
-        gene_df = fs_df[fs_df['Gene']==bed.gene_name]
-
-        # find it frameshift actually is on gene annotation
-        fs_pos = []
-        for ix, row in gene_df.iterrows():
-            indel_pos = [row['Start_Position'], row['End_Position']]
-            coding_pos = bed.query_position(bed.strand, row['Chromosome'], indel_pos)
-            fs_pos.append(coding_pos)
+    # count frameshifts for each gene
+    num_genes = len(bed_list)
+    has_gene = gene_ixs >= 0
+    total_fs = np.bincount(gene_ixs[has_gene], minlength=num_genes)
+    unmapped_fs = np.bincount(gene_ixs[has_gene & ~is_mapped], minlength=num_genes)
 
-        # mark frameshifts that could not be mapped to reference tx
-        gene_df['unmapped'] = [(1 if x is None else 0) for x in fs_pos]
-        total_fs = len(gene_df)
-        unmapped_fs = len(gene_df[gene_df['unmapped']==1])
-
-        # filter out frameshifts that did not match reference tx
-        if not use_unmapped:
-            gene_df = gene_df[gene_df['unmapped']==0]
-            total_fs -= unmapped_fs
-
-        info = [total_fs, unmapped_fs,]
-        fs_cts[bed.gene_name] = info
+    # filter out frameshifts that did not match reference tx
+    if not use_unmapped:
+        total_fs -= unmapped_fs
 
     # prepare counts into a dataframe
-    fs_cts_df = pd.DataFrame.from_dict(fs_cts, orient='index')
-    cols = ['total', 'unmapped',]
-    fs_cts_df.columns = cols
+    fs_cts_df = pd.DataFrame({'total': total_fs, 'unmapped': unmapped_fs},
+                             index=[bed.gene_name for bed in bed_list],
+                             columns=['total', 'unmapped'])
 
     return fs_cts_df
 
@@ -102,46 +198,35 @@ def count_frameshift_bins(mut_df,
     if num_samples is None:
         num_samples = mut_df['Tumor_Sample'].nunique()
 
-    fs_cts = {}  # frameshift count information for each gene
     fs_df = indel.keep_frameshifts(mut_df)
     fs_lens = indel.get_frameshift_lengths(num_bins)
-
-    for bed in utils.bed_generator(bed_path):
-        gene_df = fs_df[fs_df['Gene']==bed.gene_name]
-
-        # find it frameshift actually is on gene annotation
-        fs_pos = []
-        for ix, row in gene_df.iterrows():
-            indel_pos = [row['Start_Position'], row['End_Position']]
-            coding_pos = bed.query_position(bed.strand, row['Chromosome'], indel_pos)
-            fs_pos.append(coding_pos)
-
-        # mark frameshifts that could not be mapped to reference tx
-        gene_df['unmapped'] = [(1 if x is None else 0) for x in fs_pos]
-        total_fs = len(gene_df)
-        unmapped_fs = len(gene_df[gene_df['unmapped']==1])
-
-        # filter out frameshifts that did not match reference tx
-        if not use_unmapped:
-            gene_df = gene_df[gene_df['unmapped']==0]
-
-        # count all frameshifts
-        all_len_counts = gene_df['indel len'].value_counts()
-        all_lens = list(set(all_len_counts.index) | set(fs_lens))
-        all_len_counts = all_len_counts.reindex(all_lens).fillna(0)
-        # count only in specified lengths
-        fs_len_cts = all_len_counts.reindex(fs_lens)
-        fs_len_cts[max(fs_len_cts.index)] = all_len_counts[all_len_counts.index>=fs_lens[-1]].sum()
-        fs_len_cts = fs_len_cts.fillna(0).astype(int)
-
-        # get length of gene
-        gene_len = bed.cds_len
-        gene_bases_at_risk = gene_len * num_samples
-
-        info = [total_fs, unmapped_fs, gene_len, gene_bases_at_risk]
-        fs_cts[bed.gene_name] = fs_len_cts.tolist() + info
-
-    fs_cts_df = pd.DataFrame.from_dict(fs_cts, orient='index')
-    cols = list(map(str, fs_lens)) + ['total', 'unmapped', 'gene length', 'bases at risk']
-    fs_cts_df.columns = cols
+    bed_list = _read_genes(bed_path)
+    gene_ixs, is_mapped = map_frameshifts(fs_df, bed_list)
+
+    # count all frameshifts
+    num_genes = len(bed_list)
+    has_gene = gene_ixs >= 0
+    total_fs = np.bincount(gene_ixs[has_gene], minlength=num_genes)
+    unmapped_fs = np.bincount(gene_ixs[has_gene & ~is_mapped], minlength=num_genes)
+
+    # filter out frameshifts that did not match reference tx
+    is_counted = has_gene if use_unmapped else (has_gene & is_mapped)
+
+    # count frameshifts by length, with the last bin holding all longer
+    # frameshifts
+    fs_len = np.minimum(fs_df['indel len'].values, fs_lens[-1])
+    len_cts = pd.crosstab(gene_ixs[is_counted], fs_len[is_counted])
+    len_cts = len_cts.reindex(index=range(num_genes), columns=fs_lens, fill_value=0)
+
+    # get length of gene
+    gene_len = np.array([bed.cds_len for bed in bed_list], dtype=int)
+    gene_bases_at_risk = gene_len * num_samples
+
+    fs_cts_df = pd.DataFrame(len_cts.values.astype(int),
+                             index=[bed.gene_name for bed in bed_list],
+                             columns=list(map(str, fs_lens)))
+    fs_cts_df['total'] = total_fs
+    fs_cts_df['unmapped'] = unmapped_fs
+    fs_cts_df['gene length'] = gene_len
+    fs_cts_df['bases at risk'] = gene_bases_at_risk
     return fs_cts_df
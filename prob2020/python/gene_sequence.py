@@ -106,146 +106,130 @@ class GeneSequence(object):
         return exons, five_prime_ss, three_prime_ss
 
 
-def _fetch_5ss_fasta(fasta, gene_name, exon_num,
-                     chrom, strand, start, end):
-    """Retreives the 5' SS sequence flanking the specified exon.
-
-    Returns a string in fasta format with the first line containing
-    a ">" and the second line contains the two base pairs of 5' SS.
+def _slice_5ss(gene_seq, offset, strand, start, end):
+    """Slices the 5' SS sequence flanking an exon out of the gene span.
 
     Parameters
     ----------
-    fasta : pysam.Fastafile
-        fasta object from pysam
-    gene_name : str
-        gene name used for fasta seq id
-    exon_num : int
-        the `exon_num` exon, used for seq id
-    chrom : str
-        chromsome
+    gene_seq : str
+        upper case genomic sequence covering the whole gene
+    offset : int
+        0-based genomic position of the start of gene_seq
     strand : str
         strand, {'+', '-'}
     start : int
-        0-based start position
+        0-based start position of exon
     end : int
-        0-based end position
+        0-based end position of exon
 
     Returns
     -------
-    ss_fasta : str
-        string in fasta format with first line being seq id
+    ss_seq : str
+        5' SS sequence
     """
     if strand == '+':
-        ss_seq = fasta.fetch(reference=chrom,
-                             start=end-1,
-                             end=end+3)
+        ss_seq = gene_seq[max(end-1-offset, 0):end+3-offset]
     elif strand == '-':
-        ss_seq = fasta.fetch(reference=chrom,
-                             start=start-3,
-                             end=start+1)
-        ss_seq = utils.rev_comp(ss_seq)
-    ss_fasta = '>{0};exon{1};5SS\n{2}\n'.format(gene_name,
-                                                exon_num,
-                                                ss_seq.upper())
-    return ss_fasta
-
+        ss_seq = utils.rev_comp(gene_seq[max(start-3-offset, 0):start+1-offset])
+    return ss_seq
 
-def _fetch_3ss_fasta(fasta, gene_name, exon_num,
-                     chrom, strand, start, end):
-    """Retreives the 3' SS sequence flanking the specified exon.
 
-    Returns a string in fasta format with the first line containing
-    a ">" and the second line contains the two base pairs of 3' SS.
+def _slice_3ss(gene_seq, offset, strand, start, end):
+    """Slices the 3' SS sequence flanking an exon out of the gene span.
 
     Parameters
     ----------
-    fasta : pysam.Fastafile
-        fasta object from pysam
-    gene_name : str
-        gene name used for fasta seq id
-    exon_num : int
-        the `exon_num` exon, used for seq id
-    chrom : str
-        chromsome
+    gene_seq : str
+        upper case genomic sequence covering the whole gene
+    offset : int
+        0-based genomic position of the start of gene_seq
     strand : str
         strand, {'+', '-'}
     start : int
-        0-based start position
+        0-based start position of exon
     end : int
-        0-based end position
+        0-based end position of exon
 
     Returns
     -------
-    ss_fasta : str
-        string in fasta format with first line being seq id
+    ss_seq : str
+        3' SS sequence
     """
-
     if strand == '-':
-        ss_seq = fasta.fetch(reference=chrom,
-                             start=end-1,
-                             end=end+3)
-        ss_seq = utils.rev_comp(ss_seq)
+        ss_seq = utils.rev_comp(gene_seq[max(end-1-offset, 0):end+3-offset])
     elif strand == '+':
-        ss_seq = fasta.fetch(reference=chrom,
-                             start=start-3,
-                             end=start+1)
-    ss_fasta = '>{0};exon{1};3SS\n{2}\n'.format(gene_name,
-                                                exon_num,
-                                                ss_seq.upper())
-    return ss_fasta
+        ss_seq = gene_seq[max(start-3-offset, 0):start+1-offset]
+    return ss_seq
 
 
-def fetch_gene_fasta(gene_bed, fasta_obj):
-    """Retreive gene sequences in FASTA format.
+def fetch_gene_records(gene_bed, fasta_obj):
+    """Retreive the exon and splice site sequences of a gene.
+
+    The genomic span of the gene, including the splice sites, is fetched
+    once and the exons and splice sites are sliced from it.
 
     Parameters
     ----------
     gene_bed : BedLine
         BedLine object representing a single gene
-    fasta_obj : pysam.Fastafile
+    fasta_obj : pysam.Fastafile or TwoBitFile
         fasta object for index retreival of sequence
 
     Returns
     -------
-    gene_fasta : str
-        sequence of gene in FASTA format
+    records : list of (str, str)
+        sequence id and upper case sequence, in the order of the gene FASTA
     """
-    gene_fasta = ''
+    records = []
+    name = gene_bed.gene_name
     strand = gene_bed.strand
     exons = gene_bed.get_exons()
     if strand == '-':
         exons.reverse()  # order exons 5' to 3', so reverse if '-' strand
 
+    # fetch the gene once, with room for the splice sites
+    offset = max(min(e[0] for e in exons) - 3, 0)
+    gene_seq = fasta_obj.fetch(reference=gene_bed.chrom,
+                               start=offset,
+                               end=max(e[1] for e in exons) + 3).upper()
+
     # iterate over exons
     for i, exon in enumerate(exons):
-        exon_seq = fasta_obj.fetch(reference=gene_bed.chrom,
-                                   start=exon[0],
-                                   end=exon[1]).upper()
+        exon_seq = gene_seq[exon[0]-offset:exon[1]-offset]
         if strand == '-':
             exon_seq = utils.rev_comp(exon_seq)
-        exon_fasta = '>{0};exon{1}\n{2}\n'.format(gene_bed.gene_name,
-                                                  i, exon_seq)
+        records.append(('{0};exon{1}'.format(name, i), exon_seq))
 
         # get splice site sequence
         if len(exons) == 1:
             # splice sites don't matter if there is no splicing
-            ss_fasta = ''
-        elif i == 0:
-            # first exon only, get 3' SS
-            ss_fasta = _fetch_5ss_fasta(fasta_obj, gene_bed.gene_name, i,
-                                        gene_bed.chrom, strand, exon[0], exon[1])
-        elif i == (len(exons) - 1):
-            # last exon only, get 5' SS
-            ss_fasta = _fetch_3ss_fasta(fasta_obj, gene_bed.gene_name, i,
-                                        gene_bed.chrom, strand, exon[0], exon[1])
-        else:
-            # middle exon, get bot 5' and 3' SS
-            fasta_3ss = _fetch_3ss_fasta(fasta_obj, gene_bed.gene_name, i,
-                                         gene_bed.chrom, strand, exon[0], exon[1])
-            fasta_5ss = _fetch_5ss_fasta(fasta_obj, gene_bed.gene_name, i,
-                                         gene_bed.chrom, strand, exon[0], exon[1])
-            ss_fasta = fasta_5ss + fasta_3ss
-
-        gene_fasta += exon_fasta + ss_fasta
-
-    return gene_fasta
+            continue
+        if i != (len(exons) - 1):
+            # all but the last exon have a 5' SS
+            records.append(('{0};exon{1};5SS'.format(name, i),
+                            _slice_5ss(gene_seq, offset, strand, exon[0], exon[1])))
+        if i != 0:
+            # all but the first exon have a 3' SS
+            records.append(('{0};exon{1};3SS'.format(name, i),
+                            _slice_3ss(gene_seq, offset, strand, exon[0], exon[1])))
+
+    return records
+
+
+def fetch_gene_fasta(gene_bed, fasta_obj):
+    """Retreive gene sequences in FASTA format.
+
+    Parameters
+    ----------
+    gene_bed : BedLine
+        BedLine object representing a single gene
+    fasta_obj : pysam.Fastafile or TwoBitFile
+        fasta object for index retreival of sequence
+
+    Returns
+    -------
+    gene_fasta : str
+        sequence of gene in FASTA format
+    """
+    return ''.join('>{0}\n{1}\n'.format(seq_id, seq)
+                   for seq_id, seq in fetch_gene_records(gene_bed, fasta_obj))
@@ -0,0 +1,280 @@
+"""This module handles access to a reference genome, either as an indexed
+FASTA file through pysam or as a memory mapped UCSC 2bit file.
+"""
+import numpy as np
+import pysam
+import struct
+import os
+
+# signature at the start of 2bit files
+TWOBIT_SIGNATURE = 0x1A412743
+
+# bases in the order of their 2bit codes
+TWOBIT_BASES = np.frombuffer(b'TCAG', dtype=np.uint8)
+
+# positions further apart than this are fetched in separate windows
+max_fetch_gap = 100000
+
+# genome files opened by the current process
+_genomes = {}
+
+
+class TwoBitFile(object):
+    """Read-only access to a UCSC 2bit genome file.
+
+    The file is memory mapped, so only the parts of the genome that are
+    fetched are read from disk. The fetch method follows pysam.Fastafile.
+    Soft-masked blocks are not tracked, so sequence is always returned in
+    upper case.
+    """
+
+    def __init__(self, path):
+        self.filename = path
+        self._data = np.memmap(path, dtype=np.uint8, mode='r')
+
+        # figure out byte order from the signature
+        header = self._data[:16].tobytes()
+        if struct.unpack('<I', header[:4])[0] == TWOBIT_SIGNATURE:
+            self._endian = '<'
+        elif struct.unpack('>I', header[:4])[0] == TWOBIT_SIGNATURE:
+            self._endian = '>'
+        else:
+            raise ValueError('{0} is not a 2bit file'.format(path))
+        version, seq_count = struct.unpack(self._endian+'II', header[4:12])
+        offset_fmt = 'Q' if version == 1 else 'I'
+        offset_size = struct.calcsize(offset_fmt)
+
+        # read the index of sequence offsets
+        self._offsets = {}
+        pos = 16
+        for i in range(seq_count):
+            name_len = int(self._data[pos])
+            name = self._data[pos+1:pos+1+name_len].tobytes().decode('ascii')
+            pos += 1 + name_len
+            self._offsets[name] = struct.unpack(self._endian+offset_fmt,
+                                                self._data[pos:pos+offset_size].tobytes())[0]
+            pos += offset_size
+        self.references = list(self._offsets.keys())
+        self._records = {}
+
+    def _read_uint32(self, pos, count=1):
+        return np.frombuffer(self._data[pos:pos+4*count].tobytes(),
+                             dtype=np.dtype(self._endian+'u4')).astype(np.int64)
+
+    def _record(self, reference):
+        """Length, N blocks and position of packed DNA for a sequence."""
+        if reference not in self._records:
+            pos = self._offsets[reference]
+            dna_size, n_count = self._read_uint32(pos, 2)
+            pos += 8
+            n_starts = self._read_uint32(pos, n_count)
+            n_sizes = self._read_uint32(pos+4*n_count, n_count)
+            pos += 8*n_count
+            mask_count = self._read_uint32(pos)[0]
+            pos += 4 + 8*mask_count + 4  # skip mask blocks and reserved word
+            self._records[reference] = (int(dna_size), n_starts, n_sizes, pos)
+        return self._records[reference]
+
+    def get_reference_length(self, reference):
+        return self._record(reference)[0]
+
+    def fetch(self, reference=None, start=None, end=None):
+        """Fetch sequence of reference from start to end (0-based, end
+        exclusive)."""
+        dna_size, n_starts, n_sizes, dna_pos = self._record(reference)
+        start = max(start or 0, 0)
+        end = dna_size if end is None else min(end, dna_size)
+        if start >= end:
+            return ''
+
+        # unpack the bytes covering the region, four bases per byte
+        packed = self._data[dna_pos+start//4:dna_pos+(end+3)//4]
+        codes = (packed[:, None] >> np.array([6, 4, 2, 0], dtype=np.uint8)) & 3
+        first = start - 4*(start//4)
+        seq = TWOBIT_BASES[codes.ravel()[first:first+end-start]]
+
+        # fill in N blocks that overlap the region
+        n_ends = n_starts + n_sizes
+        for n_start, n_end in zip(n_starts[(n_starts < end) & (n_ends > start)],
+                                  n_ends[(n_starts < end) & (n_ends > start)]):
+            seq[max(n_start, start)-start:min(n_end, end)-start] = ord('N')
+        return seq.tobytes().decode('ascii')
+
+    def close(self):
+        # the file is unmapped once the array is no longer referenced
+        self._data = None
+
+
+def open_fasta(path):
+    """Opens a FASTA or 2bit file, chosen by the file extension.
+
+    Parameters
+    ----------
+    path : str
+        path to a FASTA file or a 2bit file
+
+    Returns
+    -------
+    fasta : pysam.Fastafile or TwoBitFile
+        handle for fetching sequence
+    """
+    if path.lower().endswith('.2bit'):
+        return TwoBitFile(path)
+    else:
+        return pysam.Fastafile(path)
+
+
+def open_genome(path):
+    """Opens a genome FASTA or 2bit file. Each process opens a genome file
+    only once, and later calls return the same handle.
+
+    Parameters
+    ----------
+    path : str
+        path to an indexed FASTA file or a 2bit file
+
+    Returns
+    -------
+    genome : pysam.Fastafile or TwoBitFile
+        handle for fetching genome sequence
+    """
+    key = (path, os.getpid())
+    if key not in _genomes:
+        _genomes[key] = open_fasta(path)
+    return _genomes[key]
+
+
+def close_genomes():
+    """Closes the genome files opened by open_genome in the current
+    process. Workers call this once they are finished with a chromosome."""
+    pid = os.getpid()
+    for key in [k for k in _genomes if k[1] == pid]:
+        _genomes.pop(key).close()
+
+
+def fetch_positions(genome, chrom, positions, left=0, right=1):
+    """Fetch the sequence around many positions on a chromosome.
+
+    Positions are sorted and nearby positions are fetched together in a
+    single window, so each region of the genome is read only once.
+
+    Parameters
+    ----------
+    genome : pysam.Fastafile or TwoBitFile
+        genome to fetch from
+    chrom : str
+        chromosome name
+    positions : list of int
+        0-based positions
+    left : int
+        number of bases to fetch before each position
+    right : int
+        number of bases to fetch from each position onwards
+
+    Returns
+    -------
+    seqs : list of str
+        upper case sequence from position-left to position+right for
+        each position, in the original order
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    seqs = [''] * len(positions)
+    if not len(positions):
+        return seqs
+
+    # split sorted positions into windows wherever there is a large gap
+    order = np.argsort(positions, kind='mergesort')
+    sorted_pos = positions[order]
+    breaks = np.flatnonzero(np.diff(sorted_pos) > max_fetch_gap) + 1
+    for window in np.split(np.arange(len(sorted_pos)), breaks):
+        win_start = max(int(sorted_pos[window[0]]) - left, 0)
+        win_end = int(sorted_pos[window[-1]]) + right
+        win_seq = genome.fetch(reference=chrom, start=win_start, end=win_end).upper()
+        for i in window:
+            pos = int(sorted_pos[i])
+            seqs[order[i]] = win_seq[max(pos-left-win_start, 0):pos+right-win_start]
+    return seqs
+
+
+def write_fasta(records, handle, index_handle=None):
+    """Writes sequences in FASTA format, one line per sequence.
+
+    Since the layout of the file is known while writing, the samtools
+    FASTA index (.fai) can be written at the same time instead of
+    indexing the file afterwards.
+
+    Parameters
+    ----------
+    records : iterable of (str, str)
+        sequence name and sequence pairs
+    handle : file
+        open output file
+    index_handle : file or None
+        open output file for the FASTA index
+
+    Returns
+    -------
+    num_bytes : int
+        number of bytes written to the FASTA file
+    """
+    offset = handle.tell() if index_handle else 0
+    num_bytes = 0
+    for name, seq in records:
+        header = '>{0}\n'.format(name)
+        handle.write(header + seq + '\n')
+        if index_handle:
+            seq_offset = offset + num_bytes + len(header)
+            index_handle.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(name, len(seq), seq_offset,
+                                                                len(seq), len(seq)+1))
+        num_bytes += len(header) + len(seq) + 1
+    return num_bytes
+
+
+def write_twobit(records, path):
+    """Writes sequences in the UCSC 2bit format.
+
+    Runs of N are recorded as N blocks, while other bases that are not
+    A, C, G or T are stored as T. Lower case is not preserved.
+
+    Parameters
+    ----------
+    records : list of (str, str)
+        sequence name and sequence pairs
+    path : str
+        path of output 2bit file
+    """
+    codes = np.full(256, 0, dtype=np.uint8)
+    for i, base in enumerate('TCAG'):
+        codes[ord(base)] = codes[ord(base.lower())] = i
+
+    index_size = sum(1 + len(name) + 4 for name, seq in records)
+    offset = 16 + index_size
+    index, data = [], []
+    for name, seq in records:
+        index.append(struct.pack('<B', len(name)) + name.encode('ascii') +
+                     struct.pack('<I', offset))
+
+        # find runs of N
+        seq_arr = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+        is_n = np.concatenate([[False], (seq_arr == ord('N')) | (seq_arr == ord('n')), [False]])
+        edges = np.flatnonzero(np.diff(is_n.astype(np.int8)))
+        n_starts, n_ends = edges[::2], edges[1::2]
+
+        # pack four bases per byte
+        seq_codes = codes[seq_arr]
+        seq_codes = np.concatenate([seq_codes, np.zeros((-len(seq_codes)) % 4, dtype=np.uint8)])
+        seq_codes = seq_codes.reshape(-1, 4)
+        packed = (seq_codes[:, 0] << 6) | (seq_codes[:, 1] << 4) | \
+            (seq_codes[:, 2] << 2) | seq_codes[:, 3]
+
+        record = struct.pack('<II', len(seq), len(n_starts)) + \
+            n_starts.astype('<u4').tobytes() + \
+            (n_ends - n_starts).astype('<u4').tobytes() + \
+            struct.pack('<II', 0, 0) + packed.astype(np.uint8).tobytes()
+        data.append(record)
+        offset += len(record)
+
+    with open(path, 'wb') as handle:
+        handle.write(struct.pack('<IIII', TWOBIT_SIGNATURE, 0, len(records), 0))
+        handle.write(b''.join(index))
+        handle.write(b''.join(data))
@@ -0,0 +1,105 @@
+"""This module supports incremental runs of the permutation tests.
+
+The state of a run holds a fingerprint of the mutations in each gene along
+with the result rows of the gene. When a cohort grows, a new run compares
+the fingerprints of the new mutations against the saved state, and only
+tests the genes whose mutations changed. Results of the other genes are
+reused from the state.
+"""
+import prob2020.python.journal as journal
+import prob2020.python.utils as utils
+import pandas as pd
+import hashlib
+import logging
+import pickle
+import os
+
+logger = logging.getLogger(__name__)  # module logger
+
+# options that may change between incremental runs
+incremental_ignored_opts = journal.ignored_opts + ['mutations']
+
+
+def gene_fingerprints(mut_df, cols):
+    """Fingerprints the mutations of each gene.
+
+    Parameters
+    ----------
+    mut_df : pd.DataFrame
+        mutations
+    cols : list
+        columns of mut_df that are used by the test
+
+    Returns
+    -------
+    fingerprints : dict
+        maps gene names to a hex digest of the gene's mutations, in the
+        order they appear in mut_df
+    """
+    cols = [c for c in cols if c in mut_df.columns]
+    row_hashes = pd.util.hash_pandas_object(mut_df[cols], index=False).values
+    fingerprints = {}
+    for gene, ixs in mut_df.groupby('Gene', sort=False).indices.items():
+        myhash = hashlib.sha1(','.join(cols).encode())
+        myhash.update(row_hashes[ixs].tobytes())
+        fingerprints[gene] = myhash.hexdigest()
+    return fingerprints
+
+
+def read_state(path, key):
+    """Reads the state of a previous run.
+
+    Parameters
+    ----------
+    path : str
+        path to the state file
+    key : str
+        configuration key of the current run
+
+    Returns
+    -------
+    genes : dict
+        maps gene names to a dictionary with the fingerprint, result rows
+        and whether the gene was screened out. Empty if there is no state
+        file or it was made with different options.
+    """
+    if not os.path.exists(path):
+        logger.info('No previous state found at {0}, testing all genes.'.format(path))
+        return {}
+    with open(path, 'rb') as handle:
+        state = pickle.load(handle)
+    if state['key'] != key:
+        logger.info('Previous state used different options, testing all genes.')
+        return {}
+    return state['genes']
+
+
+def write_state(path, key, fingerprints, permutation_result, screened_out=()):
+    """Saves the state of a run for the next incremental run.
+
+    Parameters
+    ----------
+    path : str
+        path to the state file
+    key : str
+        configuration key of the run
+    fingerprints : dict
+        fingerprints of the tested genes
+    permutation_result : list
+        result rows of all genes, with the gene name first
+    screened_out : set
+        genes reported with an upper bound p-value
+    """
+    gene_rows = {gene: [] for gene in fingerprints}
+    for row in permutation_result:
+        if row[0] in gene_rows:
+            gene_rows[row[0]].append(row)
+    genes = {gene: {'fingerprint': fingerprints[gene],
+                    'rows': gene_rows[gene],
+                    'screened': gene in screened_out}
+             for gene in fingerprints}
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as handle:
+        pickle.dump({'key': key, 'genes': genes}, handle,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    utils.replace_file(tmp_path, path)
@@ -7,61 +7,134 @@ import prob2020.python.utils as utils
 import numpy as np
 import pandas as pd
 
+
+def multivariate_hypergeometric(colors, nsample, prng):
+    """Draws nsample items without replacement for each row of colors.
+
+    The colors of a row are split in half, and the number drawn from the
+    first half is a hypergeometric draw. Each half is then split again
+    until single colors are left. Every split at the same depth is drawn in
+    one call for all rows, so the number of calls grows with the log of the
+    number of colors. Halves that no items are drawn from are not split.
+
+    Parameters
+    ----------
+    colors : np.array
+        number of items of each color (columns) for each draw (rows)
+    nsample : int
+        number of items to draw in each row, at most the number of items
+        in every row
+    prng : np.random.RandomState
+        pseudo random number generator
+
+    Returns
+    -------
+    counts : np.array
+        number of drawn items of each color, same shape as colors
+    """
+    num_rows, num_colors = colors.shape
+    counts = np.zeros_like(colors)
+    if nsample == 0 or num_rows == 0:
+        return counts
+
+    # number of items before each color, so the items in a range of
+    # colors is a difference of two entries
+    cum_items = np.zeros((num_rows, num_colors+1), dtype=np.int64)
+    np.cumsum(colors, axis=1, out=cum_items[:, 1:])
+
+    # ranges of colors [start, end) of each row that items are drawn from
+    rows = np.arange(num_rows)
+    starts = np.zeros(num_rows, dtype=np.int64)
+    ends = np.empty(num_rows, dtype=np.int64)
+    ends.fill(num_colors)
+    sample = np.empty(num_rows, dtype=np.int64)
+    sample.fill(nsample)
+    while rows.size:
+        # single colors get every item drawn from the range
+        is_color = (ends - starts) == 1
+        counts[rows[is_color], starts[is_color]] = sample[is_color]
+        is_split = ~is_color
+        rows, starts, ends, sample = rows[is_split], starts[is_split], ends[is_split], sample[is_split]
+        if not rows.size:
+            break
+
+        # split each range in half
+        mids = (starts + ends) // 2
+        num_good = cum_items[rows, mids] - cum_items[rows, starts]
+        num_bad = cum_items[rows, ends] - cum_items[rows, mids]
+        drawn = prng.hypergeometric(num_good, num_bad, sample)
+
+        # keep the halves that items were drawn from
+        rows = np.concatenate([rows, rows])
+        starts = np.concatenate([starts, mids])
+        ends = np.concatenate([mids, ends])
+        sample = np.concatenate([drawn, sample - drawn])
+        is_drawn = sample > 0
+        rows, starts, ends, sample = rows[is_drawn], starts[is_drawn], ends[is_drawn], sample[is_drawn]
+    return counts
+
+
 def simulate_indel_counts(indel_df, bed_dict,
                           num_permutations=1,
                           seed=None):
-    # count indels
+    """Simulates the number of frameshift and inframe indels in each gene.
+
+    Indels are assigned to genes in proportion to CDS length. Given the
+    number of indels in each gene, the frameshift indels are a random draw
+    without replacement from all indels, so the frameshift counts follow a
+    multivariate hypergeometric distribution.
+
+    Parameters
+    ----------
+    indel_df : pd.DataFrame
+        indels with an 'indel len' column
+    bed_dict : dict
+        dictionary mapping chromosome keys to a list of BED lines
+    num_permutations : int
+        number of simulations
+    seed : int or None
+        seed for the pseudo random number generator
+
+    Returns
+    -------
+    fs_cts : np.array
+        frameshift counts (simulations by genes)
+    inframe_cts : np.array
+        inframe indel counts (simulations by genes)
+    gene_names : pd.Index
+        gene names for the columns of the count arrays
+    """
+    # only the CDS length of genes is needed
     bed_genes = [mybed
                  for chrom in bed_dict
                  for mybed in bed_dict[chrom]]
-    tmp = []
-    for b in bed_genes:
-        b.init_genome_coordinates()
-        tmp.append(b)
-    bed_genes = tmp
     gene_lengths = pd.Series([b.cds_len for b in bed_genes],
                               index=[b.gene_name for b in bed_genes])
 
     # generate random indel assignments
     gene_prob = gene_lengths.astype(float) / gene_lengths.sum()
-    indel_lens = indel_df['indel len'].copy().values
-    is_fs = (indel_lens % 3) > 0
-    indel_ixs = np.arange(len(indel_lens))
+    indel_lens = indel_df['indel len'].values
+    num_indels = len(indel_lens)
+    num_fs = int(np.sum((indel_lens % 3) > 0))
     prng = np.random.RandomState(seed=seed)
 
     # randomly reassign indels
-    mygene_cts = prng.multinomial(len(indel_lens), gene_prob, size=num_permutations)
-    inframe_cts = mygene_cts.copy()
-    for row in range(mygene_cts.shape[0]):
-        nonzero_ix = np.nonzero(mygene_cts[row,:])[0]
+    mygene_cts = prng.multinomial(num_indels, gene_prob, size=num_permutations)
 
-        # randomly shuffle indel lengths
-        prng.shuffle(indel_ixs)
-        is_fs = is_fs[indel_ixs]
-
-        # iterate over each gene
-        indel_ix = 0
-        for j in range(len(nonzero_ix)):
-            prev_indel_ix = indel_ix
-            num_gene_indels = mygene_cts[row, nonzero_ix[j]]
-            indel_ix += num_gene_indels
-            inframe_cts[row, nonzero_ix[j]] = num_gene_indels - np.sum(is_fs[prev_indel_ix:indel_ix])
-    mygene_cts -= inframe_cts
-    return mygene_cts, inframe_cts, gene_lengths.index
+    # randomly split the indels of each gene into frameshift and inframe
+    fs_cts = multivariate_hypergeometric(mygene_cts, num_fs, prng)
+    inframe_cts = mygene_cts - fs_cts
+    return fs_cts, inframe_cts, gene_lengths.index
 
 
 def simulate_indel_maf(indel_df, bed_dict,
                        num_permutations=1,
-                       seed=None):
+                       seed=None,
+                       with_iteration=False):
     # count indels
     bed_genes = [mybed
                 for chrom in bed_dict
                 for mybed in bed_dict[chrom]]
-    tmp = []
-    for b in bed_genes:
-        b.init_genome_coordinates()
-        tmp.append(b)
-    bed_genes = tmp
     gene_lengths = pd.Series([b.cds_len for b in bed_genes],
                                 index=[b.gene_name for b in bed_genes])
 
@@ -92,14 +165,17 @@ def simulate_indel_maf(indel_df, bed_dict,
                                    indel_lens[prev_indel_ix:indel_ix],
                                    indel_types[prev_indel_ix:indel_ix],
                                    bed_genes[nonzero_ix[j]])
-            yield maf_lines
+            if with_iteration:
+                yield i, maf_lines
+            else:
+                yield maf_lines
 
 
 def counts2maf(num_indels, myindel_lens, myindel_types, gene_bed, seed=None):
     maf_list = []
     prng = np.random.RandomState(seed=seed)
     pos = prng.randint(low=0, high=gene_bed.cds_len, size=num_indels)
-    genome_pos = [gene_bed.seqpos2genome[p] for p in pos]
+    genome_pos = gene_bed.seq_to_genome(pos)
     is_frame_shift = myindel_lens%3
     for i, gpos in enumerate(genome_pos):
         if myindel_types[i] == 'INS':
@@ -136,10 +212,10 @@ def compute_indel_length(fs_df):
     indel_len : pd.Series
         length of indels
     """
-    indel_len = pd.Series(index=fs_df.index)
+    indel_len = pd.Series(index=fs_df.index, dtype=float)
     indel_len[fs_df['Reference_Allele']=='-'] = fs_df['Tumor_Allele'][fs_df['Reference_Allele']=='-'].str.len()
     indel_len[fs_df['Tumor_Allele']=='-'] = fs_df['Reference_Allele'][fs_df['Tumor_Allele']=='-'].str.len()
-    indel_len = indel_len.fillna(0)
+    indel_len = indel_len.fillna(0).astype(int)
     return indel_len
 
 
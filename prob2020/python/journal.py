@@ -0,0 +1,137 @@
+"""This module keeps a journal of per-gene results, so that a run which is
+stopped part way through can be resumed without repeating finished genes.
+
+Each finished gene is appended to the journal as a single line of JSON,
+along with a key made from the run configuration. Only lines with the key
+of the current run are read back, so results from a run with different
+options are never mixed in.
+"""
+import prob2020.python.utils as utils
+from collections import OrderedDict
+import numpy as np
+import hashlib
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)  # module logger
+
+# options that do not change the results of a run
+ignored_opts = ['output', 'journal', 'journal_key', 'resume', 'cache_dir', 'cache_size',
+                'context_cache', 'prefetch', 'incremental', 'processes', 'memory_budget',
+                'log', 'log_level', 'verbose']
+
+# options that are paths to input files
+file_opts = ['input', 'mutations', 'bed']
+
+
+def config_key(opts, ignored=ignored_opts):
+    """Makes a key identifying the run configuration.
+
+    The key is a hash of the options that change the results of a run,
+    along with the size and modification time of each input file.
+
+    Parameters
+    ----------
+    opts : dict
+        command line options
+    ignored : list
+        options left out of the key
+
+    Returns
+    -------
+    key : str
+        hex digest of the configuration
+    """
+    config = {k: v for k, v in opts.items() if k not in ignored}
+    for k in file_opts:
+        if k not in ignored and isinstance(opts.get(k), str) and os.path.isfile(opts[k]):
+            stat = os.stat(opts[k])
+            config[k + ' file'] = [stat.st_size, utils.file_mtime_ns(stat)]
+    config_str = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(config_str.encode()).hexdigest()
+
+
+def _to_json(obj):
+    """Converts numpy values that the json module does not handle."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError('{0} can not be saved in the journal'.format(type(obj)))
+
+
+class Journal(object):
+    """Journal file of per-gene results.
+
+    Lines are appended with a single write to a file opened in append mode,
+    so several worker processes can add genes to the same journal.
+
+    Parameters
+    ----------
+    path : str
+        path to the journal file
+    key : str
+        configuration key of the run, from config_key
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+
+    def append(self, gene, rows, screened=False):
+        """Records the result rows of a finished gene."""
+        record = {'key': self.key, 'gene': gene, 'rows': rows, 'screened': screened}
+        line = json.dumps(record, default=_to_json) + '\n'
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+
+    def clear(self):
+        """Starts an empty journal."""
+        open(self.path, 'w').close()
+
+    def repair(self):
+        """Removes a partly written last line left by a stopped run, so
+        that new records start on their own line."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as handle:
+            data = handle.read()
+            if data and not data.endswith(b'\n'):
+                handle.truncate(data.rfind(b'\n') + 1)
+                logger.info('Removed a partly written line from the end of the journal.')
+
+    def read(self):
+        """Reads the finished genes of this run.
+
+        Lines from other configurations and a partly written last line are
+        skipped.
+
+        Returns
+        -------
+        records : OrderedDict
+            maps gene names to a dictionary with the result rows and whether
+            the gene was screened out
+        """
+        records = OrderedDict()
+        if not os.path.exists(self.path):
+            return records
+        num_skipped = 0
+        with open(self.path) as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    num_skipped += 1
+                    continue
+                if record.get('key') != self.key:
+                    num_skipped += 1
+                    continue
+                records[record['gene']] = record
+        if num_skipped:
+            logger.info('Skipped {0} journal lines from other runs or '
+                        'unfinished writes.'.format(num_skipped))
+        return records
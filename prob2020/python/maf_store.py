@@ -0,0 +1,206 @@
+"""This module writes and reads simulated mutations in a binary columnar
+format.
+
+A store is a directory of chunk files written with the array_store module.
+Text columns are dictionary encoded as integer codes of the smallest integer
+type that fits, with the strings for each column saved once in a separate
+file. Rows of each chunk are sorted by
+simulation (iteration), and each chunk records the row offsets of every
+iteration, so a single iteration can be read through a memory map without
+reading the rest of the file.
+"""
+import prob2020.python.array_store as array_store
+import numpy as np
+import pandas as pd
+import os
+
+# columns of simulated mutations, same as the simulated MAF text output
+MAF_COLUMNS = ['Gene', 'strand', 'Chromosome', 'Start_Position',
+               'End_Position', 'Reference_Allele', 'Tumor_Allele',
+               'Context', 'DNA_Change', 'Protein_Change', 'Variant_Classification']
+INT_COLUMNS = ['Start_Position', 'End_Position']
+
+# rows buffered before writing a chunk file
+default_chunk_rows = 2**20
+
+CATEGORIES_FILE = 'categories.arr'
+CHUNK_FILE = 'chunk_{0:05d}.arr'
+
+
+class MafStoreWriter(object):
+    """Writes simulated mutations to a columnar store directory.
+
+    Parameters
+    ----------
+    path : str
+        output directory, created if it does not exist
+    num_iterations : int
+        number of simulations
+    chunk_rows : int
+        number of rows buffered before writing a chunk file
+    """
+
+    def __init__(self, path, num_iterations, chunk_rows=default_chunk_rows):
+        self.path = path
+        self.num_iterations = num_iterations
+        self.chunk_rows = chunk_rows
+        self.num_chunks = 0
+        self.num_rows = 0
+        self._categories = {c: {} for c in MAF_COLUMNS if c not in INT_COLUMNS}
+        self._buffer = []
+        self._buffer_rows = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _encode(self, col, values):
+        """Converts strings to codes in the dictionary of a column."""
+        local_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        col_dict = self._categories[col]
+        global_codes = np.array([col_dict.setdefault(u, len(col_dict)) for u in uniques],
+                                dtype=np.int32)
+        return global_codes[local_codes]
+
+    def add(self, columns, iterations):
+        """Adds a block of simulated mutations.
+
+        Parameters
+        ----------
+        columns : list
+            one sequence per column in MAF_COLUMNS
+        iterations : np.array
+            simulation number of each row
+        """
+        arrays = {'iteration': np.asarray(iterations, dtype=np.int32)}
+        for col, values in zip(MAF_COLUMNS, columns):
+            if col in INT_COLUMNS:
+                arrays[col] = np.asarray(values, dtype=np.int32)
+            else:
+                arrays[col] = self._encode(col, values)
+        self._append(arrays)
+
+    def add_store(self, store):
+        """Adds all simulated mutations of another store, such as one
+        written by a worker process.
+
+        Only the strings of each column are encoded again, the codes of the
+        other store are remapped without decoding its rows. Rows of each
+        simulation keep their order.
+
+        Parameters
+        ----------
+        store : MafStore
+            store to copy the mutations from
+        """
+        code_maps = {col: self._encode(col, store.categories(col))
+                     for col in self._categories}
+        for chunk in store._chunks:
+            arrays = {'iteration': np.array(chunk['iteration'], dtype=np.int32)}
+            for col in MAF_COLUMNS:
+                if col in INT_COLUMNS:
+                    arrays[col] = np.array(chunk[col], dtype=np.int32)
+                else:
+                    arrays[col] = code_maps[col][chunk[col]]
+            self._append(arrays)
+
+    def _append(self, arrays):
+        """Buffers encoded rows, writing a chunk once enough are buffered."""
+        self._buffer.append(arrays)
+        self._buffer_rows += len(arrays['iteration'])
+        if self._buffer_rows >= self.chunk_rows:
+            self.flush()
+
+    def add_lines(self, maf_lines, iterations):
+        """Adds simulated mutations given as a list of MAF lines, with the
+        simulation number of each line in iterations. Lines are encoded
+        together, so callers should pass many lines at once."""
+        if maf_lines:
+            self.add(list(zip(*maf_lines)), iterations)
+
+    def flush(self):
+        """Writes buffered rows to a new chunk file."""
+        if not self._buffer_rows:
+            return
+        names = self._buffer[0].keys()
+        chunk = {n: np.concatenate([b[n] for b in self._buffer]) for n in names}
+
+        # sort rows by iteration, keeping the order within an iteration
+        order = np.argsort(chunk['iteration'], kind='mergesort')
+        chunk = {n: chunk[n][order] for n in names}
+        for col, col_dict in self._categories.items():
+            chunk[col] = chunk[col].astype(np.min_scalar_type(max(len(col_dict)-1, 0)))
+        chunk['iteration_offsets'] = np.searchsorted(chunk['iteration'],
+                                                     np.arange(self.num_iterations+1))
+        array_store.write_array_store(os.path.join(self.path, CHUNK_FILE.format(self.num_chunks)),
+                                      chunk)
+        self.num_chunks += 1
+        self.num_rows += self._buffer_rows
+        self._buffer, self._buffer_rows = [], 0
+
+    def close(self):
+        """Writes the remaining rows and the string dictionaries."""
+        self.flush()
+        categories = {}
+        for col, col_dict in self._categories.items():
+            strings = [str(k).encode() for k in col_dict]
+            categories[col] = np.array(strings) if strings else np.zeros(0, dtype='S1')
+        metadata = {'num_iterations': self.num_iterations,
+                    'num_chunks': self.num_chunks,
+                    'num_rows': self.num_rows,
+                    'columns': MAF_COLUMNS}
+        array_store.write_array_store(os.path.join(self.path, CATEGORIES_FILE),
+                                      categories, metadata)
+
+
+class MafStore(object):
+    """Reads simulated mutations from a columnar store directory."""
+
+    def __init__(self, path):
+        self.path = path
+        categories = array_store.ArrayStore(os.path.join(path, CATEGORIES_FILE))
+        self.num_iterations = categories.metadata['num_iterations']
+        self.num_rows = categories.metadata['num_rows']
+        self.columns = categories.metadata['columns']
+        self._category_store = categories
+        self._categories = {}
+        self._chunks = [array_store.ArrayStore(os.path.join(path, CHUNK_FILE.format(i)))
+                        for i in range(categories.metadata['num_chunks'])]
+
+    def __len__(self):
+        return self.num_iterations
+
+    def categories(self, col):
+        """Strings of a dictionary encoded column, indexed by code."""
+        if col not in self._categories:
+            self._categories[col] = self._category_store[col].astype(str)
+        return self._categories[col]
+
+    def read_iteration(self, iteration):
+        """Reads the simulated mutations of a single simulation.
+
+        Parameters
+        ----------
+        iteration : int
+            simulation number
+
+        Returns
+        -------
+        maf_df : pd.DataFrame
+            simulated mutations, text columns are categorical
+        """
+        if not 0 <= iteration < self.num_iterations:
+            raise IndexError('Iteration {0} is not in the store'.format(iteration))
+        parts = {col: [] for col in self.columns}
+        for chunk in self._chunks:
+            start, end = chunk['iteration_offsets'][iteration:iteration+2]
+            for col in self.columns:
+                parts[col].append(chunk[col][start:end])
+
+        maf_df = pd.DataFrame()
+        for col in self.columns:
+            values = np.concatenate(parts[col]) if parts[col] else np.zeros(0, dtype=np.int32)
+            if col in INT_COLUMNS:
+                maf_df[col] = values
+            else:
+                maf_df[col] = pd.Categorical.from_codes(values.astype(np.int32),
+                                                        categories=self.categories(col))
+        return maf_df
@@ -1,12 +1,12 @@
 from prob2020.python import utils
 import prob2020.python.sequence_context
 import prob2020.python.indel as indel
+import prob2020.python.genome as genome
 from prob2020.python.gene_sequence import GeneSequence
-from prob2020.python.amino_acid import AminoAcid
+from prob2020.python.amino_acid import parse_protein_changes
 import prob2020.cython.cutils as cutils
 import numpy as np
 import pandas as pd
-import pysam
 import itertools as it
 
 # hack to rename izip function
@@ -52,35 +52,61 @@ def get_all_context_names(context_num):
         return trinucs
 
 
-def compute_mutation_context(bed, gs, df, opts):
+def normalize_mutations(bed, sc, df, opts, cache=None):
+    """Maps the mutations of a gene onto its reference transcript and assigns
+    each mutation a nucleotide context.
+
+    Parameters
+    ----------
+    bed : BedLine
+        gene of interest
+    sc : SequenceContext
+        sequence context of the gene
+    df : pd.DataFrame
+        mutations of all genes
+    opts : dict
+        command line options
+    cache : ChromosomeContexts or None
+        cached normalized mutations of the gene's chromosome
+
+    Returns
+    -------
+    mut_info : pd.DataFrame
+        mutations mapped to the reference transcript, with the coding
+        position, context, tumor allele (on the gene's strand), tumor sample
+        and tumor type
+    unmapped_mut_info : dict
+        recovered mutations that could not be mapped to the reference
+        transcript
+    total_mut : int
+        number of mutations in the gene
+    """
+    if cache is not None:
+        normalized = cache.get(bed.gene_name)
+        if normalized is not None:
+            return normalized
+
     # prepare info for running permutation test
     gene_mut = df[df['Gene']==bed.gene_name]
     cols = ['Chromosome', 'Start_Position', 'Reference_Allele',
             'Tumor_Allele', 'Variant_Classification', 'Protein_Change',
             'Tumor_Sample', 'Tumor_Type']
-    mut_info = gene_mut[cols]
-    gs.set_gene(bed)
-
-    # get sequence context
-    if 'seed' in opts:
-        sc = prob2020.python.sequence_context.SequenceContext(gs, seed=opts['seed'])
-    else:
-        sc = prob2020.python.sequence_context.SequenceContext(gs)
+    mut_info = gene_mut[cols].copy()
 
     # count total mutations in gene
     total_mut = len(mut_info)
 
-    # fix nucleotide letter if gene is on - strand
-    if bed.strand == '-':
-        mut_info.loc[:,'Tumor_Allele'] = mut_info['Tumor_Allele'].map(lambda x: utils.rev_comp(x))
+    # fix nucleotide letter if gene is on - strand, unless all genes were
+    # already oriented by utils.add_strand_tumor_allele
+    if 'Strand_Tumor_Allele' in gene_mut.columns:
+        mut_info['Tumor_Allele'] = gene_mut['Strand_Tumor_Allele']
+    elif bed.strand == '-':
+        mut_info['Tumor_Allele'] = utils.rev_comp_series(mut_info['Tumor_Allele'])
 
     # get coding positions, mutations unmapped to the reference tx will have
     # NA for a coding position
-    pos_list = []
-    for ix, row in mut_info.iterrows():
-        coding_pos = bed.query_position(bed.strand, row['Chromosome'], row['Start_Position'])
-        pos_list.append(coding_pos)
-    mut_info['Coding Position'] = pos_list
+    coding_pos = bed.genome_to_seq(mut_info['Start_Position'].values)
+    mut_info['Coding Position'] = np.where(coding_pos >= 0, coding_pos, np.nan)
 
     # recover mutations that could not be mapped to the reference transcript
     # for a gene before being dropped (next step)
@@ -89,14 +115,31 @@ def compute_mutation_context(bed, gs, df, opts):
     # drop mutations wich do not map to reference tx
     mut_info = mut_info.dropna(subset=['Coding Position'])  # mutations need to map to tx
     mut_info['Coding Position'] = mut_info['Coding Position'].astype(int)
-    unmapped_muts = total_mut - len(mut_info)
+    mut_info['Context'] = [sc.pos2context[x] for x in mut_info['Coding Position']]
+    mut_info = mut_info[['Coding Position', 'Context', 'Tumor_Allele',
+                         'Tumor_Sample', 'Tumor_Type']]
+
+    normalized = (mut_info, unmapped_mut_info, total_mut)
+    if cache is not None:
+        cache.add(bed.gene_name, normalized)
+    return normalized
+
+
+def compute_mutation_context(bed, gs, df, opts, cache=None):
+    gs.set_gene(bed)
+
+    # get sequence context
+    if 'seed' in opts:
+        sc = prob2020.python.sequence_context.SequenceContext(gs, seed=opts['seed'])
+    else:
+        sc = prob2020.python.sequence_context.SequenceContext(gs)
+
+    # map mutations onto the reference transcript
+    mut_info, unmapped_mut_info, total_mut = normalize_mutations(bed, sc, df, opts, cache)
 
     cols = ['Context', 'Tumor_Allele', 'Coding Position',
             'Tumor_Sample', 'Tumor_Type']
     if len(mut_info) > 0:
-        mut_info['Coding Position'] = mut_info['Coding Position'].astype(int)
-        mut_info['Context'] = mut_info['Coding Position'].apply(lambda x: sc.pos2context[x])
-
         # group mutations by context
         unmapped_mut_df = pd.DataFrame(unmapped_mut_info)
         rename_dict = {'Codon Pos': 'Coding Position'}
@@ -152,43 +195,33 @@ def get_chasm_context(tri_nuc):
 
 
 def get_context(chr, pos_list, strand, fa, context_type):
-    nuc_contexts = []
+    # number of bases to fetch before and after the mutated base
     if context_type in [1, 2]:
         # case where context matters
         index_context = int(context_type) - 1  # subtract 1 since python is zero-based index
-        for pos in pos_list:
-            nucs = fa.fetch(reference=chr,
-                            start=pos-index_context,
-                            end=pos+1).upper()
-            #commented out always using positive strand
-            #to use positive strand context uncomment the following
-            #if strand == '-':
-                #nucs = utils.rev_comp(nucs)
-            if 'N' not in nucs:
-                nuc_contexts.append(nucs)
-            else:
-                nuc_contexts.append(None)
+        left, right = index_context, 1
     elif context_type in [1.5, 3]:
         # use the nucleotide context from chasm if nuc
         # context is 1.5 otherwise always use a three
         # nucleotide context
-        for pos in pos_list:
-            nucs = fa.fetch(reference=chr,
-                            start=pos-1,
-                            end=pos+2).upper()
-            #commented out always using positive strand
-            #to use positive strand context uncomment the following
-            #if strand == '-':
-                #nucs = utils.rev_comp(nucs)
-            if context_type == 1.5 and nucs:
-                nucs = get_chasm_context(nucs)
-
-            if 'N' not in nucs:
-                nuc_contexts.append(nucs)
-            else:
-                nuc_contexts.append(None)
+        left, right = 1, 2
     else:
-        nuc_contexts = ['None'] * len(pos_list)
+        return ['None'] * len(pos_list)
+
+    # fetch all of the contexts at once
+    nuc_contexts = []
+    for nucs in genome.fetch_positions(fa, chr, pos_list, left, right):
+        #commented out always using positive strand
+        #to use positive strand context uncomment the following
+        #if strand == '-':
+            #nucs = utils.rev_comp(nucs)
+        if context_type == 1.5 and nucs:
+            nucs = get_chasm_context(nucs)
+
+        if 'N' not in nucs:
+            nuc_contexts.append(nucs)
+        else:
+            nuc_contexts.append(None)
 
     return nuc_contexts
 
@@ -258,38 +291,26 @@ def get_unmapped_aa_mut_info(mut_info, genome_fa, strand, chr, context_type):
     mycontexts = get_context(chr, mut_info['Start_Position'],
                              strand, genome_fa, context_type)
 
-    # get information about the effect of the protein change
-    if len(mut_info) > 0:
-        not_splice_site = mut_info['Variant_Classification'].map(lambda x: x!='Splice_Site')
-        prot_change = [AminoAcid(p) for p in mut_info[not_splice_site]['Protein_Change']]
-    else:
-        prot_change = []
+    # get information about the effect of the protein change, each
+    # distinct protein change is only parsed once
+    not_splice_site = (mut_info['Variant_Classification']!='Splice_Site').values
+    prot_change = parse_protein_changes(mut_info['Protein_Change'])
+    is_bad_prot = (~prot_change['is_valid'] | prot_change['is_missing_info'] |
+                   prot_change['pos'].isnull()).values
     codon_pos, germ_aa, somatic_aa = [], [], []
     LARGE_NUMBER = 100000  # sufficiently large number to prevent accidental overlap of codon positions
-    tmp_index = 0
     bad_mut_ix, good_mut_ix = [], []
     for i in range(len(mut_info)):
-        if not mycontexts[i]:
+        if not mycontexts[i] or (not_splice_site[i] and is_bad_prot[i]):
             bad_mut_ix.append(i)  # remove invalid/missing mutation
             codon_pos.append(None)
             germ_aa.append(None)
             somatic_aa.append(None)
-            if not_splice_site.iloc[i]:
-                tmp_index += 1
-        elif not_splice_site.iloc[i]:
-            if prot_change and (not prot_change[tmp_index].is_valid or \
-                                prot_change[tmp_index].is_missing_info):
-                bad_mut_ix.append(i)  # remove invalid/missing mutation
-                codon_pos.append(None)
-                germ_aa.append(None)
-                somatic_aa.append(None)
-                tmp_index += 1
-            else:
-                good_mut_ix.append(i)
-                codon_pos.append(LARGE_NUMBER + prot_change[tmp_index].pos)
-                germ_aa.append(prot_change[tmp_index].initial)
-                somatic_aa.append(prot_change[tmp_index].mutated)
-                tmp_index += 1
+        elif not_splice_site[i]:
+            good_mut_ix.append(i)
+            codon_pos.append(LARGE_NUMBER + int(prot_change['pos'].iat[i]))
+            germ_aa.append(prot_change['initial'].iat[i])
+            somatic_aa.append(prot_change['mutated'].iat[i])
         else:
             good_mut_ix.append(i)
             codon_pos.append('Splice_Site')
@@ -319,7 +340,7 @@ def recover_unmapped_mut_info(mut_info, bed, sc, opts):
     has_unmapped_opts = ('use_unmapped' in opts) and ('genome' in opts)
     use_unmapped = opts['use_unmapped'] and opts['genome']
     if has_unmapped_opts and use_unmapped:
-        genome_fa = pysam.Fastafile(opts['genome'])
+        genome_fa = genome.open_genome(opts['genome'])
         # try to still use mutations that are not on the reference transcript
         tmp_mut_info = mut_info[mut_info['Coding Position'].isnull()]
         unmapped_mut_info = get_unmapped_aa_mut_info(tmp_mut_info,
@@ -327,7 +348,6 @@ def recover_unmapped_mut_info(mut_info, bed, sc, opts):
                                                      bed.strand,
                                                      bed.chrom,
                                                      opts['context'])
-        genome_fa.close()
         # fill in tumor sample/tumor type info
         unmapped_mut_info['Tumor_Sample'] = tmp_mut_info['Tumor_Sample'].tolist()
         unmapped_mut_info['Tumor_Type'] = tmp_mut_info['Tumor_Type'].tolist()
@@ -353,7 +373,7 @@ def is_nonsilent(mut_df, bed_dict, opts):
                  for b in bed_dict[chrom]]
 
     # initiate gene sequences
-    gene_fa = pysam.Fastafile(opts['input'])
+    gene_fa = genome.open_fasta(opts['input'])
     gs = GeneSequence(gene_fa, nuc_context=opts['context'])
 
     # non-silent SNV classes
@@ -364,7 +384,7 @@ def is_nonsilent(mut_df, bed_dict, opts):
     mut_df['is_nonsilent'] = 0
     indel_flag = indel.is_indel_annotation(mut_df)
     mut_df.loc[indel_flag, 'is_nonsilent'] = 1
-    snv_df = mut_df[~indel_flag]
+    snv_df = utils.add_strand_tumor_allele(mut_df[~indel_flag], bed_dict)
 
     # iterate over each gene
     for bed in gene_beds:
@@ -392,6 +412,8 @@ def is_nonsilent(mut_df, bed_dict, opts):
                                 for x in var_class]
             mut_df.loc[tmp_df.index, 'is_nonsilent'] = is_nonsilent_snv
 
+    genome.close_genomes()
+
     # return a pandas series indicating nonsilent status
     is_nonsilent_series = mut_df['is_nonsilent'].copy()
     del mut_df['is_nonsilent']
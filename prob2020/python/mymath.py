@@ -85,6 +85,69 @@ def normalized_mutation_entropy(counts, total_cts=None):
     return norm_ent
 
 
+def normalized_mutation_entropies(counts, rows, num_rows):
+    """Calculate the normalized mutation entropy for many lists of
+    mutation counts at once.
+
+    The mutation counts of all lists are concatenated into a single array,
+    with a second array indicating which list each count belongs to.
+
+    Parameters
+    ----------
+    counts : np.array_like
+        mutation counts of all lists
+    rows : np.array_like
+        index of the list that each count belongs to
+    num_rows : int
+        number of lists
+
+    Returns
+    -------
+    norm_ent : np.array
+        normalized entropy of each list of mutation counts
+    """
+    cts = np.asarray(counts, dtype=float)
+    rows = np.asarray(rows, dtype=int)
+    total_cts = np.bincount(rows, weights=cts, minlength=num_rows)
+
+    # entropy of each list
+    nonzero = cts > 0
+    p = cts[nonzero] / total_cts[rows[nonzero]]
+    ent = -np.bincount(rows[nonzero], weights=p*np.log2(p), minlength=num_rows)
+
+    # normalize by the max entropy
+    norm_ent = np.ones(num_rows)
+    multiple = total_cts > 1
+    norm_ent[multiple] = ent[multiple] / np.log2(total_cts[multiple])
+    return norm_ent
+
+
+def set_partitions(items):
+    """Generates every partition of a list of items into non-empty blocks.
+
+    Parameters
+    ----------
+    items : list
+        elements to partition
+
+    Returns
+    -------
+    partitions : generator
+        yields each partition as a list of blocks (lists of items)
+    """
+    items = list(items)
+    if not items:
+        yield []
+        return
+    first, rest = items[0], items[1:]
+    for smaller in set_partitions(rest):
+        # put the first item in its own block
+        yield [[first]] + smaller
+        # or add it to one of the existing blocks
+        for i in range(len(smaller)):
+            yield smaller[:i] + [[first] + smaller[i]] + smaller[i+1:]
+
+
 def kl_divergence(p, q):
     """Compute the Kullback-Leibler (KL) divergence for discrete distributions.
 
@@ -24,6 +24,37 @@ def fishers_method(pvals):
     return fishers_pval
 
 
+def clopper_pearson_interval(num_exceed, num_sim, alpha=0.01):
+    """Clopper-Pearson confidence interval for a p-value estimated from
+    simulations.
+
+    Parameters
+    ----------
+    num_exceed : int
+        number of simulations at least as extreme as the observed statistic
+    num_sim : int
+        total number of simulations
+    alpha : float
+        the interval has 1-alpha coverage
+
+    Returns
+    -------
+    lower : float
+        lower bound for the p-value
+    upper : float
+        upper bound for the p-value
+    """
+    if num_exceed > 0:
+        lower = stats.beta.ppf(alpha/2, num_exceed, num_sim-num_exceed+1)
+    else:
+        lower = 0.0
+    if num_exceed < num_sim:
+        upper = stats.beta.ppf(1-alpha/2, num_exceed+1, num_sim-num_exceed)
+    else:
+        upper = 1.0
+    return lower, upper
+
+
 def cummin(x):
     """A python implementation of the cummin function in R"""
     for i in range(1, len(x)):
@@ -70,7 +101,8 @@ def calc_deleterious_p_value(mut_info,
                              stop_thresh,
                              del_threshold,
                              pseudo_count,
-                             seed=None):
+                             seed=None,
+                             max_batch=utils.default_max_batch):
     """Calculates the p-value for the number of inactivating SNV mutations.
 
     Calculates p-value based on how many simulations exceed the observed value.
@@ -99,6 +131,8 @@ def calc_deleterious_p_value(mut_info,
         means more precision on the p-value.
     seed : int (Default: None)
         seed number to random number generator (None to be randomly set)
+    max_batch : int
+        maximum number of simulations performed at once
     """
     #prng = np.random.RandomState(seed)
     if len(mut_info) > 0:
@@ -134,7 +168,8 @@ def calc_deleterious_p_value(mut_info,
                                                      gs,  # gene sequence obj
                                                      num_permutations,
                                                      stop_thresh,
-                                                     pseudo_count)
+                                                     pseudo_count,
+                                                     max_batch)
         else:
             del_p_value = None
     else:
@@ -155,7 +190,26 @@ def calc_position_p_value(mut_info,
                           stop_thresh,
                           pseudo_count,
                           min_recurrent,
-                          min_fraction):
+                          min_fraction,
+                          exact_max=0,
+                          max_batch=utils.default_max_batch,
+                          gene_vest=None):
+    """Calculates the p-value for the missense position entropy and VEST
+    score statistics.
+
+    Genes with at most exact_max mutations use an exact computation of the
+    null distribution, otherwise the p-value is estimated by simulations.
+    VEST scores are read from score_dir unless already given as gene_vest.
+
+    Returns
+    -------
+    result : list
+        gene name, number of recurrent mutations, position entropy, mean
+        VEST score and the entropy and VEST p-values
+    is_exact : bool
+        whether the p-values were computed exactly
+    """
+    is_exact = False
     if len(mut_info) > 0:
         mut_info['Coding Position'] = mut_info['Coding Position'].astype(int)
         mut_info['Context'] = mut_info['Coding Position'].apply(lambda x: sc.pos2context[x])
@@ -170,7 +224,8 @@ def calc_position_p_value(mut_info,
 
         # get vest scores for gene if directory provided
         if score_dir:
-            gene_vest = scores.read_vest_pickle(bed.gene_name, score_dir)
+            if gene_vest is None:
+                gene_vest = scores.read_vest(bed.gene_name, score_dir)
             if gene_vest is None:
                 logger.warning('Could not find VEST scores for {0}, skipping . . .'.format(bed.gene_name))
         else:
@@ -194,17 +249,29 @@ def calc_position_p_value(mut_info,
                                               aa_mut_info['Somatic AA'],
                                               aa_mut_info['Codon Pos'])
 
-        # perform simulations to get p-value
         observed_stats = (num_recurrent, pos_ent, delta_pos_ent, vest_score)
-        permutation_result = pm.position_permutation(observed_stats,
-                                                     context_cts,
-                                                     context_to_mutations,
-                                                     sc,  # sequence context obj
-                                                     gs,  # gene sequence obj
-                                                     gene_vest,
-                                                     num_permutations,
-                                                     stop_thresh,
-                                                     pseudo_count)
+        is_exact = len(tmp_df) <= exact_max
+        if is_exact:
+            # compute the exact p-value for genes with few mutations
+            permutation_result = pm.position_exact(observed_stats,
+                                                   context_cts,
+                                                   context_to_mutations,
+                                                   sc,  # sequence context obj
+                                                   gs,  # gene sequence obj
+                                                   gene_vest,
+                                                   pseudo_count)
+        else:
+            # perform simulations to get p-value
+            permutation_result = pm.position_permutation(observed_stats,
+                                                         context_cts,
+                                                         context_to_mutations,
+                                                         sc,  # sequence context obj
+                                                         gs,  # gene sequence obj
+                                                         gene_vest,
+                                                         num_permutations,
+                                                         stop_thresh,
+                                                         pseudo_count,
+                                                         max_batch)
         ent_p_value, vest_p_value = permutation_result
     else:
         num_recurrent = 0
@@ -214,7 +281,7 @@ def calc_position_p_value(mut_info,
         vest_p_value = 1.0
     result = [bed.gene_name, num_recurrent, pos_ent, vest_score,
               ent_p_value, vest_p_value]
-    return result
+    return result, is_exact
 
 
 def calc_hotmaps_p_value(mut_info,
@@ -224,7 +291,8 @@ def calc_hotmaps_p_value(mut_info,
                          bed,
                          window_size,
                          num_permutations,
-                         stop_thresh):
+                         stop_thresh,
+                         max_batch=utils.default_max_batch):
     if len(mut_info) > 0:
         mut_info['Coding Position'] = mut_info['Coding Position'].astype(int)
         mut_info['Context'] = mut_info['Coding Position'].apply(lambda x: sc.pos2context[x])
@@ -260,7 +328,8 @@ def calc_hotmaps_p_value(mut_info,
                                            gs,  # gene sequence obj
                                            window_size,
                                            num_permutations,
-                                           stop_thresh)
+                                           stop_thresh,
+                                           max_batch)
 
         # prepare output
         # NOTE: internally codon positions start at 0, so add 1 for the output
@@ -281,10 +350,12 @@ def calc_protein_p_value(mut_info,
                          num_permutations,
                          stop_thresh,
                          min_recurrent,
-                         min_fraction):
+                         min_fraction,
+                         gene_graph=None):
     """Computes the p-value for clustering on a neighbor graph composed
     of codons connected with edges if they are spatially near in 3D protein
-    structure.
+    structure. The graph is read from graph_dir unless already given as
+    gene_graph.
 
     Parameters
     ----------
@@ -308,7 +379,8 @@ def calc_protein_p_value(mut_info,
 
         # get vest scores for gene if directory provided
         if graph_dir:
-            gene_graph = scores.read_neighbor_graph_pickle(bed.gene_name, graph_dir)
+            if gene_graph is None:
+                gene_graph = scores.read_neighbor_graph(bed.gene_name, graph_dir)
             if gene_graph is None:
                 logger.warning('Could not find neighbor graph for {0}, skipping . . .'.format(bed.gene_name))
         else:
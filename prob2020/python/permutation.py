@@ -1,8 +1,20 @@
 import numpy as np
+import itertools
+import math
 import prob2020.python.utils as utils
 from ..cython import cutils
 import prob2020.python.mutation_context as mc
 import prob2020.python.scores as scores
+import prob2020.python.mymath as mymath
+
+# resolution of VEST scores (three decimal places)
+VEST_RESOLUTION = 1000
+
+# fewest simulations scored at once when checking the stop criteria
+MIN_STAT_CHUNK = 32
+
+# approximate number of simulated MAF lines formatted at once
+MAF_BLOCK_LINES = 20000
 
 
 def deleterious_permutation(obs_del,
@@ -13,7 +25,7 @@ def deleterious_permutation(obs_del,
                             num_permutations=10000,
                             stop_criteria=100,
                             pseudo_count=0,
-                            max_batch=25000):
+                            max_batch=utils.default_max_batch):
     """Performs null-permutations for deleterious mutation statistics
     in a single gene.
 
@@ -36,6 +48,8 @@ def deleterious_permutation(obs_del,
         Pseudo-count for number of deleterious mutations for each
         permutation of the null distribution. Increasing pseudo_count
         makes the statistical test more stringent.
+    max_batch : int
+        maximum number of simulations performed at once
 
     Returns
     -------
@@ -55,6 +69,9 @@ def deleterious_permutation(obs_del,
     if remainder:
         batch_sizes += [remainder]
 
+    # reusable buffer for the random positions of each batch
+    pos_buffer = np.empty((max_batch, len(somatic_base)), dtype=np.int32)
+
     num_sim = 0
     null_del_ct = 0
     for j, batch_size in enumerate(batch_sizes):
@@ -64,9 +81,8 @@ def deleterious_permutation(obs_del,
             break
 
         # get random positions determined by sequence context
-        tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                                batch_size)
-        tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+        tmp_mut_pos = seq_context.fill_random_pos(context_counts.iteritems(),
+                                                  pos_buffer[:batch_size])
 
         # determine result of random positions
         for i, row in enumerate(tmp_mut_pos):
@@ -104,7 +120,7 @@ def position_permutation(obs_stat,
                          num_permutations=10000,
                          stop_criteria=100,
                          pseudo_count=0,
-                         max_batch=25000):
+                         max_batch=utils.default_max_batch):
     """Performs null-permutations for position-based mutation statistics
     in a single gene.
 
@@ -132,6 +148,8 @@ def position_permutation(obs_stat,
         Pseudo-count for number of recurrent missense mutations for each
         permutation for the null distribution. Increasing pseudo_count
         makes the statistical test more stringent.
+    max_batch : int
+        maximum number of simulations performed at once
 
     Returns
     -------
@@ -154,6 +172,9 @@ def position_permutation(obs_stat,
     if remainder:
         batch_sizes += [remainder]
 
+    # reusable buffer for the random positions of each batch
+    pos_buffer = np.empty((max_batch, len(somatic_base)), dtype=np.int32)
+
     obs_recur, obs_ent, obs_delta_ent, obs_vest = obs_stat
     num_sim = 0 # number of simulations
     null_num_recur_ct, null_entropy_ct, null_delta_entropy_ct, null_vest_ct = 0, 0, 0, 0
@@ -163,41 +184,54 @@ def position_permutation(obs_stat,
             break
 
         # get random positions determined by sequence context
-        tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                                batch_size)
-        tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
-
-        # calculate position-based statistics as a result of random positions
-        for i, row in enumerate(tmp_mut_pos):
-            # get info about mutations
-            tmp_mut_info = mc.get_aa_mut_info(row,
-                                              somatic_base,
-                                              gene_seq)
-
-            # calculate position info
-            tmp_recur_ct, tmp_entropy, tmp_delta_entropy, _ = cutils.calc_pos_info(tmp_mut_info['Codon Pos'],
-                                                                                tmp_mut_info['Reference AA'],
-                                                                                tmp_mut_info['Somatic AA'],
-                                                                                pseudo_count=pseudo_count,
-                                                                                is_obs=0)
-            # get vest scores
-            if gene_vest:
-                tmp_vest = scores.compute_vest_stat(gene_vest,
-                                                    tmp_mut_info['Reference AA'],
-                                                    tmp_mut_info['Somatic AA'],
-                                                    tmp_mut_info['Codon Pos'])
-            else:
-                tmp_vest = 0.0
+        tmp_mut_pos = seq_context.fill_random_pos(context_counts.iteritems(),
+                                                  pos_buffer[:batch_size])
+
+        # simulations are scored in chunks. The stop criteria can not be
+        # reached until the smaller count gets enough exceedances, so only
+        # that many simulations (at least MIN_STAT_CHUNK) are scored at once.
+        start = 0
+        while start < batch_size:
+            num_left = stop_criteria - min(null_entropy_ct, null_vest_ct)
+            end = min(batch_size, start + max(num_left, MIN_STAT_CHUNK))
+
+            # calculate position-based statistics as a result of random positions
+            entropy_list = []
+            ref_aa, somatic_aa, codon_pos = [], [], []
+            for row in tmp_mut_pos[start:end]:
+                # get info about mutations
+                tmp_mut_info = mc.get_aa_mut_info(row,
+                                                  somatic_base,
+                                                  gene_seq)
+
+                # calculate position info
+                _, tmp_entropy, _, _ = cutils.calc_pos_info(tmp_mut_info['Codon Pos'],
+                                                            tmp_mut_info['Reference AA'],
+                                                            tmp_mut_info['Somatic AA'],
+                                                            pseudo_count=pseudo_count,
+                                                            is_obs=0)
+                entropy_list.append(tmp_entropy)
+                ref_aa.extend(tmp_mut_info['Reference AA'])
+                somatic_aa.extend(tmp_mut_info['Somatic AA'])
+                codon_pos.extend(tmp_mut_info['Codon Pos'])
+
+            # get mean vest scores for every simulation at once
+            tmp_vest = scores.compute_vest_stat_batch(gene_vest, ref_aa, somatic_aa,
+                                                      codon_pos, end-start)
 
             # update empirical null distribution counts
-            if tmp_entropy-utils.epsilon <= obs_ent: null_entropy_ct += 1
-            if tmp_vest+utils.epsilon >= obs_vest: null_vest_ct += 1
+            entropy_cts = null_entropy_ct + np.cumsum(np.array(entropy_list)-utils.epsilon <= obs_ent)
+            vest_cts = null_vest_ct + np.cumsum(tmp_vest+utils.epsilon >= obs_vest)
 
             # stop iterations if reached sufficient precision
-            if null_vest_ct >= stop_criteria and null_entropy_ct >= stop_criteria:
+            is_done = (entropy_cts >= stop_criteria) & (vest_cts >= stop_criteria)
+            last = int(np.argmax(is_done)) if is_done.any() else end-start-1
+            null_entropy_ct = int(entropy_cts[last])
+            null_vest_ct = int(vest_cts[last])
+            num_sim += last+1
+            if is_done.any():
                 break
-        # update the number of simulations
-        num_sim += i+1
+            start = end
 
     # calculate p-value from empirical null-distribution
     ent_pval = float(null_entropy_ct) / (num_sim)
@@ -206,6 +240,174 @@ def position_permutation(obs_stat,
     return ent_pval, vest_pval
 
 
+def position_exact(obs_stat,
+                   context_counts,
+                   context_to_mut,
+                   seq_context,
+                   gene_seq,
+                   gene_vest=None,
+                   pseudo_count=0):
+    """Computes exact p-values for position-based mutation statistics
+    in a single gene.
+
+    Instead of simulating mutations, the null distribution is enumerated
+    over every way the mutations can collide on the same codon. This is only
+    tractable for genes with few mutations, but it removes the Monte Carlo
+    noise for such genes. The VEST null distribution is the convolution of
+    the score distributions of each mutation.
+
+    Parameters
+    ----------
+    obs_stat : tuple, (recur ct, entropy, delta entropy, mean vest)
+        tuple containing the observed statistics
+    context_counts : pd.Series
+        number of mutations for each context
+    context_to_mut : dict
+        dictionary mapping nucleotide context to a list of observed
+        somatic base changes.
+    seq_context : SequenceContext
+        Sequence context for the entire gene sequence (regardless
+        of where mutations occur). The nucleotide contexts are
+        identified at positions along the gene.
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+    gene_vest : dict or None
+        VEST scores for the gene
+    pseudo_count : int, default: 0
+        Pseudo-count for number of recurrent missense mutations.
+
+    Returns
+    -------
+    ent_pval : float
+        p-value for missense position entropy
+    vest_pval : float
+        p-value for mean VEST score
+    """
+    obs_recur, obs_ent, obs_delta_ent, obs_vest = obs_stat
+
+    # get the distribution of outcomes for each mutation
+    mutations = [(one_context, base)
+                 for one_context in context_counts.index.tolist()
+                 for base in context_to_mut[one_context]]
+    outcome_dict = {}
+    for mut in set(mutations):
+        outcome_dict[mut] = _position_outcome_dist(seq_context.context2pos[mut[0]],
+                                                   mut[1], gene_seq, gene_vest)
+    non_missense_prob = [outcome_dict[mut][0] for mut in mutations]
+    codon_prob = [outcome_dict[mut][1] for mut in mutations]
+    num_mut = len(mutations)
+
+    # probability that every mutation in a group hits the same codon
+    num_codons = max(len(q) for q in codon_prob)
+    codon_prob = [np.pad(q, (0, num_codons-len(q)), 'constant') for q in codon_prob]
+    same_codon_cache = {}
+    def same_codon_prob(group):
+        key = tuple(sorted(group))
+        if key not in same_codon_cache:
+            same_codon_cache[key] = np.prod([codon_prob[i] for i in key], axis=0).sum()
+        return same_codon_cache[key]
+
+    # enumerate the missense mutations and how they collide on codons
+    ent_cache = {}
+    ent_pval = 0.0
+    for num_missense in range(num_mut+1):
+        for missense in itertools.combinations(range(num_mut), num_missense):
+            other_prob = np.prod([non_missense_prob[i] for i in range(num_mut)
+                                  if i not in missense])
+            if other_prob == 0:
+                continue
+            for partition in mymath.set_partitions(missense):
+                # probability that blocks of mutations are on distinct codons,
+                # found by mobius inversion over the coarser partitions
+                partition_prob = 0.0
+                for coarse in mymath.set_partitions(range(len(partition))):
+                    tmp_prob = 1.0
+                    for merged in coarse:
+                        group = [i for b in merged for i in partition[b]]
+                        tmp_prob *= (-1)**(len(merged)-1) * math.factorial(len(merged)-1)
+                        tmp_prob *= same_codon_prob(group)
+                    partition_prob += tmp_prob
+                partition_prob = max(partition_prob, 0.0)
+
+                # the entropy only depends on the size of the blocks
+                block_sizes = tuple(sorted(len(b) for b in partition))
+                if block_sizes not in ent_cache:
+                    fake_pos = [k for k, size in enumerate(block_sizes) for j in range(size)]
+                    fake_aa = ['A'] * len(fake_pos)
+                    fake_somatic = ['C'] * len(fake_pos)
+                    ent_cache[block_sizes] = cutils.calc_pos_info(fake_pos, fake_aa, fake_somatic,
+                                                                  pseudo_count=pseudo_count,
+                                                                  is_obs=0)[1]
+                if ent_cache[block_sizes]-utils.epsilon <= obs_ent:
+                    ent_pval += other_prob * partition_prob
+
+    # the vest null distribution is a convolution of each mutation's scores
+    if gene_vest:
+        vest_pmf, vest_offset = np.ones(1), 0
+        for mut in mutations:
+            tmp_pmf, tmp_offset = outcome_dict[mut][2]
+            vest_pmf = np.convolve(vest_pmf, tmp_pmf)
+            vest_offset += tmp_offset
+        vest_vals = (np.arange(len(vest_pmf)) + vest_offset) / float(VEST_RESOLUTION*num_mut)
+        vest_pval = vest_pmf[vest_vals+utils.epsilon >= obs_vest].sum()
+    else:
+        vest_pval = 1.0
+
+    return min(ent_pval, 1.0), min(vest_pval, 1.0)
+
+
+def _position_outcome_dist(positions, somatic_base, gene_seq, gene_vest):
+    """Gets the distribution of outcomes for a mutation to the somatic base
+    at a uniformly random position.
+
+    Parameters
+    ----------
+    positions : list
+        positions within the gene sequence
+    somatic_base : str
+        somatic base of the mutation
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+    gene_vest : dict or None
+        VEST scores for the gene
+
+    Returns
+    -------
+    non_missense_prob : float
+        probability that the mutation is not missense
+    codon_prob : np.array
+        probability that the mutation is a missense mutation at each codon
+    vest_dist : tuple, (pmf, offset) or None
+        distribution of VEST scores on an integer grid
+    """
+    num_pos = float(len(positions))
+    mut_info = mc.get_aa_mut_info(positions,
+                                  [somatic_base]*len(positions),
+                                  gene_seq)
+    ref_aa = mut_info['Reference AA']
+    somatic_aa = mut_info['Somatic AA']
+    codon_pos = mut_info['Codon Pos']
+
+    # missense mutations are defined the same as in cutils.calc_pos_info
+    missense_pos = [codon_pos[i] for i in range(len(positions))
+                    if ref_aa[i] and somatic_aa[i] and ref_aa[i] != '*' and
+                    somatic_aa[i] != '*' and ref_aa[i] != somatic_aa[i] and
+                    codon_pos[i] is not None]
+    codon_prob = np.bincount(np.array(missense_pos, dtype=int)) / num_pos
+    non_missense_prob = 1 - len(missense_pos) / num_pos
+
+    # distribution of vest scores
+    if gene_vest:
+        vest_scores = scores.fetch_vest_scores(gene_vest, ref_aa, somatic_aa, codon_pos)
+        vest_int = np.rint(np.array(vest_scores)*VEST_RESOLUTION).astype(int)
+        vest_offset = vest_int.min()
+        vest_dist = (np.bincount(vest_int-vest_offset) / num_pos, vest_offset)
+    else:
+        vest_dist = None
+
+    return non_missense_prob, codon_prob, vest_dist
+
+
 def hotmaps_permutation(obs_stat,
                         context_counts,
                         context_to_mut,
@@ -214,7 +416,7 @@ def hotmaps_permutation(obs_stat,
                         window,
                         num_permutations=10000,
                         stop_criteria=100,
-                        max_batch=25000):
+                        max_batch=utils.default_max_batch):
     """Performs null-permutations for position-based mutation statistics
     in a single gene.
 
@@ -266,6 +468,9 @@ def hotmaps_permutation(obs_stat,
     if remainder:
         batch_sizes += [remainder]
 
+    # reusable buffer for the random positions of each batch
+    pos_buffer = np.empty((max_batch, len(somatic_base)), dtype=np.int32)
+
     # figure out which position has highest value
     max_key = max(obs_stat, key=(lambda key: obs_stat[key]))
 
@@ -279,9 +484,8 @@ def hotmaps_permutation(obs_stat,
             break
 
         # get random positions determined by sequence context
-        tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                                batch_size)
-        tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+        tmp_mut_pos = seq_context.fill_random_pos(context_counts.iteritems(),
+                                                  pos_buffer[:batch_size])
 
         # calculate position-based statistics as a result of random positions
         for i, row in enumerate(tmp_mut_pos):
@@ -365,9 +569,8 @@ def protein_permutation(graph_score,
                     for base in context_to_mut[one_context]]
 
     # get random positions determined by sequence context
-    tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                            num_permutations)
-    tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+    tmp_mut_pos = np.empty((num_permutations, len(somatic_base)), dtype=np.int32)
+    seq_context.fill_random_pos(context_counts.iteritems(), tmp_mut_pos)
 
     # calculate position-based statistics as a result of random positions
     null_graph_entropy_ct = 0
@@ -486,9 +689,8 @@ def effect_permutation(context_counts,
                     for base in context_to_mut[one_context]]
 
     # get random positions determined by sequence context
-    tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                            num_permutations)
-    tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+    tmp_mut_pos = np.empty((num_permutations, len(somatic_base)), dtype=np.int32)
+    seq_context.fill_random_pos(context_counts.iteritems(), tmp_mut_pos)
 
     # calculate position-based statistics as a result of random positions
     effect_entropy_list, recur_list, inactivating_list = [], [], []
@@ -545,9 +747,8 @@ def non_silent_ratio_permutation(context_counts,
                     for base in context_to_mut[one_context]]
 
     # get random positions determined by sequence context
-    tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                            num_permutations)
-    tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+    tmp_mut_pos = np.empty((num_permutations, len(somatic_base)), dtype=np.int32)
+    seq_context.fill_random_pos(context_counts.iteritems(), tmp_mut_pos)
 
     # determine result of random positions
     non_silent_count_list = []
@@ -565,6 +766,105 @@ def non_silent_ratio_permutation(context_counts,
     return non_silent_count_list
 
 
+def non_silent_ratio_multinomial(context_counts,
+                                 context_to_mut,
+                                 seq_context,
+                                 gene_seq,
+                                 num_permutations=10000):
+    """Simulates mutation type counts for the non-silent ratio by drawing
+    them directly from a multinomial distribution.
+
+    The effect of a random mutation only depends on its sequence context
+    and somatic base, so the probability of each mutation type is computed
+    once from all positions in the gene with that context. The counts for
+    every iteration are then drawn as multinomials instead of simulating
+    the position of each individual mutation.
+
+    Parameters
+    ----------
+    context_counts : pd.Series
+        number of mutations for each context
+    context_to_mut : dict
+        dictionary mapping nucleotide context to a list of observed
+        somatic base changes.
+    seq_context : SequenceContext
+        Sequence context for the entire gene sequence (regardless
+        of where mutations occur). The nucleotide contexts are
+        identified at positions along the gene.
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+    num_permutations : int, default: 10000
+        number of permutations to create for null
+
+    Returns
+    -------
+    mut_type_counts : np.array
+        num_permutations by 7 array of non-silent, silent, nonsense,
+        lost stop, splice site, lost start and missense counts under the null
+    """
+    mut_type_counts = np.zeros((num_permutations, 7), dtype=int)
+    for context, num_muts in context_counts.iteritems():
+        # every position available for mutations with this context
+        available_pos = seq_context.context2pos[context]
+        prng = seq_context.prng_dict[context]
+
+        # count the observed somatic bases within this context
+        base_counts = {}
+        for base in context_to_mut[context]:
+            base_counts[base] = base_counts.get(base, 0) + 1
+
+        for base in sorted(base_counts):
+            # probability of each mutation type for a random position
+            type_prob = mutation_type_prob(available_pos, base, gene_seq)
+
+            # draw the number of mutations of each type
+            tmp_counts = prng.multinomial(base_counts[base], type_prob,
+                                          size=num_permutations)
+            mut_type_counts[:, 1:] += tmp_counts[:, :-1]
+
+    # non-silent is everything except silent mutations
+    mut_type_counts[:, 0] = mut_type_counts[:, 2:].sum(axis=1)
+    return mut_type_counts
+
+
+def mutation_type_prob(positions, somatic_base, gene_seq):
+    """Computes the probability of each mutation type when a mutation
+    to the somatic base occurs uniformly at one of the given positions.
+
+    Parameters
+    ----------
+    positions : list
+        positions within the gene sequence
+    somatic_base : str
+        somatic base of the mutation
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+
+    Returns
+    -------
+    type_prob : np.array
+        probability of silent, nonsense, lost stop, splice site, lost start,
+        missense and unclassified mutations (in that order)
+    """
+    var_types = ['Silent', 'Nonsense_Mutation', 'Nonstop_Mutation',
+                 'Splice_Site', 'Translation_Start_Site', 'Missense_Mutation']
+    var2ix = {v: i for i, v in enumerate(var_types)}
+
+    # classify a mutation at every possible position
+    mut_info = mc.get_aa_mut_info(positions,
+                                  [somatic_base]*len(positions),
+                                  gene_seq)
+    var_class = cutils.get_variant_classification(mut_info['Reference AA'],
+                                                  mut_info['Somatic AA'],
+                                                  mut_info['Codon Pos'])
+
+    # count each mutation type, the last entry is for unclassified mutations
+    type_counts = np.zeros(len(var_types)+1)
+    for v in var_class:
+        type_counts[var2ix.get(v.decode(), len(var_types))] += 1
+    return type_counts / type_counts.sum()
+
+
 def summary_permutation(context_counts,
                         context_to_mut,
                         seq_context,
@@ -605,37 +905,132 @@ def summary_permutation(context_counts,
                     for base in context_to_mut[one_context]]
 
     # get random positions determined by sequence context
-    tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                            num_permutations)
-    tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
+    tmp_mut_pos = np.empty((num_permutations, len(somatic_base)), dtype=np.int32)
+    seq_context.fill_random_pos(context_counts.iteritems(), tmp_mut_pos)
 
     # determine result of random positions
     gene_name = gene_seq.bed.gene_name
     gene_len = gene_seq.bed.cds_len
     summary_info_list = []
+    all_ref_aa, all_somatic_aa, all_codon_pos = [], [], []
     for i, row in enumerate(tmp_mut_pos):
         # get info about mutations
         tmp_mut_info = mc.get_aa_mut_info(row,
                                           somatic_base,
                                           gene_seq)
 
-        # Get all metrics summarizing each gene
+        # Get all metrics summarizing each gene, scores are added below
         tmp_summary = cutils.calc_summary_info(tmp_mut_info['Reference AA'],
                                                tmp_mut_info['Somatic AA'],
                                                tmp_mut_info['Codon Pos'],
                                                gene_name,
-                                               score_dir,
+                                               None,
                                                min_frac=min_frac,
                                                min_recur=min_recur)
+        all_ref_aa.extend(tmp_mut_info['Reference AA'])
+        all_somatic_aa.extend(tmp_mut_info['Somatic AA'])
+        all_codon_pos.extend(tmp_mut_info['Codon Pos'])
 
         # limit the precision of floats
         #pos_ent = tmp_summary[-1]
         #tmp_summary[-1] = '{0:.5f}'.format(pos_ent)
 
         summary_info_list.append([gene_name, i+1, gene_len]+tmp_summary)
+
+    # score all of the simulations together, scores go before the
+    # position counts at the end of each summary
+    if score_dir:
+        gene_scores = scores.load_gene_scores(gene_name, score_dir)
+        total_mga_ent, total_vest = scores.summary_scores(gene_scores,
+                                                          all_ref_aa,
+                                                          all_somatic_aa,
+                                                          all_codon_pos,
+                                                          num_rows=len(summary_info_list))
+        for i, tmp_summary in enumerate(summary_info_list):
+            tmp_summary[-1:-1] = [total_mga_ent[i], total_vest[i]]
     return summary_info_list
 
 
+def _maf_permutation_setup(context_counts, context_to_mut):
+    """Lists the somatic base and context of each simulated mutation.
+
+    The order matches the columns filled by SequenceContext.fill_random_pos.
+
+    Returns
+    -------
+    somatic_base : tuple of str
+        somatic base of each mutation
+    base_context : tuple of str
+        nucleotide context of each mutation
+    """
+    mycontexts = context_counts.index.tolist()
+    somatic_base, base_context = zip(*[(base, one_context)
+                                       for one_context in mycontexts
+                                       for base in context_to_mut[one_context]])
+    return somatic_base, base_context
+
+
+def _maf_block(pos_block, somatic_base, base_context, gene_seq):
+    """Annotates a block of simulated mutation positions.
+
+    All permutations in the block are annotated together, so genome
+    coordinates, amino acid changes and variant classes are computed
+    once per block instead of once per permutation.
+
+    Parameters
+    ----------
+    pos_block : np.array
+        random positions (permutations by mutations)
+    somatic_base : tuple of str
+        somatic base of each mutation
+    base_context : tuple of str
+        nucleotide context of each mutation
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+
+    Returns
+    -------
+    columns : list
+        one sequence per MAF column, with one entry per simulated mutation
+        in row-major order of pos_block
+    """
+    num_rows = pos_block.shape[0]
+    flat_pos = pos_block.ravel()
+    flat_somatic = list(somatic_base) * num_rows
+    num_muts = len(flat_somatic)
+
+    # get genome coordinate
+    genome_coord = (gene_seq.bed.seq_to_genome(flat_pos) + 1).tolist()
+
+    # get info about mutations
+    tmp_mut_info = mc.get_aa_mut_info(flat_pos, flat_somatic, gene_seq)
+
+    # get string describing variant
+    var_class = cutils.get_variant_classification(tmp_mut_info['Reference AA'],
+                                                  tmp_mut_info['Somatic AA'],
+                                                  tmp_mut_info['Codon Pos'])
+
+    # format DNA and protein change
+    ref_nuc = tmp_mut_info['Reference Nuc']
+    dna_change = ['c.{0}{1}>{2}'.format(r, p, b)
+                  for r, p, b in zip(ref_nuc, flat_pos.tolist(), flat_somatic)]
+    protein_change = ['p.{0}{1}{2}'.format(r, c, m)
+                      for r, c, m in zip(tmp_mut_info['Reference AA'],
+                                         tmp_mut_info['Codon Pos'],
+                                         tmp_mut_info['Somatic AA'])]
+
+    # reverse complement if on negative strand
+    strand = gene_seq.bed.strand
+    if strand == '-':
+        ref_nuc = [utils.rev_comp(r) for r in ref_nuc]
+        flat_somatic = [utils.rev_comp(b) for b in somatic_base] * num_rows
+
+    return [[gene_seq.bed.gene_name] * num_muts, [strand] * num_muts,
+            [gene_seq.bed.chrom] * num_muts, genome_coord, genome_coord,
+            ref_nuc, flat_somatic, list(base_context) * num_rows,
+            dna_change, protein_change, [v.decode() for v in var_class]]
+
+
 def maf_permutation(context_counts,
                     context_to_mut,
                     seq_context,
@@ -668,62 +1063,108 @@ def maf_permutation(context_counts,
     maf_list : list of tuples
         list of null mutations with mutation info in a MAF like format
     """
-    mycontexts = context_counts.index.tolist()
-    somatic_base, base_context = zip(*[(base, one_context)
-                                       for one_context in mycontexts
-                                       for base in context_to_mut[one_context]])
+    somatic_base, base_context = _maf_permutation_setup(context_counts,
+                                                        context_to_mut)
 
     # get random positions determined by sequence context
-    tmp_contxt_pos = seq_context.random_pos(context_counts.iteritems(),
-                                            num_permutations)
-    tmp_mut_pos = np.hstack(pos_array for base, pos_array in tmp_contxt_pos)
-
-    # info about gene
-    gene_name = gene_seq.bed.gene_name
-    strand = gene_seq.bed.strand
-    chrom = gene_seq.bed.chrom
-    gene_seq.bed.init_genome_coordinates()  # map seq pos to genome
-
-    # determine result of random positions
-    maf_list = []
-    for row in tmp_mut_pos:
-        # get genome coordinate
-        pos2genome = np.vectorize(lambda x: gene_seq.bed.seqpos2genome[x]+1)
-        genome_coord = pos2genome(row)
-
-        # get info about mutations
-        tmp_mut_info = mc.get_aa_mut_info(row,
-                                          somatic_base,
-                                          gene_seq)
-
-        # get string describing variant
-        var_class = cutils.get_variant_classification(tmp_mut_info['Reference AA'],
-                                                      tmp_mut_info['Somatic AA'],
-                                                      tmp_mut_info['Codon Pos'])
-
-        # prepare output
-        for k, mysomatic_base in enumerate(somatic_base):
-            # format DNA change
-            ref_nuc = tmp_mut_info['Reference Nuc'][k]
-            nuc_pos = row[k]
-            dna_change = 'c.{0}{1}>{2}'.format(ref_nuc, nuc_pos, mysomatic_base)
+    tmp_mut_pos = np.empty((num_permutations, len(somatic_base)), dtype=np.int32)
+    seq_context.fill_random_pos(context_counts.iteritems(), tmp_mut_pos)
+    columns = _maf_block(tmp_mut_pos, somatic_base, base_context, gene_seq)
+    maf_list = [list(maf_line) for maf_line in zip(*columns)]
+    return maf_list
 
-            # format protein change
-            ref_aa = tmp_mut_info['Reference AA'][k]
-            somatic_aa = tmp_mut_info['Somatic AA'][k]
-            codon_pos = tmp_mut_info['Codon Pos'][k]
-            protein_change = 'p.{0}{1}{2}'.format(ref_aa, codon_pos, somatic_aa)
 
-            # reverse complement if on negative strand
-            if strand == '-':
-                ref_nuc = utils.rev_comp(ref_nuc)
-                mysomatic_base = utils.rev_comp(mysomatic_base)
+def maf_permutation_column_blocks(context_counts,
+                                  context_to_mut,
+                                  seq_context,
+                                  gene_seq,
+                                  num_permutations=10000,
+                                  block_lines=MAF_BLOCK_LINES):
+    """Performs the same null-permutations as maf_permutation, but yields the
+    simulated mutations as columns in blocks of about block_lines rows,
+    so all permutations never have to be held in memory.
 
+    Parameters
+    ----------
+    context_counts : pd.Series
+        number of mutations for each context
+    context_to_mut : dict
+        dictionary mapping nucleotide context to a list of observed
+        somatic base changes.
+    seq_context : SequenceContext
+        Sequence context for the entire gene sequence (regardless
+        of where mutations occur). The nucleotide contexts are
+        identified at positions along the gene.
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+    num_permutations : int, default: 10000
+        number of permutations to create for null
+    block_lines : int
+        approximate number of rows in each block
+
+    Yields
+    ------
+    columns : list
+        one sequence per MAF column for a block of permutations
+    iterations : np.array
+        permutation number of each row
+    """
+    somatic_base, base_context = _maf_permutation_setup(context_counts,
+                                                        context_to_mut)
+    num_muts = len(somatic_base)
+    block_rows = max(block_lines // num_muts, 1)
+
+    # reusable buffer for the random positions of each block. Each context
+    # has its own seeded prng, so drawing block by block gives the same
+    # positions as drawing all permutations at once.
+    pos_buffer = np.empty((min(block_rows, num_permutations), num_muts),
+                          dtype=np.int32)
+    for i in range(0, num_permutations, block_rows):
+        num_rows = min(block_rows, num_permutations - i)
+        pos_block = seq_context.fill_random_pos(context_counts.iteritems(),
+                                                pos_buffer[:num_rows])
+        columns = _maf_block(pos_block, somatic_base, base_context, gene_seq)
+        iterations = np.repeat(np.arange(i, i+len(pos_block)), num_muts)
+        yield columns, iterations
+
+
+def maf_permutation_blocks(context_counts,
+                           context_to_mut,
+                           seq_context,
+                           gene_seq,
+                           num_permutations=10000,
+                           block_lines=MAF_BLOCK_LINES):
+    """Performs the same null-permutations as maf_permutation, but yields the
+    MAF lines as tab delimited text in blocks of about block_lines lines.
 
-            # append results
-            maf_line = [gene_name, strand, chrom, genome_coord[k], genome_coord[k],
-                        ref_nuc, mysomatic_base, base_context[k], dna_change,
-                        protein_change, var_class[k].decode()]
-            maf_list.append(maf_line)
+    Parameters
+    ----------
+    context_counts : pd.Series
+        number of mutations for each context
+    context_to_mut : dict
+        dictionary mapping nucleotide context to a list of observed
+        somatic base changes.
+    seq_context : SequenceContext
+        Sequence context for the entire gene sequence (regardless
+        of where mutations occur). The nucleotide contexts are
+        identified at positions along the gene.
+    gene_seq : GeneSequence
+        Sequence of gene of interest
+    num_permutations : int, default: 10000
+        number of permutations to create for null
+    block_lines : int
+        approximate number of lines in each block
 
-    return maf_list
+    Yields
+    ------
+    maf_text : str
+        tab delimited MAF lines for a block of permutations
+    """
+    for columns, iterations in maf_permutation_column_blocks(context_counts,
+                                                             context_to_mut,
+                                                             seq_context,
+                                                             gene_seq,
+                                                             num_permutations,
+                                                             block_lines):
+        yield ''.join('\t'.join(map(str, maf_line)) + '\n'
+                      for maf_line in zip(*columns))
@@ -0,0 +1,213 @@
+"""This module estimates the cost of running probabilistic 20/20 before
+committing to a full run."""
+import prob2020.python.utils as utils
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)  # module logger
+
+
+def gene_workload(bed_dict, mut_df):
+    """Summarizes the amount of work for each gene.
+
+    Parameters
+    ----------
+    bed_dict : dict
+        dictionary mapping chromosome keys to a list of BED lines
+    mut_df : pd.DataFrame
+        mutations after the same filtering as the real run
+
+    Returns
+    -------
+    workload_df : pd.DataFrame
+        gene, chromosome, CDS length and number of mutations for each gene
+    """
+    mut_cts = mut_df['Gene'].value_counts()
+    rows = [[bed.gene_name, chrom, bed.cds_len, int(mut_cts.get(bed.gene_name, 0))]
+            for chrom in bed_dict
+            for bed in bed_dict[chrom]]
+    workload_df = pd.DataFrame(rows, columns=['gene', 'chromosome',
+                                              'CDS length', 'num mutations'])
+    return workload_df
+
+
+def expected_simulations(num_iterations, stop_criteria):
+    """Expected number of simulations for a gene following the null
+    hypothesis.
+
+    A null gene has a uniformly distributed p-value p, and the simulations
+    stop after stop_criteria exceedances (about stop_criteria / p
+    simulations) or after num_iterations. Averaging over p gives
+    stop_criteria * (1 + ln(num_iterations / stop_criteria)).
+
+    Parameters
+    ----------
+    num_iterations : int
+        maximum number of simulations
+    stop_criteria : int
+        number of exceedances needed to stop early
+
+    Returns
+    -------
+    num_sim : float
+        expected number of simulations
+    """
+    if num_iterations <= stop_criteria:
+        return float(num_iterations)
+    return stop_criteria * (1 + np.log(float(num_iterations) / stop_criteria))
+
+
+def exact_max_mutations(opts):
+    """Largest number of mutations in a gene whose p-values are computed
+    exactly instead of by simulations."""
+    return opts.get('exact_max_mutations', 0) if opts['kind'] == 'oncogene' else 0
+
+
+def calibrate(workload_df, time_gene_func,
+              num_sample=5, num_iterations=200, exact_max=0):
+    """Times a small sample of representative genes to estimate the cost
+    of simulations.
+
+    Parameters
+    ----------
+    workload_df : pd.DataFrame
+        output of gene_workload
+    time_gene_func : function
+        function taking a gene name and number of iterations that returns
+        the number of seconds to test the gene
+    num_sample : int
+        number of genes to time
+    num_iterations : int
+        number of simulations used for timing
+    exact_max : int
+        genes with at most this number of mutations are computed exactly,
+        their time does not grow with simulations so they are not timed
+
+    Returns
+    -------
+    setup_time : float
+        seconds spent on each gene regardless of simulations
+    sim_time : float
+        seconds per simulated mutation
+    """
+    # pick simulated genes spread across the range of mutation counts, or
+    # only time the setup if every gene is computed exactly
+    mutated = workload_df[workload_df['num mutations']>exact_max]
+    if not len(mutated):
+        mutated = workload_df[workload_df['num mutations']>0]
+    if not len(mutated):
+        return 0.0, 0.0
+    mutated = mutated.sort_values('num mutations')
+    sample_ixs = np.unique(np.linspace(0, len(mutated)-1, num_sample).astype(int))
+    sample_df = mutated.iloc[sample_ixs]
+
+    setup_times, sim_times = [], []
+    for gene, num_mut in zip(sample_df['gene'], sample_df['num mutations']):
+        tmp_setup = time_gene_func(gene, 1)
+        tmp_total = time_gene_func(gene, num_iterations)
+        setup_times.append(tmp_setup)
+        sim_times.append(max(tmp_total - tmp_setup, 0) / float(num_mut * (num_iterations-1)))
+        logger.info('Calibration: {0} ({1} mutations) took {2:.3f} seconds.'.format(gene, num_mut, tmp_total))
+    return float(np.mean(setup_times)), float(np.mean(sim_times))
+
+
+def estimate_wall_time(chrom_times, num_processes):
+    """Estimates wall time when chromosomes are processed in groups of
+    num_processes, largest chromosomes first, like the real run.
+
+    Parameters
+    ----------
+    chrom_times : pd.Series
+        estimated seconds for each chromosome
+    num_processes : int
+        number of processes (0 indicates a single process)
+
+    Returns
+    -------
+    wall_time : float
+        estimated seconds
+    """
+    num_processes = max(num_processes, 1)
+    chrom_times = chrom_times.sort_values(ascending=False).values
+    return float(sum(chrom_times[i:i+num_processes].max()
+                     for i in range(0, len(chrom_times), num_processes)))
+
+
+def plan(workload_df, opts, setup_time, sim_time, mut_df_bytes=0):
+    """Estimates the simulations, wall time and memory of a run.
+
+    Parameters
+    ----------
+    workload_df : pd.DataFrame
+        output of gene_workload
+    opts : dict
+        options for the run
+    setup_time : float
+        seconds spent on each gene regardless of simulations
+    sim_time : float
+        seconds per simulated mutation
+    mut_df_bytes : int
+        size of the mutation data frame copied to each worker
+
+    Returns
+    -------
+    workload_df : pd.DataFrame
+        workload with expected simulations and time for each gene
+    summary : dict
+        summary of the estimates and recommendations
+    """
+    num_iter = opts['num_iterations']
+    stop_criteria = opts['stop_criteria']
+    exact_max = exact_max_mutations(opts)
+    workload_df = workload_df.copy()
+    num_mut = workload_df['num mutations']
+    mutated = num_mut > 0
+
+    # expected number of simulations
+    expected_sim = expected_simulations(num_iter, stop_criteria)
+    workload_df['expected simulations'] = np.where(mutated & (num_mut > exact_max), expected_sim, 0)
+    workload_df['max simulations'] = np.where(mutated & (num_mut > exact_max), num_iter, 0)
+    workload_df['expected seconds'] = np.where(mutated, setup_time, 0) + \
+        sim_time * num_mut * workload_df['expected simulations']
+    workload_df['max seconds'] = np.where(mutated, setup_time, 0) + \
+        sim_time * num_mut * workload_df['max simulations']
+
+    # wall time depends on how chromosomes are split across processes
+    chrom_times = workload_df.groupby('chromosome')['expected seconds'].sum()
+    chrom_max_times = workload_df.groupby('chromosome')['max seconds'].sum()
+    num_processes = opts['processes']
+    wall_time = estimate_wall_time(chrom_times, num_processes)
+    max_wall_time = estimate_wall_time(chrom_max_times, num_processes)
+
+    # recommend the fewest processes that are close to the best wall time
+    max_useful = len(chrom_times)
+    wall_times = [estimate_wall_time(chrom_times, p) for p in range(1, max_useful+1)]
+    best_time = min(wall_times)
+    rec_processes = next(p for p, t in zip(range(1, max_useful+1), wall_times)
+                         if t <= 1.05*best_time)
+
+    # memory for the largest batch of simulated positions in each worker
+    max_mut = int(num_mut.max()) if len(num_mut) else 0
+    batch_size = utils.max_batch_size(max_mut, opts.get('memory_budget'), num_processes)
+    batch_size = min(batch_size, num_iter)
+    batch_bytes = batch_size * max_mut * utils.bytes_per_sim_position
+    worker_bytes = batch_bytes + mut_df_bytes
+    total_bytes = worker_bytes * max(num_processes, 1) + mut_df_bytes
+
+    summary = OrderedDict([
+        ('genes', len(workload_df)),
+        ('genes with mutations', int(mutated.sum())),
+        ('mutations', int(num_mut.sum())),
+        ('expected simulations', float(workload_df['expected simulations'].sum())),
+        ('max simulations', float(workload_df['max simulations'].sum())),
+        ('expected wall time (s)', wall_time),
+        ('max wall time (s)', max_wall_time),
+        ('peak memory per worker (MB)', worker_bytes / 1024.**2),
+        ('peak memory total (MB)', total_bytes / 1024.**2),
+        ('recommended processes', rec_processes),
+        ('recommended batch size', batch_size),
+    ])
+    return workload_df, summary
+
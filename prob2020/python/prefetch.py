@@ -0,0 +1,110 @@
+"""This module prepares the inputs of upcoming genes in a background thread.
+
+Before a gene is simulated, its sequence is fetched from the FASTA file,
+its sequence context is built, its mutations are normalized and its scores
+are read. These steps are mostly I/O, so they are run in a background
+thread for the next few genes while the current gene is simulated. A
+bounded queue limits how many prepared genes are held in memory.
+"""
+import threading
+import logging
+
+try:
+    import queue
+except ImportError:
+    # python 2.7
+    import Queue as queue
+
+logger = logging.getLogger(__name__)  # module logger
+
+# number of genes prepared ahead of the gene being simulated
+default_depth = 2
+
+# seconds between checks for a stopped consumer while the queue is full
+_put_timeout = .1
+
+_done = object()  # marks the end of the genes
+
+
+class GenePrefetcher(object):
+    """Iterates over the prepared inputs of genes, preparing the next genes
+    in a background thread.
+
+    Prepared genes are yielded in the same order as bed_list. An error while
+    preparing a gene is raised by the iterator when that gene is reached.
+
+    Parameters
+    ----------
+    bed_list : list
+        BedLine of each gene
+    prepare : function
+        called with a BedLine, returns the prepared inputs of the gene.
+        Only called from the background thread. Objects it uses, such as a
+        FASTA handle, must not be used by the consumer until iteration is
+        finished.
+    depth : int
+        number of prepared genes held in the queue
+    """
+
+    def __init__(self, bed_list, prepare, depth=default_depth):
+        self.bed_list = bed_list
+        self.prepare = prepare
+        self._queue = queue.Queue(maxsize=max(depth, 1))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _put(self, item):
+        """Puts an item on the queue, returns False if the consumer stopped."""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=_put_timeout)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        for bed in self.bed_list:
+            try:
+                item = (bed, self.prepare(bed), None)
+            except Exception as exc:
+                item = (bed, None, exc)
+            if not self._put(item) or item[2] is not None:
+                return
+        self._put(_done)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _done:
+                    break
+                bed, prepared, exc = item
+                if exc is not None:
+                    logger.error('Failed to prepare {0}.'.format(bed.gene_name))
+                    raise exc
+                yield bed, prepared
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops the background thread."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def iter_prepared(bed_list, prepare, depth=default_depth):
+    """Yields each BedLine with its prepared inputs.
+
+    Genes are prepared in a background thread if depth is positive,
+    otherwise they are prepared one at a time when they are reached.
+    """
+    if depth > 0:
+        for bed, prepared in GenePrefetcher(bed_list, prepare, depth):
+            yield bed, prepared
+    else:
+        for bed in bed_list:
+            yield bed, prepare(bed)
@@ -0,0 +1,184 @@
+"""This module caches the permutation test results of each gene on disk.
+
+The result of a gene only depends on its sequence, its mutations, the
+options of the test and the random seed, so these are hashed into a key.
+Later runs with the same key load the saved result instead of repeating
+the simulations. The cache is bounded in size by removing the least
+recently used results.
+"""
+import prob2020.python.utils as utils
+import pandas as pd
+import hashlib
+import logging
+import pickle
+import json
+import os
+
+logger = logging.getLogger(__name__)  # module logger
+
+# change when the format of results changes, so old results are not used
+CACHE_VERSION = 1
+
+# options that change the result of a gene
+result_opts = ['kind', 'context', 'num_iterations', 'stop_criteria',
+               'recurrent', 'fraction', 'exact_max_mutations', 'deleterious',
+               'window', 'score_dir', 'neighbor_graph_dir', 'seed']
+
+# default size limit of the cache in MB
+default_cache_size = 500
+
+# fraction of the size limit kept after removing old results
+evict_fraction = .9
+
+
+# score files read for a gene, when the score option is a directory
+score_files = {'score_dir': ['{0}.vest.pickle', '{0}.mgaentropy.pickle'],
+               'neighbor_graph_dir': ['{0}.pickle']}
+
+
+def score_file_stats(gname, opts):
+    """Size and modification time of the score files used for a gene, so
+    that results are not reused after the scores are edited.
+
+    Parameters
+    ----------
+    gname : str
+        name of gene
+    opts : dict
+        command line options
+
+    Returns
+    -------
+    stats : dict
+        maps each score file to its size and modification time
+    """
+    stats = {}
+    for opt, file_names in score_files.items():
+        score_path = opts.get(opt)
+        if not score_path:
+            continue
+        if os.path.isfile(score_path):
+            paths = [score_path]
+        else:
+            paths = [os.path.join(score_path, f.format(gname)) for f in file_names]
+        for path in paths:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                stats[path] = [stat.st_size, utils.file_mtime_ns(stat)]
+    return stats
+
+
+def gene_key(gene_seq, mut_info, unmapped_mut_info, opts):
+    """Makes the cache key for the result of a gene.
+
+    The number of simulations per batch is left out, since results do not
+    depend on it.
+
+    Parameters
+    ----------
+    gene_seq : GeneSequence
+        sequence of the gene
+    mut_info : pd.DataFrame
+        mutations mapped to the reference transcript
+    unmapped_mut_info : dict
+        mutations not mapped to the reference transcript
+    opts : dict
+        command line options
+
+    Returns
+    -------
+    key : str
+        hex digest identifying the result
+    """
+    bed = gene_seq.bed
+    params = {k: opts.get(k) for k in result_opts}
+    params.update({'version': CACHE_VERSION,
+                   'score_files': score_file_stats(bed.gene_name, opts),
+                   'gene': bed.gene_name, 'chrom': bed.chrom, 'strand': bed.strand,
+                   'exon_starts': bed.exon_starts.tolist(),
+                   'exon_ends': bed.exon_ends.tolist()})
+    myhash = hashlib.sha1()
+    myhash.update(json.dumps(params, sort_keys=True, default=str).encode())
+    myhash.update(gene_seq.exon_seq.encode())
+    myhash.update(''.join(gene_seq.five_prime_seq + gene_seq.three_prime_seq).encode())
+    myhash.update(','.join(mut_info.columns).encode())
+    myhash.update(pd.util.hash_pandas_object(mut_info, index=False).values.tobytes())
+    myhash.update(json.dumps(unmapped_mut_info, sort_keys=True, default=str).encode())
+    return myhash.hexdigest()
+
+
+class ResultCache(object):
+    """Directory of saved gene results with least recently used eviction.
+
+    Results are written to a temporary file and renamed, so several
+    processes can share a cache directory.
+
+    Parameters
+    ----------
+    path : str
+        cache directory, created if it does not exist
+    max_size : float
+        size limit of the cache in MB
+    """
+
+    def __init__(self, path, max_size=default_cache_size):
+        self.path = path
+        self.max_bytes = max_size * 1024 * 1024
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def _entries(self):
+        """Path, size and last use time of each saved result."""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue  # removed by another process
+            entries.append((os.path.join(self.path, name), stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Loads a saved result, or returns None if there is none."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as handle:
+                result = pickle.load(handle)
+            os.utime(path, None)  # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """Saves a result, removing old results if the cache is too large."""
+        path = self._entry_path(key)
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as handle:
+            pickle.dump(result, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        self._size += os.path.getsize(tmp_path)
+        utils.replace_file(tmp_path, path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Removes the least recently used results until the cache is below
+        the size limit."""
+        entries = sorted(self._entries(), key=lambda x: x[2])
+        self._size = sum(size for _, size, _ in entries)
+        num_removed = 0
+        for path, size, _ in entries:
+            if self._size <= evict_fraction * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by another process
+            self._size -= size
+            num_removed += 1
+        logger.debug('Removed {0} results from the cache.'.format(num_removed))
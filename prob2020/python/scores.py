@@ -1,8 +1,12 @@
 #from ..cython import cutils
 import numpy as np
 import os
+import glob
 import prob2020.python.mymath as mymath
+import prob2020.python.utils as utils
+import prob2020.python.array_store as array_store
 import sys
+from collections import OrderedDict
 
 # import pickle module
 try:
@@ -12,6 +16,264 @@ except:
         print('Falling back to regular pickle module')
     import pickle as pickle
 
+# amino acids used to index VEST score arrays
+aa_alphabet = sorted(set(utils.codon_table.values()))
+aa2code = {aa: i for i, aa in enumerate(aa_alphabet)}
+MISSING_AA = 255  # code for a codon without scores
+
+# cache of opened score and graph files
+_array_stores = {}
+
+# bounded cache of scores for recently used genes
+gene_score_cache_size = 64
+_gene_score_cache = OrderedDict()
+
+
+class VestScores(object):
+    """VEST scores for a gene stored as arrays.
+
+    Each codon has a single reference amino acid, so the scores are a dense
+    codon by alternate amino acid array along with the reference amino acid
+    code of each codon. Missing scores are NaN.
+    """
+
+    def __init__(self, score_array, ref_code):
+        self.score_array = score_array
+        self.ref_code = ref_code
+        self.num_codons = len(ref_code)
+
+    @classmethod
+    def from_dict(cls, vest_dict):
+        """Converts VEST scores from the nested dictionary in the pickle
+        files (codon -> ref AA -> alt AA -> score, codons start at 1)."""
+        num_codons = max(vest_dict) if vest_dict else 0
+        score_array = np.full((num_codons, len(aa_alphabet)), np.nan, dtype=np.float32)
+        ref_code = np.full(num_codons, MISSING_AA, dtype=np.uint8)
+        for codon, ref_dict in vest_dict.items():
+            if len(ref_dict) > 1:
+                raise ValueError('Codon {0} has more than one reference '
+                                 'amino acid'.format(codon))
+            for ref, alt_dict in ref_dict.items():
+                ref_code[codon-1] = aa2code[ref]
+                for alt, score in alt_dict.items():
+                    score_array[codon-1, aa2code[alt]] = score
+        return cls(score_array, ref_code)
+
+    def fetch(self, ref_aa, somatic_aa, codon_pos, default_vest=0.0):
+        """Get VEST scores for mutations, see fetch_vest_scores."""
+        num_mut = len(somatic_aa)
+        codon = np.array([(c if c is not None else -1) for c in codon_pos], dtype=np.int64)
+        ref = np.array([aa2code.get(r, MISSING_AA) for r in ref_aa], dtype=np.int64)
+        alt = np.array([aa2code.get(a, MISSING_AA) for a in somatic_aa], dtype=np.int64)
+        valid = (codon >= 0) & (codon < self.num_codons) & (alt != MISSING_AA)
+        valid[valid] = self.ref_code[codon[valid]] == ref[valid]
+        scores = np.full(num_mut, default_vest, dtype=float)
+        scores[valid] = self.score_array[codon[valid], alt[valid]]
+        scores[np.isnan(scores)] = default_vest
+        scores[codon < 0] = 0.0
+        return scores
+
+
+def write_score_store(score_dir, output_path):
+    """Converts a directory of VEST and MGA entropy pickle files into a
+    single score file.
+
+    Parameters
+    ----------
+    score_dir : str
+        directory containing GENE.vest.pickle and GENE.mgaentropy.pickle files
+    output_path : str
+        path of the score file to create
+
+    Returns
+    -------
+    num_genes : int
+        number of genes with scores
+    """
+    arrays = {}
+    genes = set()
+    for vest_path in sorted(glob.glob(os.path.join(score_dir, '*.vest.pickle'))):
+        gname = os.path.basename(vest_path)[:-len('.vest.pickle')]
+        gene_vest = VestScores.from_dict(_load_pickle(vest_path))
+        arrays[gname+'/vest'] = gene_vest.score_array
+        arrays[gname+'/vest_ref'] = gene_vest.ref_code
+        genes.add(gname)
+    for mga_path in sorted(glob.glob(os.path.join(score_dir, '*.mgaentropy.pickle'))):
+        gname = os.path.basename(mga_path)[:-len('.mgaentropy.pickle')]
+        arrays[gname+'/mga'] = np.asarray(_load_pickle(mga_path), dtype=np.float32)
+        genes.add(gname)
+    array_store.write_array_store(output_path, arrays,
+                                  metadata={'aa_alphabet': aa_alphabet})
+    return len(genes)
+
+
+def open_array_store(path):
+    """Opens a file created by array_store.write_array_store. Opened files
+    are cached so each process memory maps the file only once."""
+    if path not in _array_stores:
+        _array_stores[path] = array_store.ArrayStore(path)
+    return _array_stores[path]
+
+
+def open_score_store(path):
+    """Opens a score file created by write_score_store."""
+    store = open_array_store(path)
+    if store.metadata.get('aa_alphabet') != aa_alphabet:
+        raise ValueError('Amino acid coding in {0} does not match'.format(path))
+    return store
+
+
+def _load_pickle(path):
+    if sys.version_info < (3,):
+        # python 2.7 way
+        with open(path) as handle:
+            return pickle.load(handle)
+    else:
+        # python 3.X way
+        with open(path, 'rb') as handle:
+            return pickle.load(handle, encoding='latin-1')
+
+
+def read_vest(gname, score_dir):
+    """Read in VEST scores as arrays for given gene.
+
+    Parameters
+    ----------
+    gname : str
+        name of gene
+    score_dir : str
+        directory containing vest score pickle files or a score file
+        created by write_score_store
+
+    Returns
+    -------
+    gene_vest : VestScores or None
+        VEST scores for gene. Returns None if not found.
+    """
+    if os.path.isfile(score_dir):
+        store = open_score_store(score_dir)
+        if gname+'/vest' not in store:
+            return None
+        return VestScores(store[gname+'/vest'], store[gname+'/vest_ref'])
+    gene_vest = read_vest_pickle(gname, score_dir)
+    if gene_vest is None:
+        return None
+    return VestScores.from_dict(gene_vest)
+
+
+def read_mga(gname, score_dir):
+    """Read in MGA entropy scores for given gene.
+
+    Parameters
+    ----------
+    gname : str
+        name of gene
+    score_dir : str
+        directory containing MGA entropy pickle files or a score file
+        created by write_score_store
+
+    Returns
+    -------
+    mga_ent : np.array or None
+        MGA entropy for each codon. Returns None if not found.
+    """
+    if os.path.isfile(score_dir):
+        return open_score_store(score_dir).get(gname+'/mga')
+    mga_path = os.path.join(score_dir, gname+".mgaentropy.pickle")
+    if os.path.exists(mga_path):
+        return _load_pickle(mga_path)
+    return None
+
+
+def load_gene_scores(gname, score_dir):
+    """Load the MGA entropy and VEST scores for a gene.
+
+    Scores are kept in a small least recently used cache, so repeated calls
+    for the same gene within a process only read the files once.
+
+    Parameters
+    ----------
+    gname : str
+        name of gene
+    score_dir : str
+        directory containing score pickle files or a score file
+        created by write_score_store
+
+    Returns
+    -------
+    gene_scores : tuple
+        MGA entropy array and VestScores for the gene (either may be None)
+    """
+    key = (score_dir, gname)
+    if key in _gene_score_cache:
+        gene_scores = _gene_score_cache.pop(key)
+    else:
+        gene_scores = (read_mga(gname, score_dir), read_vest(gname, score_dir))
+        if len(_gene_score_cache) >= gene_score_cache_size:
+            _gene_score_cache.popitem(last=False)
+    _gene_score_cache[key] = gene_scores
+    return gene_scores
+
+
+def summary_scores(gene_scores, germ_aa, somatic_aa, codon_pos,
+                   num_rows=1, default_mga=5., default_vest=0.0):
+    """Computes total missense MGA entropy and total VEST score for a batch
+    of simulations at once.
+
+    Parameters
+    ----------
+    gene_scores : tuple
+        output of load_gene_scores
+    germ_aa : list of str
+        reference amino acids, concatenated across the simulations
+    somatic_aa : list of str
+        somatic amino acids, concatenated across the simulations
+    codon_pos : list of int
+        codon positions, concatenated across the simulations
+    num_rows : int
+        number of simulations, each with the same number of mutations
+    default_mga : float
+        total MGA entropy used when there are no scored missense mutations
+    default_vest : float
+        total VEST score used when VEST scores are missing
+
+    Returns
+    -------
+    total_mga_ent : np.array
+        total missense MGA entropy for each simulation
+    total_vest : np.array
+        total VEST score for each simulation
+    """
+    mga_ent, gene_vest = gene_scores
+    num_mut = len(codon_pos) // num_rows if num_rows else 0
+    row_ix = np.repeat(np.arange(num_rows), num_mut)
+    codon = np.array([(c if c is not None else -1) for c in codon_pos], dtype=np.int64)
+
+    # sum MGA entropy for the missense mutations in each simulation
+    total_mga_ent = np.full(num_rows, default_mga, dtype=float)
+    if mga_ent is not None:
+        mga_ent = np.asarray(mga_ent)
+        non_missense = ['-', '*', 'Splice_Site']
+        is_scored = np.array([(germ_aa[i]!=somatic_aa[i]) and
+                              (germ_aa[i] not in non_missense) and
+                              (somatic_aa[i] not in non_missense)
+                              for i in range(len(codon_pos))], dtype=bool)
+        is_scored &= (codon >= 0) & (codon < len(mga_ent))
+        mga_sum = np.bincount(row_ix[is_scored],
+                              weights=mga_ent[codon[is_scored]],
+                              minlength=num_rows)
+        mga_ct = np.bincount(row_ix[is_scored], minlength=num_rows)
+        total_mga_ent[mga_ct>0] = mga_sum[mga_ct>0]
+
+    # sum VEST scores, non-missense mutations score zero
+    total_vest = np.full(num_rows, default_vest, dtype=float)
+    if gene_vest is not None and num_mut:
+        vest_scores = gene_vest.fetch(germ_aa, somatic_aa, codon_pos)
+        total_vest = np.bincount(row_ix, weights=vest_scores, minlength=num_rows)
+
+    return total_mga_ent, total_vest
+
+
 def retrieve_scores(gname, sdir,
                     codon_pos, germ_aa, somatic_aa,
                     default_mga=5., default_vest=0,
@@ -21,62 +283,11 @@ def retrieve_scores(gname, sdir,
     Used by summary script.
 
     """
-    # get variant types
-    #var_class = cutils.get_variant_classification(germ_aa, somatic_aa, codon_pos)
-
-    # get information about MGA entropy
-    mga_path = os.path.join(sdir, gname+".mgaentropy.pickle")
-    if os.path.exists(mga_path):
-        if sys.version_info < (3,):
-            # python 2.7 way
-            with open(mga_path) as handle:
-                mga_ent = pickle.load(handle)
-        else:
-            # python 3.X way
-            with open(mga_path, 'rb') as handle:
-                mga_ent = pickle.load(handle, encoding='latin-1')
-    else:
-        mga_ent = None
-    missense_pos = [p for i, p in enumerate(codon_pos)
-                    if (germ_aa[i]!=somatic_aa[i]) and
-                       (germ_aa[i] not in ['-', '*', 'Splice_Site']) and
-                       (somatic_aa[i] not in ['-', '*', 'Splice_Site'])]
-    total_mga_ent = compute_mga_entropy_stat(mga_ent, missense_pos, sum, default_mga)
-
-        #mga_ent_ixs = [codon_pos[i] for i in range(len(var_class))
-                       #if var_class[i] == 'Missense_Mutation']
-        #len_mga_ent = len(mga_ent)
-        #mga_ent_scores = [mga_ent[ix] for ix in mga_ent_ixs if ix < len_mga_ent]
-        #if mga_ent_scores:
-            #total_mga_ent = sum(mga_ent_scores)
-        #else:
-            #total_mga_ent = default_mga
-    #else:
-        #total_mga_ent = no_file_flag
-
-    # get information about VEST scores
-    vest_path = os.path.join(sdir, gname+".vest.pickle")
-    if os.path.exists(vest_path):
-        if sys.version_info < (3,):
-            # python 2.7 way
-            with open(vest_path) as handle:
-                vest_score = pickle.load(handle)
-        else:
-            # python 3.X way
-            with open(vest_path, 'rb') as handle:
-                vest_score = pickle.load(handle, encoding='latin-1')
-    else:
-        vest_score = None
-    total_vest = compute_vest_stat(vest_score,
-                                   germ_aa, somatic_aa, codon_pos,
-                                   stat_func=sum, default_val=default_vest)
-        #vest_scores = [vest_score.get(codon_pos[i]+1, {}).get(germ_aa[i], {}).get(somatic_aa[i], default_vest)
-                        #for i in range(len(var_class))
-                        #if var_class[i] == 'Missense_Mutation']
-        #total_vest = sum(vest_scores)
-    #else:
-        #total_vest = no_file_flag
-    return total_mga_ent, total_vest
+    gene_scores = load_gene_scores(gname, sdir)
+    total_mga_ent, total_vest = summary_scores(gene_scores, germ_aa, somatic_aa, codon_pos,
+                                               default_mga=default_mga,
+                                               default_vest=default_vest)
+    return total_mga_ent[0], total_vest[0]
 
 
 def read_vest_pickle(gname, score_dir):
@@ -96,13 +307,7 @@ def read_vest_pickle(gname, score_dir):
     """
     vest_path = os.path.join(score_dir, gname+".vest.pickle")
     if os.path.exists(vest_path):
-        if sys.version_info < (3,):
-            with open(vest_path) as handle:
-                gene_vest = pickle.load(handle)
-        else:
-            with open(vest_path, 'rb') as handle:
-                gene_vest = pickle.load(handle, encoding='latin-1')
-        return gene_vest
+        return _load_pickle(vest_path)
     else:
         return None
 
@@ -117,8 +322,8 @@ def compute_vest_stat(vest_dict, ref_aa, somatic_aa, codon_pos,
 
     Parameters
     ----------
-    vest_dict : dict
-        dictionary containing vest scores across the gene of interest
+    vest_dict : VestScores or dict
+        vest scores across the gene of interest
     ref_aa: list of str
         list of reference amino acids
     somatic_aa: list of str
@@ -143,7 +348,7 @@ def compute_vest_stat(vest_dict, ref_aa, somatic_aa, codon_pos,
     myscores = fetch_vest_scores(vest_dict, ref_aa, somatic_aa, codon_pos)
 
     # calculate mean score
-    if myscores:
+    if len(myscores):
         score_stat = stat_func(myscores)
     else:
         score_stat = default_val
@@ -151,6 +356,42 @@ def compute_vest_stat(vest_dict, ref_aa, somatic_aa, codon_pos,
     return score_stat
 
 
+def compute_vest_stat_batch(gene_vest, ref_aa, somatic_aa, codon_pos,
+                            num_rows, default_val=0.0):
+    """Compute the mean missense VEST score for a batch of simulations at
+    once.
+
+    Parameters
+    ----------
+    gene_vest : VestScores or dict
+        vest scores across the gene of interest
+    ref_aa: list of str
+        reference amino acids, concatenated across the simulations
+    somatic_aa: list of str
+        somatic mutation aa, concatenated across the simulations
+    codon_pos : list of int
+        position of codon in protein sequence, concatenated across the
+        simulations
+    num_rows : int
+        number of simulations, each with the same number of mutations
+    default_val : float
+        default value to return if there are no mutations
+
+    Returns
+    -------
+    score_stat : np.array
+        mean vest score for each simulation
+    """
+    num_mut = len(codon_pos) // num_rows if num_rows else 0
+    if gene_vest is None or not num_mut:
+        return np.full(num_rows, default_val, dtype=float)
+    if not isinstance(gene_vest, VestScores):
+        gene_vest = VestScores.from_dict(gene_vest)
+
+    myscores = gene_vest.fetch(ref_aa, somatic_aa, codon_pos)
+    return myscores.reshape(num_rows, num_mut).mean(axis=1)
+
+
 def compute_mga_entropy_stat(mga_vec, codon_pos,
                              stat_func=np.mean,
                              default_val=0.0):
@@ -198,8 +439,8 @@ def fetch_vest_scores(vest_dict,
 
     Parameters
     ----------
-    vest_dict : dict
-        dictionary containing vest scores across the gene of interest
+    vest_dict : VestScores or dict
+        vest scores across the gene of interest
     ref_aa: list of str
         list of reference amino acids
     somatic_aa: list of str
@@ -211,9 +452,12 @@ def fetch_vest_scores(vest_dict,
 
     Returns
     -------
-    vest_score_list: list
+    vest_score_list: list or np.array
         score results for mutations
     """
+    if isinstance(vest_dict, VestScores):
+        return vest_dict.fetch(ref_aa, somatic_aa, codon_pos, default_vest)
+
     vest_score_list = []
     for i in range(len(somatic_aa)):
         # make sure position is valid
@@ -246,11 +490,11 @@ def fetch_mga_scores(mga_vec,
         score results for MGA entropy conservation
     """
     # keep only positions in range of MGAEntropy scores
-    len_mga = len(mga_vec)
-    good_codon_pos = [p for p in codon_pos if p < len_mga]
+    codon_pos = np.asarray(codon_pos, dtype=np.int64)
+    good_codon_pos = codon_pos[codon_pos < len(mga_vec)]
 
     # get MGAEntropy scores
-    if good_codon_pos:
+    if len(good_codon_pos):
         mga_ent_scores = mga_vec[good_codon_pos]
     else:
         mga_ent_scores = None
@@ -258,6 +502,108 @@ def fetch_mga_scores(mga_vec,
     return mga_ent_scores
 
 
+class NeighborGraph(object):
+    """Neighbor graph of codons stored in compressed sparse row format.
+
+    The neighbors of codon i are indices[indptr[i]:indptr[i+1]]. is_node
+    marks which codons are nodes of the graph.
+    """
+
+    def __init__(self, indptr, indices, is_node):
+        self.indptr = indptr
+        self.indices = indices
+        self.is_node = is_node
+        self.num_nodes = len(is_node)
+
+    @classmethod
+    def from_dict(cls, gene_graph):
+        """Converts a neighbor graph from the dictionary in the pickle
+        files (codon -> collection of neighboring codons)."""
+        num_nodes = max(gene_graph)+1 if gene_graph else 0
+        is_node = np.zeros(num_nodes, dtype=bool)
+        neighbor_cts = np.zeros(num_nodes, dtype=np.int64)
+        neighbor_list = []
+        for node in sorted(gene_graph):
+            neighbors = sorted(set(gene_graph[node]))
+            is_node[node] = True
+            neighbor_cts[node] = len(neighbors)
+            neighbor_list.extend(neighbors)
+        indptr = np.zeros(num_nodes+1, dtype=np.int64)
+        np.cumsum(neighbor_cts, out=indptr[1:])
+        max_neighbor = max(neighbor_list) if neighbor_list else 0
+        indices = np.array(neighbor_list, dtype=utils.compact_int_dtype(max_neighbor))
+        return cls(indptr, indices, is_node)
+
+    def neighbors(self, pos):
+        """Returns the neighbors of each codon in pos, concatenated, along
+        with the number of neighbors of each codon."""
+        pos = np.asarray(pos, dtype=np.int64)
+        if len(pos) and (pos.max() >= self.num_nodes or not self.is_node[pos].all()):
+            missing = [p for p in pos if p >= self.num_nodes or not self.is_node[p]]
+            raise KeyError(missing[0])
+        starts = self.indptr[pos]
+        lens = self.indptr[pos+1] - starts
+        offsets = np.repeat(starts - np.cumsum(lens) + lens, lens)
+        return self.indices[offsets + np.arange(lens.sum())], lens
+
+
+def write_neighbor_graph_store(graph_dir, output_path):
+    """Converts a directory of neighbor graph pickle files into a single
+    graph file.
+
+    Parameters
+    ----------
+    graph_dir : str
+        directory containing GENE.pickle neighbor graph files
+    output_path : str
+        path of the graph file to create
+
+    Returns
+    -------
+    num_genes : int
+        number of genes with neighbor graphs
+    """
+    arrays = {}
+    graph_paths = sorted(glob.glob(os.path.join(graph_dir, '*.pickle')))
+    for graph_path in graph_paths:
+        gname = os.path.basename(graph_path)[:-len('.pickle')]
+        gene_graph = NeighborGraph.from_dict(_load_pickle(graph_path))
+        arrays[gname+'/indptr'] = gene_graph.indptr
+        arrays[gname+'/indices'] = gene_graph.indices
+        arrays[gname+'/is_node'] = gene_graph.is_node
+    array_store.write_array_store(output_path, arrays)
+    return len(graph_paths)
+
+
+def read_neighbor_graph(gname, graph_dir):
+    """Read in neighbor graph for given gene.
+
+    Parameters
+    ----------
+    gname : str
+        name of gene
+    graph_dir : str
+        directory containing gene graph pickle files or a graph file
+        created by write_neighbor_graph_store
+
+    Returns
+    -------
+    gene_graph : NeighborGraph or None
+        neighbor graph for gene. Returns None if not found.
+    """
+    if os.path.isfile(graph_dir):
+        store = open_array_store(graph_dir)
+        if gname+'/indptr' not in store:
+            return None
+        return NeighborGraph(store[gname+'/indptr'],
+                             store[gname+'/indices'],
+                             store[gname+'/is_node'])
+    gene_graph = read_neighbor_graph_pickle(gname, graph_dir)
+    if gene_graph is None:
+        return None
+    return NeighborGraph.from_dict(gene_graph)
+
+
 def read_neighbor_graph_pickle(gname, graph_dir):
     """Read in neighbor graph for given gene.
 
@@ -275,9 +621,7 @@ def read_neighbor_graph_pickle(gname, graph_dir):
     """
     graph_path = os.path.join(graph_dir, gname+".pickle")
     if os.path.exists(graph_path):
-        with open(graph_path) as handle:
-            gene_graph = pickle.load(handle)
-        return gene_graph
+        return _load_pickle(graph_path)
     else:
         return None
 
@@ -287,7 +631,7 @@ def compute_ng_stat(gene_graph, pos_ct, alpha=.5):
 
     Parameters
     ----------
-    gene_graph : dict
+    gene_graph : NeighborGraph or dict
         Graph of spatially near codons. keys = nodes, edges = key -> value.
     pos_ct : dict
         missense mutation count for each codon
@@ -304,21 +648,19 @@ def compute_ng_stat(gene_graph, pos_ct, alpha=.5):
     # skip if there are no missense mutations
     if not len(pos_ct):
         return 1.0, 0
+    if not isinstance(gene_graph, NeighborGraph):
+        gene_graph = NeighborGraph.from_dict(gene_graph)
 
-    max_pos = max(gene_graph)
-    codon_vals = np.zeros(max_pos+1)
-
-    # smooth out mutation counts
-    for pos in pos_ct:
-        mut_count = pos_ct[pos]
+    codon_vals = np.zeros(gene_graph.num_nodes)
+    pos = np.fromiter(pos_ct.keys(), dtype=np.int64, count=len(pos_ct))
+    mut_count = np.fromiter(pos_ct.values(), dtype=float, count=len(pos_ct))
 
-        # update neighbor values
-        neighbors = list(gene_graph[pos])
-        num_neighbors = len(neighbors)
-        codon_vals[neighbors] += alpha*mut_count
+    # smooth out mutation counts by updating neighbor values
+    neighbors, num_neighbors = gene_graph.neighbors(pos)
+    np.add.at(codon_vals, neighbors, np.repeat(alpha*mut_count, num_neighbors))
 
-        # update self-value
-        codon_vals[pos] += (1-alpha)*mut_count
+    # update self-value
+    np.add.at(codon_vals, pos, (1-alpha)*mut_count)
 
     # compute the normalized entropy
     #total_cts = float(np.count_nonzero(codon_vals))
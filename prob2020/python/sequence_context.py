@@ -10,6 +10,7 @@ class SequenceContext(object):
 
     def __init__(self, gene_seq, seed=None):
         self._init_context(gene_seq)
+        self._init_pos_array()
         self.seed = seed  # seed for random number generator
         context_names = prob2020.python.mutation_context.get_all_context_names(gene_seq.nuc_context)
         self.prng_dict = {
@@ -154,6 +155,17 @@ class SequenceContext(object):
                 self.pos2context[i] = 'None'
             self.context2pos['None'] = range(gene_len + five_ss_len + three_ss_len)
 
+    def _init_pos_array(self):
+        """Stores the positions for each context as compact integer arrays
+        to reduce memory when sampling random positions.
+        """
+        max_pos = max(self.pos2context) if self.pos2context else 0
+        pos_dtype = utils.compact_int_dtype(max_pos)
+        self.context_pos_array = {
+            c: np.asarray(self.context2pos[c], dtype=pos_dtype)
+            for c in self.context2pos
+        }
+
     def is_valid_context(self, ctxt):
         """Checks if provided context is valid (previously seen).
 
@@ -200,10 +212,20 @@ class SequenceContext(object):
             raise ValueError(error_msg)
 
         # randomly select from available positions that fit the specified context
-        available_pos = self.context2pos[context]
-        random_pos = self.prng_dict[context].choice(available_pos, (num_permutations, num))
+        random_pos = np.empty((num_permutations, num), dtype=np.int32)
+        self._fill_context_pos(random_pos, context)
         return random_pos
 
+    def _fill_context_pos(self, out, context):
+        """Fills an array with random positions matching the sequence context.
+
+        The random numbers are the same as sampling with
+        np.random.RandomState.choice from the available positions.
+        """
+        available_pos = self.context_pos_array[context]
+        ixs = self.prng_dict[context].randint(0, len(available_pos), size=out.shape)
+        out[...] = available_pos[ixs]
+
     def random_pos(self, context_iterable, num_permutations):
         """Obtains random positions w/ replacement which match sequence context.
 
@@ -227,3 +249,33 @@ class SequenceContext(object):
             position_list.append([contxt, pos_array])
         return position_list
 
+    def fill_random_pos(self, context_iterable, out):
+        """Fills a preallocated array with random positions w/ replacement
+        which match sequence context.
+
+        Positions for each context fill consecutive columns of the array in
+        the same order as random_pos, so the array can be reused between
+        batches of simulations.
+
+        Parameters
+        ----------
+        context_iterable: iterable containing two element tuple
+            Records number of mutations in each context. context_iterable
+            should be something like [('AA', 5), ...].
+        out : np.array
+            num_permutations X total number of mutations sized array
+
+        Returns
+        -------
+        out : np.array
+            the provided array filled with random positions
+        """
+        col = 0
+        for contxt, n in context_iterable:
+            if not self.is_valid_context(contxt):
+                error_msg = 'Context ({0}) was never seen in sequence.'.format(contxt)
+                raise ValueError(error_msg)
+            self._fill_context_pos(out[:, col:col+n], contxt)
+            col += n
+        return out
+
@@ -6,18 +6,52 @@ import csv
 from collections import OrderedDict
 from functools import wraps
 import warnings
+import argparse
 
 # logging import
 import logging
 import datetime
 import os
 import sys
+import gzip
 
 logger = logging.getLogger(__name__)  # module logger
 
 # small epsilon value to prevent issues with machine decimal precision
 epsilon = 0.0001
 
+# default number of simulations performed at once
+default_max_batch = 25000
+
+# largest number of mutations in a gene for exact p-values, the number of
+# ways mutations can collide on codons grows faster than exponentially
+max_exact_mutations = 8
+
+# bytes needed per simulated mutation position (int32 batch plus the
+# int64 random indices drawn for a single context)
+bytes_per_sim_position = 12
+
+# rename MAF columns to the internal column names
+maf_rename = {
+    'Hugo_Symbol': 'Gene',
+    'Tumor_Sample_Barcode': 'Tumor_Sample',
+    'Tumor_Seq_Allele2' : 'Tumor_Allele'
+}
+
+# columns read from mutation files and their data types
+mutation_dtypes = {
+    'Gene': str,  # not categorical, subsets would count every gene
+    'Tumor_Sample': 'category',
+    'Tumor_Type': 'category',
+    'Chromosome': 'category',
+    'Variant_Classification': 'category',
+    'Start_Position': 'Int32',
+    'End_Position': 'Int32',
+    'Reference_Allele': str,
+    'Tumor_Allele': str,
+    'Protein_Change': str,
+}
+
 # global dictionary mapping codons to AA
 codon_table = {'TTT': 'F', 'TTC': 'F', 'TTA': 'L', 'TTG': 'L', 'TCT': 'S',
                'TCC': 'S', 'TCA': 'S', 'TCG': 'S', 'TAT': 'Y', 'TAC': 'Y',
@@ -46,6 +80,17 @@ base_pairing = {'A': 'T',
                 '-': '-',  # some people denote indels with '-'
                 'n': 'n',
                 'N': 'N'}
+try:
+    rev_comp_table = str.maketrans(''.join(base_pairing.keys()),
+                                   ''.join(base_pairing.values()))
+except AttributeError:
+    # python 2.7
+    import string
+    rev_comp_table = string.maketrans(''.join(base_pairing.keys()),
+                                      ''.join(base_pairing.values()))
+
+# valid single nucleotide bases
+valid_nucs = ['A', 'C', 'T', 'G', 'N']
 
 ##############################
 # Define groups of mutation consequences
@@ -186,11 +231,53 @@ def rev_comp(seq):
     rev_comp_seq : str
         reverse complement of sequence
     """
-    rev_seq = seq[::-1]
-    rev_comp_seq = ''.join([base_pairing[s] for s in rev_seq])
+    rev_comp_seq = seq[::-1].translate(rev_comp_table)
     return rev_comp_seq
 
 
+def rev_comp_series(seqs):
+    """Get reverse complement of every sequence in a pandas Series.
+
+    Parameters
+    ----------
+    seqs : pd.Series
+        nucleotide sequences. valid {a, c, t, g, n}
+
+    Returns
+    -------
+    rev_comp_seqs : pd.Series
+        reverse complement of sequences
+    """
+    return seqs.str[::-1].str.translate(rev_comp_table)
+
+
+def add_strand_tumor_allele(mutation_df, bed_dict):
+    """Adds the tumor allele on the strand of each mutation's gene.
+
+    The tumor alleles of all genes on the minus strand are reverse
+    complemented together, instead of once per gene.
+
+    Parameters
+    ----------
+    mutation_df : pd.DataFrame
+        mutations with Gene and Tumor_Allele columns
+    bed_dict : dict
+        dictionary mapping chromosome keys to a list of BED lines
+
+    Returns
+    -------
+    mutation_df : pd.DataFrame
+        mutations with a Strand_Tumor_Allele column added
+    """
+    gene_strand = {bed.gene_name: bed.strand
+                   for chrom in bed_dict
+                   for bed in bed_dict[chrom]}
+    is_minus = (mutation_df['Gene'].map(gene_strand) == '-').values
+    strand_allele = mutation_df['Tumor_Allele'].copy()
+    strand_allele[is_minus] = rev_comp_series(strand_allele[is_minus])
+    return mutation_df.assign(Strand_Tumor_Allele=strand_allele)
+
+
 def is_valid_nuc(nuc):
     """Check if valid single letter base.
 
@@ -204,7 +291,6 @@ def is_valid_nuc(nuc):
     is_valid : bool
         flag indicating valid nucleotide base
     """
-    valid_nucs = ['A', 'C', 'T', 'G', 'N']
     is_valid = nuc in valid_nucs
     return is_valid
 
@@ -256,6 +342,96 @@ def read_bed(file_path, filtered_genes=[]):
     return bed_dict
 
 
+def _mutation_file_format(file_path):
+    """Guess the format of a mutation file from its extension."""
+    lower_path = file_path.lower()
+    if lower_path.endswith('.parquet') or lower_path.endswith('.pq'):
+        return 'parquet'
+    elif lower_path.endswith('.feather') or lower_path.endswith('.arrow'):
+        return 'feather'
+    elif lower_path.endswith('.gz') or lower_path.endswith('.bgz'):
+        return 'gzip'
+    else:
+        return 'text'
+
+
+def _num_comment_lines(file_path, compression=None):
+    """Counts the '#' comment lines at the top of a MAF file, such as the
+    '#version' line."""
+    if compression == 'gzip':
+        handle = gzip.open(file_path, 'rb')
+    else:
+        handle = open(file_path, 'rb')
+    num_lines = 0
+    with handle:
+        for line in handle:
+            if not line.startswith(b'#'):
+                break
+            num_lines += 1
+    return num_lines
+
+
+def read_mutations(file_path):
+    """Reads a mutation file in MAF-like format.
+
+    Only the columns used by probabilistic 20/20 are read. Sample,
+    chromosome and variant classification columns are stored as
+    categoricals, and positions as 32-bit integers. Tab-delimited text
+    (optionally gzip/bgzip compressed), Parquet and Feather/Arrow files are
+    supported. Positions are stored as floats if any are missing, callers
+    drop mutations with missing information themselves.
+
+    Parameters
+    ----------
+    file_path : str
+        path to mutation file
+
+    Returns
+    -------
+    mut_df : pd.DataFrame
+        mutations with columns renamed to the internal column names
+    """
+    # columns may be named either by MAF or internal names
+    usecols = set(mutation_dtypes) | set(maf_rename)
+    dtypes = dict(mutation_dtypes)
+    dtypes.update((maf_col, mutation_dtypes[col]) for maf_col, col in maf_rename.items())
+
+    file_format = _mutation_file_format(file_path)
+    if file_format in ['parquet', 'feather']:
+        # arrow formats need pyarrow, which is an optional dependency
+        import pyarrow.parquet as pq
+        import pyarrow.feather as feather
+        if file_format == 'parquet':
+            col_names = pq.ParquetFile(file_path).schema_arrow.names
+            read_cols = [c for c in col_names if c in usecols]
+            mut_df = pq.read_table(file_path, columns=read_cols).to_pandas()
+        else:
+            table = feather.read_table(file_path, memory_map=True)
+            read_cols = [c for c in table.column_names if c in usecols]
+            mut_df = table.select(read_cols).to_pandas()
+        # string columns are already read as strings, converting them
+        # would turn missing values into 'None'
+        mut_df = mut_df.astype(dict((c, dtypes[c]) for c in read_cols
+                                    if dtypes[c] is not str))
+    else:
+        compression = 'gzip' if file_format == 'gzip' else None
+        mut_df = pd.read_csv(file_path, sep='\t',
+                             usecols=lambda c: c in usecols,
+                             dtype=dtypes,
+                             compression=compression,
+                             skiprows=_num_comment_lines(file_path, compression))
+    mut_df = mut_df.rename(columns=maf_rename)
+
+    # use plain integers for positions unless values are missing
+    for col in ['Start_Position', 'End_Position']:
+        if col in mut_df.columns:
+            if mut_df[col].hasnans:
+                mut_df[col] = mut_df[col].astype(float)
+            else:
+                mut_df[col] = mut_df[col].astype(np.int32)
+    return mut_df
+
+
 def _fix_mutation_df(mutation_df, only_unique=False):
     """Drops invalid mutations and corrects for 1-based coordinates.
 
@@ -289,12 +465,10 @@ def _fix_mutation_df(mutation_df, only_unique=False):
                                                                       mut_types=', '.join(variant_snv)))
     logger.info(log_msg)
 
-    # check if mutations are valid SNVs
-    valid_nuc_flag = (mutation_df['Reference_Allele'].apply(is_valid_nuc) & \
-                      mutation_df['Tumor_Allele'].apply(is_valid_nuc))
+    # check if mutations are valid SNVs, valid bases are single letters
+    valid_nuc_flag = (mutation_df['Reference_Allele'].isin(valid_nucs) & \
+                      mutation_df['Tumor_Allele'].isin(valid_nucs))
     mutation_df = mutation_df[valid_nuc_flag]  # filter bad lines
-    mutation_df = mutation_df[mutation_df['Tumor_Allele'].apply(lambda x: len(x)==1)]
-    mutation_df = mutation_df[mutation_df['Reference_Allele'].apply(lambda x: len(x)==1)]
     valid_len = len(mutation_df)
 
     # log the number of dropped mutations
@@ -379,6 +553,35 @@ def lzip(*args):
     return result
 
 
+def file_mtime_ns(stat):
+    """Gets the modification time of a file in nanoseconds.
+
+    Parameters
+    ----------
+    stat : os.stat_result
+        result of os.stat for the file
+
+    Returns
+    -------
+    mtime : int
+        modification time in nanoseconds
+    """
+    mtime = getattr(stat, 'st_mtime_ns', None)
+    if mtime is None:
+        # python 2.7
+        mtime = int(stat.st_mtime * 1e9)
+    return mtime
+
+
+def replace_file(src, dst):
+    """Renames src to dst, replacing dst if it already exists."""
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # python 2.7, rename replaces dst on posix
+        os.rename(src, dst)
+
+
 def calc_windowed_sum(aa_mut_pos,
                       germ_aa,
                       somatic_aa,
@@ -408,3 +611,62 @@ def calc_windowed_sum(aa_mut_pos,
         pos_sum[pos] = tmp_sum
 
     return pos_ctr, pos_sum
+
+
+def compact_int_dtype(max_value):
+    """Smallest integer data type used to store non-negative positions.
+
+    Parameters
+    ----------
+    max_value : int
+        largest value that needs to be stored
+
+    Returns
+    -------
+    dtype : np.dtype
+        uint16 if the values fit, otherwise int32
+    """
+    if max_value < np.iinfo(np.uint16).max:
+        return np.uint16
+    else:
+        return np.int32
+
+
+def exact_max_mutations_type(value):
+    """Parses the --exact-max-mutations option, which must be between 0 and
+    max_exact_mutations."""
+    value = int(value)
+    if not 0 <= value <= max_exact_mutations:
+        msg = ('must be between 0 and {0}, exact p-values for more mutations '
+               'take too long to compute'.format(max_exact_mutations))
+        raise argparse.ArgumentTypeError(msg)
+    return value
+
+
+def max_batch_size(num_mutations, memory_budget=None, num_processes=0,
+                   default=default_max_batch):
+    """Calculates the number of simulations per batch that keeps the
+    simulated positions within a memory budget.
+
+    Parameters
+    ----------
+    num_mutations : int
+        number of mutations simulated in each iteration
+    memory_budget : float or None
+        total memory budget in MB shared by all processes. No budget
+        uses the default batch size.
+    num_processes : int
+        number of worker processes (0 indicates a single process)
+    default : int
+        maximum number of simulations per batch
+
+    Returns
+    -------
+    max_batch : int
+        number of simulations per batch
+    """
+    if not memory_budget or num_mutations < 1:
+        return default
+    budget_bytes = memory_budget * 1024 * 1024 / max(num_processes, 1)
+    max_batch = int(budget_bytes // (num_mutations * bytes_per_sim_position))
+    return min(max(max_batch, 1), default)
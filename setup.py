@@ -63,7 +63,7 @@ else:
           url=URL,
           packages=PACKAGES,
           license='Apache License Version 2.0',
-          install_requires=['numpy', 'scipy', 'pandas', 'pysam'],
+          install_requires=['numpy>=1.16', 'scipy', 'pandas>=0.24', 'pysam'],
           package_data={
               SRC_DIR+'.console': ['*.R']
           },
@@ -72,7 +72,8 @@ else:
                   'probabilistic2020 = prob2020.console.probabilistic2020:cli_main',
                   'mut_annotate = prob2020.console.annotate:cli_main',
                   'extract_gene_seq = prob2020.console.extract_gene_seq:cli_main',
-                  'simulate_non_silent_ratio = prob2020.console.simulate_non_silent_ratio:cli_main'
+                  'simulate_non_silent_ratio = prob2020.console.simulate_non_silent_ratio:cli_main',
+                  'convert_scores = prob2020.console.convert_scores:cli_main'
               ]
           },
           long_description=open('README.rst').read(),
@@ -0,0 +1,35 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+from prob2020.python.amino_acid import AminoAcid, parse_protein_change, parse_protein_changes
+import pandas as pd
+import numpy as np
+
+
+def test_parse_protein_changes():
+    hgvs = pd.Series(['p.V600E', 'p.R175H', 'p.V600E', np.nan, 'p.Q61*', 'p.?', 'junk'],
+                     index=[3, 5, 7, 9, 11, 13, 15])
+    aa_df = parse_protein_changes(hgvs)
+    assert aa_df.index.tolist() == hgvs.index.tolist()
+    assert aa_df['pos'].iloc[:3].tolist() == [600, 175, 600]
+    assert aa_df['mutated'].tolist()[:3] == ['E', 'H', 'E']
+    assert aa_df['mutation_type'].iloc[4] == 'Nonsense_Mutation'
+    assert not aa_df['is_valid'].iloc[3] and not aa_df['is_valid'].iloc[6]
+    assert aa_df['is_missing_info'].iloc[5]
+
+    # columns should agree with parsing one string at a time
+    for i, h in enumerate(hgvs):
+        if isinstance(h, str):
+            aa = AminoAcid(h)
+            assert aa.is_valid == aa_df['is_valid'].iloc[i]
+            assert aa.mutation_type == aa_df['mutation_type'].iloc[i]
+
+    # repeated strings are parsed once
+    assert parse_protein_change('p.V600E') is parse_protein_change('p.V600E')
+
+
+if __name__ == '__main__':
+    test_parse_protein_changes()
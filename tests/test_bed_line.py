@@ -0,0 +1,35 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+import prob2020.python.utils as utils
+import numpy as np
+
+
+def test_coordinate_round_trip():
+    for bed in utils.bed_generator(os.path.join(file_dir, 'data/100genes.bed')):
+        seq_len = bed.cds_len + bed.five_ss_len + bed.three_ss_len
+        seq_pos = np.arange(seq_len)
+        genome_pos = bed.seq_to_genome(seq_pos)
+
+        # every sequence position maps to a distinct genome position, and
+        # coding positions map back
+        assert len(np.unique(genome_pos)) == seq_len
+        cds_pos = seq_pos[:bed.cds_len]
+        assert np.all(bed.genome_to_seq(genome_pos[:bed.cds_len]) == cds_pos)
+        if bed.strand == '+':
+            assert np.all(bed.genome_to_seq(genome_pos) == seq_pos)
+        assert bed.query_position(bed.strand, bed.chrom, int(genome_pos[0])) == 0
+
+        # splice sites
+        for pos in range(bed.cds_len, seq_len):
+            ss_type, ss_ix, ss_pos = bed.pos2ss[pos]
+            assert ss_type in ["5'", "3'"]
+            assert 0 <= ss_ix < bed.num_exons - 1
+
+    # positions outside the gene do not map
+    first_start = bed.exon_starts[0]
+    assert bed.genome_to_seq(first_start - 10) == -1
+    assert bed.query_position(bed.strand, bed.chrom, first_start - 10) is None
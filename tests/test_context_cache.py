@@ -0,0 +1,90 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '../'))
+
+import prob2020.console.randomization_test as pt
+import prob2020.python.context_cache as context_cache
+import prob2020.python.mutation_context as mc
+import numpy as np
+import pandas as pd
+import tempfile
+import shutil
+
+
+def test_context_round_trip():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        opts = {'context_cache': cache_dir, 'context': 1.5}
+        mut_info = pd.DataFrame({'Coding Position': [3, 10],
+                                 'Context': ['C*pG', 'A'],
+                                 'Tumor_Allele': ['T', 'G'],
+                                 'Tumor_Sample': ['s1', np.nan],
+                                 'Tumor_Type': [np.nan, '']},
+                                columns=context_cache.MAPPED_COLUMNS)
+        unmapped_mut_info = {'Context': ['A', 'C'],
+                             'Reference AA': ['R', '*'],
+                             'Codon Pos': [5, 'Splice_Site'],
+                             'Somatic AA': ['Q', '*'],
+                             'Tumor_Allele': ['T', 'A'],
+                             'Tumor_Sample': ['s1', np.nan],
+                             'Tumor_Type': ['x', 'y']}
+        contexts = context_cache.open_chromosome(opts, 'chr1')
+        contexts.add('GENE', (mut_info, unmapped_mut_info, 4))
+        contexts.save()
+
+        # missing values are restored as NaN, not empty strings
+        cached = context_cache.open_chromosome(opts, 'chr1').get('GENE')
+        pd.testing.assert_frame_equal(cached[0], mut_info)
+        assert cached[1]['Codon Pos'] == [5, 'Splice_Site']
+        assert cached[1]['Tumor_Sample'][0] == 's1'
+        assert pd.isnull(cached[1]['Tumor_Sample'][1])
+        assert cached[2] == 4
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_100genes_context_cache():
+    cache_dir = tempfile.mkdtemp()
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': os.path.join(file_dir, 'data/100genes_mutations.txt'),
+            'output': '',
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 300,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'kind': 'tsg'}
+    recover_unmapped_mut_info = mc.recover_unmapped_mut_info
+    try:
+        result = pt.main(opts.copy())
+
+        # the first run fills the cache
+        opts['context_cache'] = cache_dir
+        cached = pt.main(opts.copy())
+        assert result.astype(str).equals(cached.astype(str)), 'Cached contexts should not change results'
+        cache_files = [os.path.join(d, f) for d, _, files in os.walk(cache_dir) for f in files]
+        assert cache_files, 'Normalized mutations should be saved'
+        mtimes = {f: os.stat(f).st_mtime_ns for f in cache_files}
+
+        # the second run reads every gene from the cache without rewriting it
+        def fail(*args, **kwargs):
+            raise AssertionError('Mutations should be loaded from the cache')
+        mc.recover_unmapped_mut_info = fail
+        cached = pt.main(opts.copy())
+        assert result.astype(str).equals(cached.astype(str)), 'Cached contexts should not change results'
+        assert {f: os.stat(f).st_mtime_ns for f in cache_files} == mtimes
+    finally:
+        mc.recover_unmapped_mut_info = recover_unmapped_mut_info
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    test_context_round_trip()
+    test_100genes_context_cache()
@@ -5,6 +5,10 @@ file_dir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(file_dir, '../'))
 
 import prob2020.console.count_frameshifts as cf
+import prob2020.python.count_frameshifts as pyfs
+import prob2020.python.indel as indel
+import prob2020.python.utils as utils
+import numpy as np
 
 def test_tp53_main():
     opts = {'mutations': os.path.join(file_dir, 'data/tp53_fs_mutations.txt'),
@@ -17,3 +21,25 @@ def test_tp53_main():
     fs_df = cf.main(opts)
 
     assert fs_df.loc['TP53', '1'] == 295, "Number of frameshifts should equal to 295"
+
+
+def test_map_frameshifts():
+    bed_list = list(utils.bed_generator(os.path.join(file_dir, 'data/100genes.bed')))
+    mut_df = utils.read_mutations(os.path.join(file_dir, 'data/100genes_mutations.txt'))
+    fs_df = indel.keep_frameshifts(mut_df)
+
+    # move some frameshifts so they no longer fall on the transcript
+    prng = np.random.RandomState(101)
+    shift = np.where(prng.rand(len(fs_df)) < .5, prng.randint(-300, 300, len(fs_df)), 0)
+    fs_df = fs_df.assign(Start_Position=fs_df['Start_Position'] - 1 + shift,
+                         End_Position=fs_df['End_Position'] + shift)
+
+    gene_ixs, is_mapped = pyfs.map_frameshifts(fs_df, bed_list)
+    for i in range(len(fs_df)):
+        row = fs_df.iloc[i]
+        bed = bed_list[gene_ixs[i]]
+        assert bed.gene_name == row['Gene']
+        coding_pos = bed.query_position(bed.strand, row['Chromosome'],
+                                        [row['Start_Position'], row['End_Position']])
+        assert is_mapped[i] == (coding_pos is not None)
+    assert 0 < is_mapped.sum() < len(fs_df)
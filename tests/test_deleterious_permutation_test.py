@@ -5,7 +5,13 @@ file_dir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(file_dir, '../'))
 
 import prob2020.console.randomization_test as pt
+import prob2020.python.journal as journal
+import prob2020.python.incremental as incremental
+import prob2020.python.utils as utils
 import numpy as np
+import pandas as pd
+import tempfile
+import shutil
 
 
 def test_tp53_main():
@@ -73,5 +79,132 @@ def test_100genes_main():
     assert num_del_sig < 7, 'Few of the 100 test genes should not be significant ({0})'.format(num_del_sig)
 
 
+def test_100genes_screen():
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': os.path.join(file_dir, 'data/100genes_mutations.txt'),
+            'output': os.path.join(file_dir, 'output/100genes_deleterious_screen_output.txt'),
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 1000,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'screen': True,
+            'screen_iterations': 200,
+            'screen_threshold': .05,
+            'kind': 'tsg'}
+    result = pt.main(opts)
+    screened = result[result['screened out']]
+    assert len(screened) > 0, 'Some of the 100 test genes should be screened out'
+    assert (screened['inactivating p-value'] > .05).all(), 'Screened out genes should have high p-values'
+    assert len(result) == len(result['gene'].unique()), 'Genes should only be reported once'
+
+
+
+def test_100genes_resume():
+    tmp_dir = tempfile.mkdtemp()
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': os.path.join(file_dir, 'data/100genes_mutations.txt'),
+            'output': os.path.join(tmp_dir, '100genes_deleterious_resume_output.txt'),
+            'journal': os.path.join(tmp_dir, '100genes_deleterious_resume.journal'),
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 300,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'kind': 'tsg'}
+    try:
+        result = pt.main(opts.copy())
+
+        # stop the run part way through a journal line
+        with open(opts['journal']) as handle:
+            lines = handle.readlines()
+        num_genes = len(lines)
+        num_done = num_genes // 2
+        with open(opts['journal'], 'w') as handle:
+            handle.write(''.join(lines[:num_done]) + lines[num_done][:20])
+
+        # resuming with a different number of processes keeps finished genes
+        opts['resume'] = True
+        opts['processes'] = 2
+        resumed = pt.main(opts.copy())
+        result = result.reset_index(drop=True).sort_values('gene').reset_index(drop=True)
+        resumed = resumed.reset_index(drop=True).sort_values('gene').reset_index(drop=True)
+        assert result.astype(str).equals(resumed.astype(str)), 'Resumed run should match the full run'
+
+        # the partly written line is replaced by the genes tested on resume
+        jrnl = journal.Journal(opts['journal'], journal.config_key(opts))
+        assert len(jrnl.read()) == num_genes
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_100genes_incremental():
+    tmp_dir = tempfile.mkdtemp()
+
+    # an earlier version of the cohort without the last 20 samples
+    mut_path = os.path.join(file_dir, 'data/100genes_mutations.txt')
+    earlier_path = os.path.join(tmp_dir, '100genes_mutations_earlier.txt')
+    mut_df = pd.read_csv(mut_path, sep='\t')
+    new_samples = sorted(mut_df['Tumor_Sample_Barcode'].unique())[-20:]
+    is_new = mut_df['Tumor_Sample_Barcode'].isin(new_samples)
+    mut_df[~is_new].to_csv(earlier_path, sep='\t', index=False)
+
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': earlier_path,
+            'output': os.path.join(tmp_dir, '100genes_deleterious_incremental_output.txt'),
+            'journal': os.path.join(tmp_dir, '100genes_deleterious_incremental.journal'),
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 300,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'kind': 'tsg',
+            'incremental': os.path.join(tmp_dir, '100genes_deleterious.state')}
+    try:
+        pt.main(opts.copy())
+
+        # only genes with mutations in the new samples are tested again, even
+        # with a different number of processes
+        opts['mutations'] = mut_path
+        opts['processes'] = 2
+        result = pt.main(opts.copy())
+        with open(opts['journal']) as handle:
+            num_tested = len(handle.readlines())
+        assert num_tested == mut_df.loc[is_new, 'Hugo_Symbol'].nunique()
+
+        # results should match testing every gene
+        del opts['incremental']
+        full_result = pt.main(opts.copy())
+        result = result.reset_index(drop=True).sort_values('gene').reset_index(drop=True)
+        full_result = full_result.reset_index(drop=True).sort_values('gene').reset_index(drop=True)
+        assert result.astype(str).equals(full_result.astype(str)), 'Incremental run should match the full run'
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_gene_fingerprints():
+    # genes without mutations are left out of the categorical Gene column
+    mut_df = utils.read_mutations(os.path.join(file_dir, 'data/100genes_mutations.txt'))
+    genes = mut_df['Gene'].unique()[:3]
+    fingerprints = incremental.gene_fingerprints(mut_df[mut_df['Gene'].isin(genes)],
+                                                 ['Start_Position', 'Tumor_Allele'])
+    assert sorted(fingerprints) == sorted(genes)
+
+
 if __name__ == "__main__":
     test_100genes_main()
@@ -8,6 +8,10 @@ sys.path.append(os.path.join(file_dir, '..'))
 # import extract_genes module
 import prob2020.console.extract_gene_seq as eg
 import prob2020.python.utils as utils
+import prob2020.python.genome as genome
+from prob2020.python.gene_sequence import GeneSequence
+import pysam
+import shutil
 
 def test_rev_comp():
     seq1 = 'CT'
@@ -27,3 +31,40 @@ def test_main():
             'output': os.path.join(file_dir, 'output/example_genes.fa'),
             'bed': os.path.join(file_dir, 'data/example.bed')}
     eg.main(opts)
+
+
+def test_parallel_main():
+    opts = {'input': os.path.join(file_dir, 'data/chrM.fa'),
+            'output': os.path.join(file_dir, 'output/example_genes_parallel.fa'),
+            'twobit': os.path.join(file_dir, 'output/example_genes_parallel.2bit'),
+            'bed': os.path.join(file_dir, 'data/example.bed'),
+            'processes': 2}
+    eg.main(opts)
+
+    # output should match the single process version
+    serial_path = os.path.join(file_dir, 'output/example_genes_serial.fa')
+    eg.main({'input': opts['input'], 'bed': opts['bed'], 'output': serial_path})
+    with open(serial_path) as handle1, open(opts['output']) as handle2:
+        assert handle1.read() == handle2.read()
+
+    # index written with the sequences should match samtools
+    with open(opts['output'] + '.fai') as handle:
+        written_fai = handle.read()
+    copy_path = os.path.join(file_dir, 'output/example_genes_copy.fa')
+    shutil.copy(opts['output'], copy_path)
+    pysam.faidx(copy_path)
+    with open(copy_path + '.fai') as handle:
+        assert written_fai == handle.read()
+
+    # 2bit output gives the same gene sequences
+    gene_fa = pysam.Fastafile(opts['output'])
+    gene_2bit = genome.open_fasta(opts['twobit'])
+    assert gene_2bit.references == list(gene_fa.references)
+    for bed in utils.bed_generator(opts['bed']):
+        gs_fa = GeneSequence(gene_fa)
+        gs_fa.set_gene(bed)
+        gs_2bit = GeneSequence(gene_2bit)
+        gs_2bit.set_gene(bed)
+        assert gs_fa.exon_seq == gs_2bit.exon_seq
+        assert gs_fa.five_prime_seq == gs_2bit.five_prime_seq
+        assert gs_fa.three_prime_seq == gs_2bit.three_prime_seq
@@ -0,0 +1,62 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+import prob2020.python.genome as genome
+import prob2020.python.mutation_context as mc
+import numpy as np
+import pysam
+
+
+def test_twobit_fetch():
+    prng = np.random.RandomState(101)
+    seq1 = ''.join(prng.choice(list('ACGTacgt'), 1003))
+    seq1 = seq1[:200] + 'N'*30 + seq1[230:]
+    seq2 = ''.join(prng.choice(list('ACGT'), 37))
+
+    # write the same genome as FASTA and 2bit
+    fa_path = os.path.join(file_dir, 'output/fake_genome.fa')
+    with open(fa_path, 'w') as handle:
+        handle.write('>chrA\n{0}\n>chrB\n{1}\n'.format(seq1, seq2))
+    pysam.faidx(fa_path)
+    twobit_path = os.path.join(file_dir, 'output/fake_genome.2bit')
+    genome.write_twobit([('chrA', seq1), ('chrB', seq2)], twobit_path)
+
+    fa = pysam.Fastafile(fa_path)
+    twobit = genome.open_genome(twobit_path)
+    assert genome.open_genome(twobit_path) is twobit
+    for chrom, seq in [('chrA', seq1), ('chrB', seq2)]:
+        for start, end in [(0, 10), (3, 4), (195, 240), (990, 1010), (0, 37)]:
+            assert twobit.fetch(reference=chrom, start=start, end=end) == \
+                fa.fetch(reference=chrom, start=start, end=end).upper()
+
+    # windowed fetches should match fetching each position
+    positions = [500, 3, 201, 998, 502, 10]
+    for context in [1, 2, 1.5, 3]:
+        expected = []
+        for pos in positions:
+            if context in [1, 2]:
+                nucs = fa.fetch(reference='chrA', start=pos-int(context)+1, end=pos+1).upper()
+            else:
+                nucs = fa.fetch(reference='chrA', start=pos-1, end=pos+2).upper()
+                if context == 1.5:
+                    nucs = mc.get_chasm_context(nucs)
+            expected.append(nucs if 'N' not in nucs else None)
+        assert mc.get_context('chrA', positions, '+', fa, context) == expected
+        assert mc.get_context('chrA', positions, '+', twobit, context) == expected
+
+        # also when the positions are split into several windows
+        orig_gap, genome.max_fetch_gap = genome.max_fetch_gap, 100
+        assert mc.get_context('chrA', positions, '+', twobit, context) == expected
+        genome.max_fetch_gap = orig_gap
+
+    # closed genomes are opened again on the next request
+    genome.close_genomes()
+    assert genome.open_genome(twobit_path) is not twobit
+    genome.close_genomes()
+
+
+if __name__ == '__main__':
+    test_twobit_fetch()
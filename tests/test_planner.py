@@ -0,0 +1,63 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+import prob2020.python.planner as planner
+import prob2020.python.utils as utils
+import pandas as pd
+import numpy as np
+
+
+def test_expected_simulations():
+    assert planner.expected_simulations(100, 1000) == 100
+    num_sim = planner.expected_simulations(100000, 1000)
+    assert 1000 < num_sim < 100000, 'Null genes should stop early ({0})'.format(num_sim)
+
+
+def test_estimate_wall_time():
+    chrom_times = pd.Series([10., 1., 1., 1.], index=['chr1', 'chr2', 'chr3', 'chr4'])
+    assert planner.estimate_wall_time(chrom_times, 0) == 13
+    assert planner.estimate_wall_time(chrom_times, 2) == 11
+    assert planner.estimate_wall_time(chrom_times, 4) == 10
+
+
+def test_plan_100genes():
+    bed_dict = utils.read_bed(os.path.join(file_dir, 'data/100genes.bed'), [])
+    mut_df = pd.read_csv(os.path.join(file_dir, 'data/100genes_mutations.txt'), sep='\t')
+    mut_df = mut_df.rename(columns={'Hugo_Symbol': 'Gene'})
+    workload_df = planner.gene_workload(bed_dict, mut_df)
+    assert len(workload_df) == 100
+    assert workload_df['num mutations'].sum() == len(mut_df)
+
+    opts = {'kind': 'oncogene',
+            'num_iterations': 10000,
+            'stop_criteria': 100,
+            'processes': 4,
+            'memory_budget': 0}
+    workload_df, summary = planner.plan(workload_df, opts, .01, 1e-6)
+    assert summary['expected wall time (s)'] <= summary['max wall time (s)']
+    assert 1 <= summary['recommended processes'] <= len(bed_dict)
+    assert np.all(workload_df['expected simulations'] <= workload_df['max simulations'])
+
+
+def test_calibrate_exact_genes():
+    workload_df = pd.DataFrame({'gene': ['A', 'B', 'C', 'D', 'E'],
+                                'chromosome': 'chr1',
+                                'CDS length': 1000,
+                                'num mutations': [0, 2, 3, 10, 20]})
+
+    # exact genes take the same time regardless of simulations
+    timed = []
+    def time_gene(gene, num_iterations):
+        timed.append(gene)
+        num_mut = workload_df.set_index('gene')['num mutations'][gene]
+        if num_mut <= 5:
+            return .1
+        return .1 + 1e-3 * num_mut * (num_iterations-1)
+    setup_time, sim_time = planner.calibrate(workload_df, time_gene, num_sample=5,
+                                             num_iterations=101, exact_max=5)
+    assert set(timed) == set(['D', 'E']), 'Only simulated genes should be timed'
+    assert np.isclose(setup_time, .1)
+    assert np.isclose(sim_time, 1e-3)
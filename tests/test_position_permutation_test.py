@@ -9,6 +9,7 @@ import prob2020.console.randomization_test as pt
 import prob2020.python.utils as utils
 import prob2020.python.mutation_context as mc
 import numpy as np
+import pandas as pd
 
 
 def test_ctnnb1_main():
@@ -44,6 +45,81 @@ def test_ctnnb1_main():
     assert result.ix[0, 'entropy p-value'] < 0.001, 'CTNNB1 should have a very low p-value ({0}>.001)'.format(result[0][2])
 
 
+def test_ctnnb1_exact():
+    opts = {'input': os.path.join(file_dir, 'data/CTNNB1.fa'),
+            'bed': os.path.join(file_dir, 'data/CTNNB1.bed'),
+            'mutations': os.path.join(file_dir, 'data/CTNNB1_mutations.txt'),
+            'output': os.path.join(file_dir, 'output/CTNNB1_exact_output.txt'),
+            'context': 1.5,
+            'use_unmapped': False,
+            'tsg_score': .1,
+            'recurrent': 3,
+            'fraction': .02,
+            'score_dir': os.path.join(file_dir, 'data/scores'),
+            'processes': 0,
+            'num_iterations': 20000,
+            'stop_criteria': 20000,
+            'recurrent_pseudo_count': 0,
+            'unique': 0,
+            'seed': 101,
+            'exact_max_mutations': 5,
+            'kind': 'oncogene'}
+
+    # a few mutations with a recurrent position
+    mut_df = pd.read_csv(opts['mutations'], sep='\t')
+    mut_df = mut_df[mut_df['Variant_Classification']=='Missense_Mutation']
+    mut_df = pd.concat([mut_df.iloc[:1]]*3 + [mut_df.iloc[1:2]])
+    mut_df['Tumor_Sample'] = ['sample{0}'.format(i) for i in range(len(mut_df))]
+
+    # exact p-values should agree with the simulated p-values
+    exact_result = pt.main(opts, mut_df.copy())
+    opts['exact_max_mutations'] = 0
+    sim_result = pt.main(opts, mut_df.copy())
+    for col in ['entropy p-value', 'vest p-value']:
+        exact_pval = exact_result[col].iloc[0]
+        sim_pval = sim_result[col].iloc[0]
+        assert abs(exact_pval - sim_pval) < .01, 'Exact {0} ({1}) differs from simulation ({2})'.format(col, exact_pval, sim_pval)
+
+
+def test_ctnnb1_screen_exact():
+    opts = {'input': os.path.join(file_dir, 'data/CTNNB1.fa'),
+            'bed': os.path.join(file_dir, 'data/CTNNB1.bed'),
+            'mutations': os.path.join(file_dir, 'data/CTNNB1_mutations.txt'),
+            'output': '',
+            'context': 1.5,
+            'use_unmapped': False,
+            'tsg_score': .1,
+            'recurrent': 3,
+            'fraction': .02,
+            'score_dir': os.path.join(file_dir, 'data/scores'),
+            'processes': 0,
+            'num_iterations': 1000,
+            'stop_criteria': 1000,
+            'recurrent_pseudo_count': 0,
+            'unique': 0,
+            'seed': 101,
+            'exact_max_mutations': 5,
+            'kind': 'oncogene'}
+
+    # three mutations on the transcript and four intronic mutations, so the
+    # total is above exact_max but the tested SNVs are not
+    mut_df = pd.read_csv(opts['mutations'], sep='\t')
+    mut_df = mut_df[mut_df['Variant_Classification']=='Missense_Mutation']
+    intronic = pd.concat([mut_df.iloc[:1]]*4)
+    intronic['Start_Position'] = intronic['End_Position'] = 41250000 + np.arange(4)
+    mut_df = pd.concat([mut_df.iloc[:1]]*2 + [mut_df.iloc[1:2], intronic])
+    mut_df['Tumor_Sample'] = ['sample{0}'.format(i) for i in range(len(mut_df))]
+
+    # the screen should keep the exact p-values
+    exact_result = pt.main(opts.copy(), mut_df.copy())
+    opts.update({'screen': True, 'screen_iterations': 100, 'screen_threshold': 1e-6})
+    screen_result = pt.main(opts.copy(), mut_df.copy())
+    assert exact_result['Unmapped to Ref Tx'].iloc[0] == 4
+    assert not screen_result['screened out'].iloc[0]
+    for col in ['entropy p-value', 'vest p-value']:
+        assert exact_result[col].iloc[0] == screen_result[col].iloc[0]
+
+
 def test_ctnnb1_get_aa_mut_info():
     import pysam
     from prob2020.python.gene_sequence import GeneSequence
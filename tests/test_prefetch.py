@@ -0,0 +1,59 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '../'))
+
+import prob2020.python.prefetch as prefetch
+import prob2020.console.randomization_test as pt
+from collections import namedtuple
+
+Gene = namedtuple('Gene', ['gene_name'])
+
+
+def test_prefetch_order():
+    genes = [Gene('gene{0}'.format(i)) for i in range(20)]
+    prepared = list(prefetch.iter_prepared(genes, lambda g: g.gene_name.upper(), 3))
+    assert prepared == [(g, g.gene_name.upper()) for g in genes]
+
+    # errors are raised when the failed gene is reached
+    def prepare(gene):
+        if gene.gene_name == 'gene5':
+            raise ValueError(gene.gene_name)
+        return gene.gene_name
+    seen = []
+    try:
+        for gene, name in prefetch.iter_prepared(genes, prepare, 3):
+            seen.append(name)
+    except ValueError:
+        pass
+    else:
+        assert False, 'Error while preparing a gene should be raised'
+    assert seen == ['gene{0}'.format(i) for i in range(5)]
+
+
+def test_100genes_prefetch():
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': os.path.join(file_dir, 'data/100genes_mutations.txt'),
+            'output': os.path.join(file_dir, 'output/100genes_prefetch_output.txt'),
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 300,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'kind': 'tsg',
+            'prefetch': 0}
+    result = pt.main(opts.copy())
+    opts['prefetch'] = 2
+    prefetched = pt.main(opts.copy())
+    assert result.astype(str).equals(prefetched.astype(str)), 'Prefetching should not change results'
+
+
+if __name__ == '__main__':
+    test_prefetch_order()
+    test_100genes_prefetch()
@@ -0,0 +1,87 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '../'))
+
+import prob2020.console.randomization_test as pt
+import prob2020.python.result_cache as result_cache
+import tempfile
+import shutil
+import time
+
+
+def test_cache_eviction():
+    cache_dir = tempfile.mkdtemp()
+    try:
+        # each result takes about 10 KB of a 25 KB cache
+        cache = result_cache.ResultCache(cache_dir, max_size=25./1024)
+        cache.put('a', ['x'*10000])
+        cache.put('b', ['y'*10000])
+        time.sleep(.01)
+        assert cache.get('a') == ['x'*10000]  # a is now used more recently than b
+        cache.put('c', ['z'*10000])
+        assert cache.get('b') is None, 'Least recently used result should be removed'
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_100genes_cache():
+    cache_dir = tempfile.mkdtemp()
+    opts = {'input': os.path.join(file_dir, 'data/100genes.fa'),
+            'bed': os.path.join(file_dir, 'data/100genes.bed'),
+            'mutations': os.path.join(file_dir, 'data/100genes_mutations.txt'),
+            'output': '',
+            'context': 1,
+            'use_unmapped': False,
+            'deleterious': 5,
+            'processes': 0,
+            'num_iterations': 300,
+            'stop_criteria': 100,
+            'deleterious_pseudo_count': 0,
+            'unique': False,
+            'seed': 101,
+            'kind': 'tsg',
+            'cache_dir': cache_dir}
+    try:
+        result = pt.main(opts.copy())
+        num_cached = len(os.listdir(cache_dir))
+        assert num_cached > 0, 'Gene results should be saved in the cache'
+
+        # second run loads every gene from the cache
+        cached_result = pt.main(opts.copy())
+        assert len(os.listdir(cache_dir)) == num_cached
+        assert result.astype(str).equals(cached_result.astype(str))
+
+        # the number of processes and memory budget do not change results
+        opts['processes'] = 2
+        opts['memory_budget'] = 1
+        pt.main(opts.copy())
+        assert len(os.listdir(cache_dir)) == num_cached
+
+        # changing an option should not use the cached results
+        opts['num_iterations'] = 200
+        pt.main(opts.copy())
+        assert len(os.listdir(cache_dir)) == 2*num_cached
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def test_score_file_stats():
+    score_dir = tempfile.mkdtemp()
+    try:
+        vest_path = os.path.join(score_dir, 'TP53.vest.pickle')
+        with open(vest_path, 'wb') as handle:
+            handle.write(b'scores')
+        opts = {'score_dir': score_dir}
+        stats = result_cache.score_file_stats('TP53', opts)
+        assert list(stats) == [vest_path]
+        assert result_cache.score_file_stats('KRAS', opts) == {}
+
+        # editing the scores in place changes the key
+        os.utime(vest_path, ns=(0, 0))
+        assert result_cache.score_file_stats('TP53', opts) != stats
+    finally:
+        shutil.rmtree(score_dir)
@@ -0,0 +1,107 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+import prob2020.python.scores as scores
+import numpy as np
+import pickle
+
+
+def test_score_store():
+    score_dir = os.path.join(file_dir, 'data/scores')
+    store_path = os.path.join(file_dir, 'output/scores.store')
+    num_genes = scores.write_score_store(score_dir, store_path)
+    assert num_genes > 0
+
+    for gene in ['CTNNB1', 'A1BG', 'A2M']:
+        # VEST scores should match the pickle files
+        vest_dict = scores.read_vest_pickle(gene, score_dir)
+        codon_pos, ref_aa, somatic_aa, pickle_scores = [], [], [], []
+        for codon in sorted(vest_dict):
+            for ref in vest_dict[codon]:
+                for alt in vest_dict[codon][ref]:
+                    codon_pos.append(codon-1)
+                    ref_aa.append(ref)
+                    somatic_aa.append(alt)
+                    pickle_scores.append(vest_dict[codon][ref][alt])
+        gene_vest = scores.read_vest(gene, store_path)
+        store_scores = scores.fetch_vest_scores(gene_vest, ref_aa, somatic_aa, codon_pos)
+        assert np.allclose(store_scores, pickle_scores, atol=1e-6)
+
+        # MGA entropy should match the pickle files
+        mga_pickle = scores.read_mga(gene, score_dir)
+        mga_store = scores.read_mga(gene, store_path)
+        assert np.allclose(mga_store, mga_pickle, atol=1e-5)
+
+    # genes without scores
+    assert scores.read_vest('NOT_A_GENE', store_path) is None
+    assert scores.read_mga('NOT_A_GENE', store_path) is None
+
+
+def test_summary_scores():
+    score_dir = os.path.join(file_dir, 'data/scores')
+    gene_scores = scores.load_gene_scores('CTNNB1', score_dir)
+    assert scores.load_gene_scores('CTNNB1', score_dir) is gene_scores
+
+    # two simulations with two mutations each
+    ref_aa = ['S', 'S', 'T', 'D']
+    somatic_aa = ['F', '*', 'I', 'D']
+    codon_pos = [32, 44, 40, 31]
+    total_mga, total_vest = scores.summary_scores(gene_scores, ref_aa, somatic_aa,
+                                                  codon_pos, num_rows=2)
+    for i in range(2):
+        tmp_ref, tmp_somatic = ref_aa[2*i:2*i+2], somatic_aa[2*i:2*i+2]
+        tmp_pos = codon_pos[2*i:2*i+2]
+        vest = scores.compute_vest_stat(gene_scores[1], tmp_ref, tmp_somatic, tmp_pos,
+                                        stat_func=sum)
+        assert np.isclose(total_vest[i], vest)
+    missense_mga = scores.compute_mga_entropy_stat(gene_scores[0], [32], stat_func=sum)
+    assert np.isclose(total_mga[0], missense_mga)
+
+
+def test_vest_stat_batch():
+    score_dir = os.path.join(file_dir, 'data/scores')
+    gene_vest = scores.read_vest('CTNNB1', score_dir)
+    ref_aa = ['S', 'S', 'T', 'D', 'S', 'G']
+    somatic_aa = ['F', 'P', 'I', 'D', 'Y', 'R']
+    codon_pos = [32, 44, 40, 31, 36, 33]
+    vest_stats = scores.compute_vest_stat_batch(gene_vest, ref_aa, somatic_aa,
+                                                codon_pos, num_rows=3)
+    for i in range(3):
+        vest = scores.compute_vest_stat(gene_vest, ref_aa[2*i:2*i+2],
+                                        somatic_aa[2*i:2*i+2], codon_pos[2*i:2*i+2])
+        assert np.isclose(vest_stats[i], vest)
+    assert np.all(scores.compute_vest_stat_batch(None, ref_aa, somatic_aa, codon_pos, 3) == 0)
+
+
+def test_neighbor_graph_store():
+    # write a small neighbor graph in the pickle format
+    graph_dir = os.path.join(file_dir, 'output/neighbor_graphs')
+    if not os.path.exists(graph_dir):
+        os.makedirs(graph_dir)
+    gene_graph = {0: set([1]), 1: set([0, 2]), 2: set([1]), 4: set([2, 5]), 5: set()}
+    with open(os.path.join(graph_dir, 'FAKE.pickle'), 'wb') as handle:
+        pickle.dump(gene_graph, handle)
+    store_path = os.path.join(file_dir, 'output/neighbor_graphs.store')
+    assert scores.write_neighbor_graph_store(graph_dir, store_path) == 1
+
+    # graph score with codon values smoothed over neighbors
+    pos_ct = {1: 2, 4: 1}
+    codon_vals = np.array([1., 1., 1.5, 0., .5, .5])
+    p = codon_vals / codon_vals.sum()
+    expected_score = -np.sum(p[p>0] * np.log2(p[p>0]))
+    for graph_path in [graph_dir, store_path]:
+        ng = scores.read_neighbor_graph('FAKE', graph_path)
+        graph_score, coverage = scores.compute_ng_stat(ng, pos_ct)
+        assert np.isclose(graph_score, expected_score)
+        assert coverage == 5
+    assert scores.read_neighbor_graph('NOT_A_GENE', store_path) is None
+
+
+if __name__ == '__main__':
+    test_score_store()
+    test_summary_scores()
+    test_vest_stat_batch()
+    test_neighbor_graph_store()
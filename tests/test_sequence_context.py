@@ -10,6 +10,7 @@ from prob2020.python.gene_sequence import GeneSequence
 from prob2020.python.sequence_context import SequenceContext
 import prob2020.python.utils as utils
 import pysam
+import numpy as np
 
 # set up global variables
 fake_fasta = os.path.join(file_dir, 'data/fake_sequence.fa')
@@ -77,6 +78,30 @@ def test_no_context_constructor():
     _check_true_context_pos(sc, true_ctxt2pos)
 
 
+def test_fill_random_pos():
+    gs = GeneSequence(gene_fa, nuc_context=1)
+    gs.set_gene(bed)
+    context_counts = [('A', 3), ('C', 2)]
+
+    # sampling with the original approach
+    sc = SequenceContext(gs, seed=101)
+    prng = np.random.RandomState(101)
+    true_pos = np.hstack([prng.choice(sc.context2pos['A'], (10, 3)),
+                          np.random.RandomState(101).choice(sc.context2pos['C'], (10, 2))])
+
+    # positions filled into a reusable buffer
+    pos_buffer = np.zeros((10, 5), dtype=np.int32)
+    sc.fill_random_pos(context_counts, pos_buffer)
+    assert np.all(pos_buffer == true_pos), 'Random positions should not change'
+    assert sc.context_pos_array['A'].dtype == np.uint16, 'Positions should be compact'
+
+
+def test_max_batch_size():
+    assert utils.max_batch_size(100) == utils.default_max_batch
+    assert utils.max_batch_size(100000, memory_budget=1024, num_processes=32) < utils.default_max_batch
+    assert utils.max_batch_size(10**9, memory_budget=1) == 1
+
+
 def _check_true_counts(seq_context, true_counts):
     for letter in true_counts:
         true_ct = true_counts[letter]
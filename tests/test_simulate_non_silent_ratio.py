@@ -0,0 +1,55 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '../'))
+
+import prob2020.console.simulate_non_silent_ratio as sns
+import numpy as np
+
+
+def test_multinomial_engine():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 0,
+            'num_permutations': 2000,
+            'context': 1.5,
+            'engine': 'multinomial',
+            'score_dir': None,
+            'by_sample': False,
+            'use_unmapped': False,
+            'genome': '',
+            'seed': 101,
+            'observed_output': None,
+            'output': os.path.join(file_dir, 'output/sim_non_silent_multinomial.txt')
+            }
+    multinomial_df = sns.main(opts)
+
+    opts['engine'] = 'permutation'
+    opts['output'] = os.path.join(file_dir, 'output/sim_non_silent_permutation.txt')
+    permutation_df = sns.main(opts)
+
+    # the total number of SNVs should not change across iterations
+    multinomial_total = multinomial_df['non-silent count'] + multinomial_df['silent count']
+    permutation_total = permutation_df['non-silent count'] + permutation_df['silent count']
+    assert multinomial_total.nunique() == 1, 'Number of mutations should be constant'
+    assert multinomial_total.iloc[0] == permutation_total.iloc[0], 'Engines should simulate the same mutations'
+
+    # non-silent counts should be the sum of its mutation types
+    non_silent_cols = ['nonsense count', 'lost stop count', 'splice site count',
+                       'lost start count', 'missense count']
+    non_silent_total = multinomial_df[non_silent_cols].sum(axis=1)
+    assert (non_silent_total == multinomial_df['non-silent count']).all()
+
+    # both engines sample the same distribution, so the mean counts of each
+    # mutation type should agree within a few standard errors
+    for col in ['non-silent count', 'nonsense count', 'missense count', 'silent count']:
+        diff = multinomial_df[col].mean() - permutation_df[col].mean()
+        std_err = np.sqrt(multinomial_df[col].var() / len(multinomial_df) +
+                          permutation_df[col].var() / len(permutation_df))
+        assert abs(diff) <= 4 * std_err, '{0} differs between engines'.format(col)
+
+
+if __name__ == '__main__':
+    test_multinomial_engine()
@@ -5,6 +5,16 @@ file_dir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(file_dir, '../'))
 
 import prob2020.console.annotate as sm
+import prob2020.python.indel as indel
+import prob2020.python.mymath as mymath
+import prob2020.python.maf_store as maf_store
+import prob2020.python.utils as utils
+import prob2020.python.mutation_context as mc
+import prob2020.python.permutation as pm
+from prob2020.python.gene_sequence import GeneSequence
+import numpy as np
+import pandas as pd
+import pysam
 
 def test_sim_summary():
     opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
@@ -32,5 +42,241 @@ def test_sim_summary():
     sm.main(opts)
 
 
+def test_sim_maf_streaming():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 0,
+            'num_iterations': 5,
+            'context': 1.5,
+            'summary': False,
+            'maf': True,
+            'unique': True,
+            'use_unmapped': False,
+            'genome': '',
+            'score_dir': None,
+            'fraction': .02,
+            'recurrent': 3,
+            'seed': 101,
+            'output': os.path.join(file_dir, 'output/sim_summary_maf_serial.txt')
+            }
+    sm.main(opts)
+    opts['processes'] = 2
+    opts['output'] = os.path.join(file_dir, 'output/sim_summary_maf_parallel.txt')
+    sm.main(opts)
+
+    # simulated substitutions should not depend on the number of processes
+    # (indel positions are not seeded)
+    snv_lines = []
+    for path in ['output/sim_summary_maf_serial.txt', 'output/sim_summary_maf_parallel.txt']:
+        with open(os.path.join(file_dir, path)) as handle:
+            snv_lines.append([l for l in handle
+                              if 'Frame_Shift' not in l and 'In_Frame' not in l])
+    assert len(snv_lines[0]) > 1
+    assert snv_lines[0] == snv_lines[1]
+
+
+def test_maf_permutation_blocks():
+    opts = {'context': 1.5, 'use_unmapped': False, 'genome': '', 'seed': 101}
+
+    # pick the gene with the most mutations
+    mut_df = utils.read_mutations(os.path.join(file_dir, 'data/sim_summary_mutations.txt'))
+    mut_df = utils._fix_mutation_df(mut_df)
+    gene_fa = pysam.Fastafile(os.path.join(file_dir, 'data/sim_summary.fa'))
+    gs = GeneSequence(gene_fa, nuc_context=opts['context'])
+    bed = [b for b in utils.bed_generator(os.path.join(file_dir, 'data/sim_summary.bed'))
+           if b.gene_name == mut_df['Gene'].value_counts().index[0]][0]
+    context_cts, context_to_mut, _, gs, sc = mc.compute_mutation_context(bed, gs, mut_df, opts)
+    maf_list = pm.maf_permutation(context_cts, context_to_mut, sc, gs, 7)
+
+    # positions drawn one small block at a time should match
+    context_cts, context_to_mut, _, gs, sc = mc.compute_mutation_context(bed, gs, mut_df, opts)
+    block_lines = []
+    for columns, iterations in pm.maf_permutation_column_blocks(context_cts, context_to_mut,
+                                                                sc, gs, 7, block_lines=1):
+        block_lines.extend(list(maf_line) for maf_line in zip(*columns))
+    gene_fa.close()
+    assert len(maf_list) > 7
+    assert block_lines == maf_list
+
+
+def test_sim_maf_columnar():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 0,
+            'num_iterations': 5,
+            'context': 1.5,
+            'summary': False,
+            'maf': True,
+            'unique': True,
+            'use_unmapped': False,
+            'genome': '',
+            'score_dir': None,
+            'fraction': .02,
+            'recurrent': 3,
+            'seed': 101,
+            'output': os.path.join(file_dir, 'output/sim_summary_maf_text.txt')
+            }
+    sm.main(opts)
+    opts['columnar'] = True
+    opts['output'] = os.path.join(file_dir, 'output/sim_summary_maf_store')
+    sm.main(opts)
+
+    # substitutions in the store should match the text output, one
+    # simulation at a time
+    text_df = pd.read_csv(os.path.join(file_dir, 'output/sim_summary_maf_text.txt'), sep='\t')
+    is_snv = ~text_df['Variant_Classification'].str.contains('Frame')
+    text_df = text_df[is_snv].reset_index(drop=True)
+    num_snvs = len(text_df) // 5
+    store = maf_store.MafStore(opts['output'])
+    assert len(store) == 5
+    for i in range(5):
+        store_df = store.read_iteration(i)
+        assert store_df['Variant_Classification'].str.contains('Frame').sum() == len(store_df) - num_snvs
+        store_df = store_df[~store_df['Variant_Classification'].str.contains('Frame')]
+        gene_dfs = []
+        for gene, gene_df in text_df.groupby('Gene', sort=False):
+            num_gene = len(gene_df) // 5
+            gene_dfs.append(gene_df.iloc[i*num_gene:(i+1)*num_gene])
+        expected = pd.concat(gene_dfs).reset_index(drop=True)
+        for col in maf_store.MAF_COLUMNS:
+            assert list(store_df[col].astype(str)) == list(expected[col].astype(str))
+
+
+def test_sim_maf_columnar_parallel():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 0,
+            'num_iterations': 5,
+            'context': 1.5,
+            'summary': False,
+            'maf': True,
+            'columnar': True,
+            'unique': True,
+            'use_unmapped': False,
+            'genome': '',
+            'score_dir': None,
+            'fraction': .02,
+            'recurrent': 3,
+            'seed': 101,
+            'output': os.path.join(file_dir, 'output/sim_summary_maf_store_serial')
+            }
+    sm.main(opts)
+    opts['processes'] = 2
+    opts['output'] = os.path.join(file_dir, 'output/sim_summary_maf_store_parallel')
+    sm.main(opts)
+
+    # merging the stores written by workers should give the same
+    # substitutions as a single process (indel positions are not seeded)
+    serial = maf_store.MafStore(os.path.join(file_dir, 'output/sim_summary_maf_store_serial'))
+    parallel = maf_store.MafStore(opts['output'])
+    assert len(serial) == len(parallel) == 5
+    for i in range(5):
+        serial_df, parallel_df = serial.read_iteration(i), parallel.read_iteration(i)
+        serial_df = serial_df[~serial_df['Variant_Classification'].str.contains('Frame')]
+        parallel_df = parallel_df[~parallel_df['Variant_Classification'].str.contains('Frame')]
+        assert len(serial_df) > 0
+        for col in maf_store.MAF_COLUMNS:
+            assert list(serial_df[col].astype(str)) == list(parallel_df[col].astype(str))
+    assert not os.path.exists(opts['output'] + '.shards')
+
+
+def test_sim_summary_shards():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 0,
+            'num_iterations': 3,
+            'context': 1.5,
+            'summary': True,
+            'maf': False,
+            'unique': True,
+            'use_unmapped': False,
+            'genome': '',
+            'score_dir': None,
+            'fraction': .02,
+            'recurrent': 3,
+            'seed': 101,
+            'output': os.path.join(file_dir, 'output/sim_summary_serial.txt')
+            }
+    sm.main(opts)
+    opts['processes'] = 2
+    opts['keep_shards'] = True
+    opts['output'] = os.path.join(file_dir, 'output/sim_summary_manifest.txt')
+    sm.main(opts)
+
+    # shards listed in the manifest should add up to the serial output
+    serial_df = pd.read_csv(os.path.join(file_dir, 'output/sim_summary_serial.txt'), sep='\t')
+    manifest = pd.read_csv(opts['output'], sep='\t')
+    shard_dfs = [pd.read_csv(path, sep='\t') for path in manifest['Shard']]
+    assert [len(df) for df in shard_dfs] == manifest['Rows'].tolist()
+    shard_df = pd.concat(shard_dfs).reset_index(drop=True)
+    assert serial_df.astype(str).equals(shard_df.astype(str))
+
+
+def failing_permutation(info):
+    """Fails on all but the largest chromosome."""
+    bed_list = info[0]
+    if bed_list[0].chrom != 'chr1':
+        raise ValueError('Simulated worker failure')
+    return orig_permutation(info)
+orig_permutation = sm.singleprocess_permutation
+
+
+def test_sim_summary_shard_cleanup():
+    opts = {'input': os.path.join(file_dir, 'data/sim_summary.fa'),
+            'mutations': os.path.join(file_dir, 'data/sim_summary_mutations.txt'),
+            'bed': os.path.join(file_dir, 'data/sim_summary.bed'),
+            'processes': 2,
+            'num_iterations': 3,
+            'context': 1.5,
+            'summary': True,
+            'maf': False,
+            'unique': True,
+            'use_unmapped': False,
+            'genome': '',
+            'score_dir': None,
+            'fraction': .02,
+            'recurrent': 3,
+            'seed': 101,
+            'output': os.path.join(file_dir, 'output/sim_summary_failed.txt')
+            }
+
+    # shards written before a worker fails should be removed
+    sm.singleprocess_permutation = failing_permutation
+    try:
+        sm.main(opts)
+    except ValueError:
+        pass
+    else:
+        assert False, 'The worker failure should be raised'
+    finally:
+        sm.singleprocess_permutation = orig_permutation
+    assert not os.path.exists(opts['output'] + '.shards')
+
+
+def test_multivariate_hypergeometric():
+    prng = np.random.RandomState(101)
+    colors = prng.multinomial(20, [.5, .3, .2], size=20000)
+    counts = indel.multivariate_hypergeometric(colors, 5, prng)
+    assert np.all(counts.sum(axis=1) == 5)
+    assert np.all((counts >= 0) & (counts <= colors))
+
+    # expected draws from each color is proportional to its number of items
+    expected = (5. / 20) * colors.mean(axis=0)
+    assert np.allclose(counts.mean(axis=0), expected, atol=.03)
+
+
+def test_normalized_mutation_entropies():
+    count_lists = [[3, 1, 1, 0, 2], [1], [0, 0], [5, 5], [2, 1, 0, 1, 1, 4, 1, 1, 3, 1]]
+    counts = np.concatenate(count_lists)
+    rows = np.repeat(np.arange(len(count_lists)), [len(c) for c in count_lists])
+    norm_ent = mymath.normalized_mutation_entropies(counts, rows, len(count_lists))
+    expected = [mymath.normalized_mutation_entropy(c) for c in count_lists]
+    assert np.allclose(norm_ent, expected)
+
+
 if __name__ == '__main__':
     test_sim_summary()
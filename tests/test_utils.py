@@ -0,0 +1,82 @@
+# fix problems with pythons terrible import system
+import os
+import sys
+file_dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(file_dir, '..'))
+
+import prob2020.python.utils as utils
+import numpy as np
+import pandas as pd
+import gzip
+import argparse
+
+
+def test_read_mutations():
+    mut_path = os.path.join(file_dir, 'data/100genes_mutations.txt')
+    mut_df = utils.read_mutations(mut_path)
+    assert 'Gene' in mut_df.columns and 'Tumor_Allele' in mut_df.columns
+    assert 'DNA_Change' not in mut_df.columns, 'Unused columns should not be read'
+    assert mut_df['Start_Position'].dtype == np.int32
+    assert mut_df['Tumor_Sample'].dtype.name == 'category'
+
+    # genes of a subset are only counted if they have mutations
+    gene_cts = mut_df['Gene'].value_counts()
+    sub_df = mut_df[mut_df['Gene'].isin(gene_cts.index[:3])]
+    assert sub_df['Gene'].value_counts().to_dict() == gene_cts[:3].to_dict()
+    assert sub_df.groupby('Gene').size().to_dict() == gene_cts[:3].to_dict()
+
+    # gzipped MAF with a version header
+    gz_path = os.path.join(file_dir, 'output/100genes_mutations.maf.gz')
+    with open(mut_path) as handle, gzip.open(gz_path, 'wt') as out_handle:
+        out_handle.write('#version 2.4\n')
+        out_handle.write(handle.read())
+    gz_df = utils.read_mutations(gz_path)
+    assert gz_df.equals(mut_df)
+
+    # mutations with missing information are left for the caller to drop
+    na_path = os.path.join(file_dir, 'output/missing_allele_mutations.txt')
+    mut_df.iloc[:5].assign(Tumor_Allele=None).to_csv(na_path, sep='\t', index=False)
+    na_df = utils.read_mutations(na_path)
+    assert len(na_df) == 5 and na_df['Tumor_Allele'].isnull().all()
+
+
+def test_rev_comp():
+    assert utils.rev_comp('ACGTn-') == '-nACGT'
+    seqs = pd.Series(['A', 'C', 'gat', 'N'])
+    rc = utils.rev_comp_series(seqs)
+    assert rc.tolist() == [utils.rev_comp(s) for s in seqs]
+
+    # only alleles of minus strand genes are reverse complemented
+    bed_dict = utils.read_bed(os.path.join(file_dir, 'data/100genes.bed'))
+    mut_df = pd.DataFrame({'Gene': ['A1BG', 'A2ML1', 'A1CF', 'NOT_A_GENE'],
+                           'Tumor_Allele': ['A', 'A', 'C', 'G']})
+    mut_df = utils.add_strand_tumor_allele(mut_df, bed_dict)
+    assert mut_df['Strand_Tumor_Allele'].tolist() == ['T', 'A', 'G', 'G']
+    assert mut_df['Tumor_Allele'].tolist() == ['A', 'A', 'C', 'G']
+
+
+def test_fix_mutation_df():
+    mut_df = pd.DataFrame({'Variant_Classification': ['Missense_Mutation']*4,
+                           'Reference_Allele': ['A', 'AC', 'G', 'T'],
+                           'Tumor_Allele': ['C', 'T', 'R', 'G'],
+                           'Start_Position': [10, 20, 30, 40]})
+    mut_df = utils._fix_mutation_df(mut_df)
+    assert mut_df['Start_Position'].tolist() == [9, 39]
+
+
+def test_exact_max_mutations_type():
+    assert utils.exact_max_mutations_type('5') == 5
+    for value in ['-1', str(utils.max_exact_mutations+1)]:
+        try:
+            utils.exact_max_mutations_type(value)
+        except argparse.ArgumentTypeError:
+            pass
+        else:
+            assert False, 'Out of range values should be rejected'
+
+
+if __name__ == '__main__':
+    test_read_mutations()
+    test_rev_comp()
+    test_fix_mutation_df()
+    test_exact_max_mutations_type()